@@ -0,0 +1,42 @@
+#!/usr/bin/env python
+# coding: utf-8
+"""Micro-benchmark for the cost of the library's internal logging on MonitoringPlugin hot paths.
+
+Logging is initialised at WARNING level with no sinks that accept DEBUG. "ungated" forces the cached
+level flags on, which is how every call behaved before the flags existed: the debug f-string is built
+and handed to loguru which then drops it. "gated" uses the flags set by initLogging().
+
+    python3 benchmarks/bench_logging_gate.py
+"""
+
+import timeit
+
+from sol1_monitoring_plugins_lib import MonitoringPlugin, initLogging
+from sol1_monitoring_plugins_lib import logging as plugin_logging
+
+NUMBER = 100000
+
+
+def bench(statement, plugin):
+    timer = timeit.Timer(statement, globals={'plugin': plugin})
+    return min(timer.repeat(repeat=5, number=NUMBER)) / NUMBER * 1e9
+
+
+def main():
+    initLogging(enable_log_file=False, log_level='WARNING')
+    statements = {
+        'setState': 'plugin.setState(plugin.STATE_WARNING)',
+        'setPerformanceData': 'plugin.setPerformanceData(label="test", value=5, unit_of_measurement="s")',
+        'getStateLabel': 'plugin.getStateLabel(plugin.STATE_OK)',
+    }
+    print(f"{'call':<20} {'ungated ns':>12} {'gated ns':>12}")
+    for name, statement in statements.items():
+        plugin_logging.debug_enabled = plugin_logging.info_enabled = True
+        ungated = bench(statement, MonitoringPlugin())
+        initLogging(enable_log_file=False, log_level='WARNING')
+        gated = bench(statement, MonitoringPlugin())
+        print(f"{name:<20} {ungated:>12.0f} {gated:>12.0f}")
+
+
+if __name__ == "__main__":
+    main()
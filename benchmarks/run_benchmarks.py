@@ -0,0 +1,167 @@
+#!/usr/bin/env python
+# coding: utf-8
+"""Benchmark suite for the MonitoringPlugin and logging hot paths.
+
+Results are written as JSON so runs from different releases can be compared.
+
+    python3 benchmarks/run_benchmarks.py --output results.json
+    python3 benchmarks/run_benchmarks.py --quick
+"""
+
+import argparse
+import datetime
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import sol1_monitoring_plugins_lib
+from sol1_monitoring_plugins_lib import MonitoringPlugin, initLogging
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+EXAMPLE_CHECK = os.path.join(REPO_DIR, 'examples', 'check_day_of_the_week.py')
+
+
+def _subprocessEnv():
+    # Make sure subprocesses import the same copy of the library as this runner
+    env = dict(os.environ)
+    package_parent = os.path.dirname(os.path.dirname(os.path.abspath(sol1_monitoring_plugins_lib.__file__)))
+    env['PYTHONPATH'] = os.pathsep.join(filter(None, [package_parent, env.get('PYTHONPATH')]))
+    return env
+
+
+def measure(func, repeat):
+    """Runs func repeat times and returns the wall time of each run in seconds"""
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    return times
+
+
+def result(name, times, **params):
+    return {
+        'name': name,
+        'params': params,
+        'unit': 's',
+        'runs': len(times),
+        'min': min(times),
+        'median': statistics.median(times),
+        'mean': statistics.mean(times),
+        'max': max(times),
+    }
+
+
+def benchImport(repeat):
+    env = _subprocessEnv()
+    baseline = measure(lambda: subprocess.run([sys.executable, '-c', 'pass'], env=env, check=True), repeat)
+    # Importing the package only loads its lazy __getattr__, time the import every check does
+    times = measure(lambda: subprocess.run([sys.executable, '-c', 'from sol1_monitoring_plugins_lib import MonitoringPlugin'],
+                                           env=env, check=True), repeat)
+    return [result('import.interpreter', baseline),
+            result('import.cold', times)]
+
+
+def benchInitLogging(repeat, log_file):
+    results = []
+    results.append(result('initLogging.file', measure(
+        lambda: initLogging(log_file=log_file), repeat)))
+    results.append(result('initLogging.file_debug', measure(
+        lambda: initLogging(debug=True, log_file=log_file), repeat)))
+    with open(os.devnull, 'w') as devnull:
+        stderr, sys.stderr = sys.stderr, devnull
+        try:
+            results.append(result('initLogging.screen', measure(
+                lambda: initLogging(enable_screen_debug=True, enable_log_file=False), repeat)))
+        finally:
+            sys.stderr = stderr
+    # Back to the production setup for the other benchmarks
+    initLogging(log_file=log_file)
+    return results
+
+
+def benchPlugin(sizes, repeat):
+    results = []
+    for size in sizes:
+        def messages():
+            plugin = MonitoringPlugin("Benchmark")
+            for i in range(size):
+                plugin.setMessage(f"item {i} is fine\n", plugin.STATE_OK, True)
+            plugin.exit(do_exit=False)
+
+        def performance_data():
+            plugin = MonitoringPlugin("Benchmark")
+            for i in range(size):
+                plugin.setPerformanceData(label=f"item_{i}", value=i, unit_of_measurement="B", warn=80, crit=90)
+            plugin.exit(do_exit=False)
+
+        def state_labels():
+            plugin = MonitoringPlugin("Benchmark")
+            for i in range(size):
+                plugin.getStateLabel(i % 4)
+
+        item_repeat = max(1, min(repeat, 100000 // size))
+        results.append(result('plugin.setMessage', measure(messages, item_repeat), items=size))
+        results.append(result('plugin.setPerformanceData', measure(performance_data, item_repeat), items=size))
+        results.append(result('plugin.getStateLabel', measure(state_labels, item_repeat), items=size))
+    return results
+
+
+def benchExample(repeat, log_file):
+    env = _subprocessEnv()
+    command = [sys.executable, EXAMPLE_CHECK, '--day', datetime.datetime.now().strftime('%A'), '--log-file', log_file]
+
+    def run():
+        # The check exits with its state, anything else means it crashed
+        process = subprocess.run(command, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+        if process.returncode not in (0, 1, 2, 3):
+            raise RuntimeError(f"Example check failed: {process.stderr.decode()}")
+
+    return [result('example.check_day_of_the_week', measure(run, repeat))]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the monitoring plugins library.')
+    parser.add_argument('--output', type=str, help="Write the JSON results to this file instead of standard output")
+    parser.add_argument('--repeat', type=int, default=10, help="Runs per benchmark")
+    parser.add_argument('--quick', action="store_true", help="Skip the 100k item plugin benchmarks")
+    args = parser.parse_args(argv)
+
+    sizes = [10, 1000] if args.quick else [10, 1000, 100000]
+    results = []
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        # Benchmarks measure the default production setup, WARNING level logging to a log file
+        log_file = os.path.join(tmp_dir, 'check.log')
+        initLogging(log_file=log_file)
+        results += benchImport(args.repeat)
+        results += benchInitLogging(args.repeat, log_file)
+        results += benchPlugin(sizes, args.repeat)
+        results += benchExample(args.repeat, log_file)
+        initLogging(enable_log_file=False)
+
+    report = {
+        'meta': {
+            'timestamp': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+            'python': platform.python_version(),
+            'implementation': platform.python_implementation(),
+            'platform': platform.platform(),
+            'library_path': os.path.dirname(os.path.abspath(sol1_monitoring_plugins_lib.__file__)),
+            'logging': 'WARNING level file logging to a temporary log file',
+        },
+        'results': results,
+    }
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
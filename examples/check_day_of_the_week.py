@@ -25,7 +25,7 @@ if __name__ == "__main__":
                 log_rotate=args.log_rotate,
                 log_retention=args.log_retention,
                 log_level=args.log_level,
-                available_log_levels=args.available_log_levels
+                enable_log_queue=args.enable_log_queue
                 )
 
     # initalze the plugin
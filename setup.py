@@ -38,5 +38,16 @@ setup(
     packages=find_packages(where="src"),
     python_requires=">=3.7",
     install_requires=requirements,
+    extras_require={
+        # Reading YAML manifests with sol1-check-batch
+        "yaml": ["PyYAML"],
+        # Faster JSON output with exit(output_format='json')
+        "json": ["orjson"],
+    },
+    entry_points={
+        "console_scripts": [
+            "sol1-check-batch=sol1_monitoring_plugins_lib.batch:main",
+        ],
+    },
     test_suite='tests',
 )
@@ -1,2 +1,26 @@
-from .monitoring_plugins import MonitoringPlugin
-from .logging import initLogging, initLoggingArgparse, DEFAULT_LOG_LEVELS
+# Public names are imported on first use so `import sol1_monitoring_plugins_lib` stays cheap for checks
+# that run every few seconds, loguru is only imported once logging is set up or something is logged.
+_LAZY_ATTRIBUTES = {
+    'MonitoringPlugin': '.monitoring_plugins',
+    'State': '.monitoring_plugins',
+    'initDeadlineArgparse': '.monitoring_plugins',
+    'initOutputArgparse': '.monitoring_plugins',
+    'initLogging': '.logging',
+    'initLoggingArgparse': '.logging',
+    'DEFAULT_LOG_LEVELS': '.logging',
+}
+
+__all__ = list(_LAZY_ATTRIBUTES)
+
+
+def __getattr__(name):
+    if name in _LAZY_ATTRIBUTES:
+        from importlib import import_module
+        value = getattr(import_module(_LAZY_ATTRIBUTES[name], __name__), name)
+        globals()[name] = value
+        return value
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
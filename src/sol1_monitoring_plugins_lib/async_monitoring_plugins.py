@@ -0,0 +1,170 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+import asyncio
+
+from .logging import logger
+from .monitoring_plugins import MonitoringPlugin
+
+STATE_UNKNOWN = 3
+
+
+class AsyncMonitoringPlugin(MonitoringPlugin):
+    """Monitoring Plugin class for checks written with asyncio.
+    Adds a check wide deadline and gather style helpers that record timed out, cancelled and failed
+    probes in the plugin state and message. State, message and performance data are still managed with
+    the normal MonitoringPlugin methods, none of them await so concurrent probes can't interleave
+    half an update, and exit() output is the same as MonitoringPlugin.
+
+    Use it as an async context manager so the deadline covers the whole check:
+
+        async with AsyncMonitoringPlugin("HTTP", deadline=25) as plugin:
+            await plugin.gather(*[probe(plugin, url) for url in urls])
+        plugin.exit()
+    """
+
+    def __init__(self, checktype=None, deadline=None, deadline_state=STATE_UNKNOWN):
+        """
+        Args:
+            checktype (str, optional): Check type added to the top of the message. Defaults to None.
+            deadline (float, optional): Seconds the check has from entering the context manager. Defaults to None.
+            deadline_state (int, optional): State for probes cancelled at the deadline. Defaults to STATE_UNKNOWN.
+        """
+        super().__init__(checktype)
+        # Not _deadline, that is the SIGALRM deadline set with MonitoringPlugin.setDeadline()
+        self._deadline_seconds = deadline
+        self._deadline_state = deadline_state
+        self._deadline_at = None
+        self._deadline_handle = None
+        self._deadline_expired = False
+        self._main_task = None
+        self._tasks = {}
+
+    async def __aenter__(self):
+        loop = asyncio.get_running_loop()
+        self._main_task = asyncio.current_task()
+        if self._deadline_seconds is not None:
+            self._deadline_at = loop.time() + self._deadline_seconds
+            self._deadline_handle = loop.call_at(self._deadline_at, self._expireAsyncDeadline)
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        if self._deadline_handle is not None:
+            self._deadline_handle.cancel()
+        self._deadline_at = None
+        await self.cancelPending()
+        if exc_type is asyncio.CancelledError:
+            if self._deadline_expired:
+                # The deadline cancelled the check body, the plugin already has the result so carry on to exit()
+                if hasattr(self._main_task, 'uncancel'):
+                    self._main_task.uncancel()
+                return True
+            self._recordFailure("Check", "was cancelled", self._deadline_state)
+        return False
+
+    def _expireAsyncDeadline(self):
+        logger.warning(f"Check deadline of {self._deadline_seconds}s reached")
+        self._deadline_expired = True
+        for task, name in list(self._tasks.items()):
+            if not task.done():
+                self._recordFailure(name, f"cancelled at the {self._deadline_seconds}s deadline", self._deadline_state)
+                task.cancel()
+        if self._main_task is not None and not self._main_task.done():
+            self._main_task.cancel()
+
+    def _recordFailure(self, name, reason, state):
+        self.setMessage(f"{name} {reason}\n", state)
+        self.failure_summary = f"{name} {reason}"
+        if state == self.STATE_UNKNOWN:
+            self.setUnknown()
+        else:
+            self.setState(state)
+
+    @property
+    def remaining(self):
+        """Seconds left before the deadline, None if there is no deadline.
+        Use it to size socket and request timeouts for probes.
+        """
+        if self._deadline_at is None:
+            # Outside the async with block only a deadline from setDeadline() applies
+            return super().remaining
+        return max(0.0, self._deadline_at - asyncio.get_running_loop().time())
+
+    def createTask(self, coro, name=None):
+        """Schedules a probe as a task that is cancelled and recorded at the deadline
+
+        Args:
+            coro (coroutine): Probe to run
+            name (str, optional): Name used in messages. Defaults to the coroutine name.
+
+        Returns:
+            asyncio.Task: The scheduled task
+        """
+        if name is None:
+            name = getattr(coro, '__qualname__', None) or repr(coro)
+        task = asyncio.ensure_future(coro)
+        self._tasks[task] = name
+        task.add_done_callback(lambda t: self._tasks.pop(t, None))
+        return task
+
+    async def gather(self, *aws, timeout=None, names=None, timeout_state=None, error_state=STATE_UNKNOWN):
+        """Runs probes concurrently and returns their results in order like asyncio.gather().
+
+        Probes still running after timeout are cancelled and recorded with timeout_state, their result is None.
+        Probes that raise an exception are recorded with error_state and the exception is returned as the result.
+        At the check deadline the probes and the check body are cancelled, see __aexit__().
+
+        Args:
+            *aws (awaitable): Probes to run
+            timeout (float, optional): Seconds to wait before cancelling the remaining probes. Defaults to None.
+            names (list, optional): Names used in messages, one per probe. Defaults to the coroutine names.
+            timeout_state (int, optional): State for timed out probes. Defaults to the deadline_state.
+            error_state (int, optional): State for probes that raise an exception. Defaults to STATE_UNKNOWN.
+
+        Returns:
+            list: Result, exception or None for each probe
+        """
+        if not aws:
+            return []
+        if timeout_state is None:
+            timeout_state = self._deadline_state
+        names = list(names) if names is not None else [None] * len(aws)
+        tasks = [self.createTask(aw, name) if not isinstance(aw, asyncio.Future) else aw
+                 for aw, name in zip(aws, names)]
+        names = [self._tasks.get(task) or name or repr(task) for task, name in zip(tasks, names)]
+
+        # The check deadline is handled by _expireAsyncDeadline(), it cancels the probes and the check body
+        done, pending = await asyncio.wait(tasks, timeout=timeout)
+
+        if pending:
+            logger.warning(f"Cancelling {len(pending)} probes after {timeout}s")
+            for task in pending:
+                self._tasks.pop(task, None)
+                task.cancel()
+            await asyncio.wait(pending)
+
+        results = []
+        for task, name in zip(tasks, names):
+            if task in pending:
+                self._recordFailure(name, f"timed out after {timeout}s", timeout_state)
+                results.append(None)
+            elif task.cancelled():
+                # Already recorded by the deadline
+                results.append(None)
+            elif task.exception() is not None:
+                error = task.exception()
+                logger.warning(f"Probe {name} raised {type(error).__name__}: {error}")
+                self._recordFailure(name, f"raised {type(error).__name__}: {error}", error_state)
+                results.append(error)
+            else:
+                results.append(task.result())
+        return results
+
+    async def cancelPending(self):
+        """Cancels all probes started with createTask() or gather() that are still running
+        """
+        pending = [task for task in self._tasks if not task.done()]
+        for task in pending:
+            task.cancel()
+        if pending:
+            await asyncio.wait(pending)
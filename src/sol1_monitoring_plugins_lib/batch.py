@@ -0,0 +1,318 @@
+#!/usr/bin/env python
+# coding: utf-8
+"""Runs many checks from one manifest on a bounded worker pool and streams their results as Icinga 2
+passive check results, either process-check-result API JSON or external command file lines.
+"""
+
+import argparse
+import importlib
+import json
+import multiprocessing
+import multiprocessing.pool
+import os
+import queue
+import shlex
+import socket
+import sys
+import time
+
+from .logging import logger
+from .monitoring_plugins import _performanceDataPoint
+
+STATE_UNKNOWN = 3
+
+# Seconds past its timeout a check has to finish, after that its worker is assumed to have hung or died
+TIMEOUT_GRACE = 5
+
+# Set in each worker by _initWorker(), started and finished events go to the main process
+_events = None
+_check_functions = {}
+
+
+def loadManifest(path):
+    """Reads a YAML or JSON manifest of checks, YAML needs PyYAML
+
+    The manifest is a list of checks or a dict with a "checks" list and optional "defaults" used for every check:
+
+        defaults:
+          timeout: 30
+        checks:
+          - host: web01
+            service: http
+            check: my_checks:check_http
+            args: ["--url", "https://web01.example.com/"]
+
+    Args:
+        path (str): Path of the manifest, .yaml and .yml files are read as YAML, anything else as JSON
+
+    Raises:
+        ValueError: If the manifest can't be read or a check is missing check or host
+
+    Returns:
+        list: Check entries as dicts
+    """
+    with open(path) as f:
+        text = f.read()
+    if path.endswith(('.yaml', '.yml')):
+        try:
+            import yaml
+        except ImportError:
+            raise ValueError("Reading YAML manifests needs PyYAML, pip install pyyaml or use a JSON manifest") from None
+        manifest = yaml.safe_load(text)
+    else:
+        manifest = json.loads(text)
+
+    defaults = {}
+    if isinstance(manifest, dict):
+        defaults = manifest.get('defaults') or {}
+        manifest = manifest.get('checks')
+    if not isinstance(manifest, list):
+        raise ValueError(f"Manifest {path} must be a list of checks or have a checks list")
+
+    entries = []
+    for number, check in enumerate(manifest, 1):
+        entry = dict(defaults)
+        entry.update(check)
+        if not entry.get('check') or not entry.get('host'):
+            raise ValueError(f"Check {number} in manifest {path} needs check and host")
+        if isinstance(entry.get('args'), str):
+            entry['args'] = shlex.split(entry['args'])
+        entries.append(entry)
+    return entries
+
+
+def _loadCheck(target):
+    # Check functions are imported once per worker
+    if target not in _check_functions:
+        module_name, _, function_name = target.partition(':')
+        if not function_name:
+            raise ValueError(f"Check {target} must be module:function")
+        _check_functions[target] = getattr(importlib.import_module(module_name), function_name)
+    return _check_functions[target]
+
+
+def _initWorker(events):
+    global _events
+    _events = events
+
+
+def _runBatchCheck(index, entry, default_timeout):
+    """Runs one manifest entry in a worker and reports it to the main process with _events"""
+    from .daemon import runCheck
+    timeout = entry.get('timeout') or default_timeout
+    start = time.time()
+    _events.put(('start', index, time.monotonic()))
+    try:
+        func = _loadCheck(entry['check'])
+
+        def check(plugin, argv):
+            # The deadline can only interrupt the check in a process worker, thread workers get remaining
+            plugin.setDeadline(timeout)
+            return func(plugin, argv)
+        check.__name__ = getattr(func, '__name__', entry['check'])
+
+        state, message, performance_data = runCheck(check, entry.get('args'), checktype=entry.get('checktype'))
+    except Exception as e:
+        # A check that can't be loaded mustn't stop the others
+        logger.exception(f"Unable to run check {entry['check']}")
+        state, message, performance_data = STATE_UNKNOWN, f"UNKNOWN: Unable to run check {entry['check']}: {e}", ""
+    _events.put(('result', index, {'state': state, 'message': message, 'performance_data': performance_data,
+                                   'execution_start': start, 'execution_end': time.time()}))
+
+
+def splitPerformanceData(performance_data):
+    """Splits rendered performance data into one string per point, keeping quoted labels with spaces together
+
+    Args:
+        performance_data (str): Performance data from MonitoringPlugin.exit(do_exit=False)
+
+    Returns:
+        list: Performance data points
+    """
+    return _performanceDataPoint().findall(performance_data)
+
+
+def formatApiResult(entry, result, check_source=None):
+    """Returns the body for a POST to the Icinga 2 /v1/actions/process-check-result API as one line of JSON
+
+    Args:
+        entry (dict): Manifest entry with host and optional service
+        result (dict): state, message, performance_data, execution_start and execution_end
+        check_source (str, optional): Reported check source. Defaults to the host name of this machine.
+
+    Returns:
+        str: JSON without a trailing new line
+    """
+    body = {'exit_status': result['state'],
+            'plugin_output': result['message'].rstrip("\n"),
+            'performance_data': splitPerformanceData(result['performance_data']),
+            'check_source': check_source or socket.gethostname(),
+            'execution_start': result['execution_start'],
+            'execution_end': result['execution_end']}
+    if entry.get('service'):
+        body.update({'type': 'Service', 'service': f"{entry['host']}!{entry['service']}"})
+    else:
+        body.update({'type': 'Host', 'host': entry['host']})
+    return json.dumps(body)
+
+
+def formatCommandResult(entry, result):
+    """Returns a PROCESS_SERVICE_CHECK_RESULT or PROCESS_HOST_CHECK_RESULT external command line
+
+    Args:
+        entry (dict): Manifest entry with host and optional service
+        result (dict): state, message, performance_data and execution_end
+
+    Returns:
+        str: Command without a trailing new line
+    """
+    output = result['message'].rstrip("\n")
+    if result['performance_data']:
+        output = f"{output}|{result['performance_data'].rstrip()}"
+    # The command is one line, new lines in the output are escaped
+    output = output.replace("\n", "\\n")
+    timestamp = int(result['execution_end'])
+    if entry.get('service'):
+        return f"[{timestamp}] PROCESS_SERVICE_CHECK_RESULT;{entry['host']};{entry['service']};{result['state']};{output}"
+    return f"[{timestamp}] PROCESS_HOST_CHECK_RESULT;{entry['host']};{result['state']};{output}"
+
+
+def runBatch(entries, output, output_format='api', executor='process', max_workers=None, timeout=60):
+    """Runs the manifest entries on a worker pool and writes each result to output as soon as it finishes.
+
+    Each check runs with runCheck() so exceptions and early exits become UNKNOWN results. A check that runs
+    TIMEOUT_GRACE seconds past its timeout, because it hung or its worker died, is reported as UNKNOWN and
+    abandoned so it can't hold up the other checks.
+
+    Args:
+        entries (list): Entries from loadManifest()
+        output (file): Text file the results are written to, one per line
+        output_format (str, optional): 'api' for process-check-result JSON or 'command' for external command
+            file lines. Defaults to 'api'.
+        executor (str, optional): 'process' or 'thread'. Defaults to 'process'.
+        max_workers (int, optional): Pool size. Defaults to the number of CPUs.
+        timeout (float, optional): Seconds each check has unless its entry sets a timeout. Defaults to 60.
+
+    Returns:
+        list: (entry, result) for every check in the order they finished
+    """
+    if output_format == 'api':
+        check_source = socket.gethostname()
+        format_result = lambda entry, result: formatApiResult(entry, result, check_source)
+    elif output_format == 'command':
+        format_result = formatCommandResult
+    else:
+        raise ValueError(f"Unknown output format {output_format}, use 'api' or 'command'")
+    if executor == 'process':
+        events = multiprocessing.Queue()
+        pool = multiprocessing.Pool(max_workers, initializer=_initWorker, initargs=(events,))
+    elif executor == 'thread':
+        events = queue.Queue()
+        pool = multiprocessing.pool.ThreadPool(max_workers or os.cpu_count(), initializer=_initWorker,
+                                               initargs=(events,))
+    else:
+        raise ValueError(f"Unknown executor {executor}, use 'process' or 'thread'")
+
+    logger.info(f"Running {len(entries)} checks with {executor} executor")
+    batch_start = time.monotonic()
+    finished = []
+    pending = set(range(len(entries)))
+    started = {}
+
+    def finish(index, result):
+        pending.discard(index)
+        started.pop(index, None)
+        entry = entries[index]
+        finished.append((entry, result))
+        output.write(format_result(entry, result) + "\n")
+        output.flush()
+        logger.info(f"Check {entry['host']}!{entry.get('service', '')} finished with state {result['state']} "
+                    f"in {result['execution_end'] - result['execution_start']:.3f}s")
+
+    try:
+        for index, entry in enumerate(entries):
+            pool.apply_async(_runBatchCheck, (index, entry, timeout))
+
+        while pending:
+            hard_limits = {index: start + (entries[index].get('timeout') or timeout) + TIMEOUT_GRACE
+                           for index, start in started.items()}
+            # With nothing known to be running queued checks start straight away, so if nothing happens
+            # for a while the remaining checks were lost with a worker that died
+            wait = TIMEOUT_GRACE
+            if hard_limits:
+                wait = max(0, min(hard_limits.values()) - time.monotonic())
+            try:
+                event = events.get(timeout=wait)
+            except queue.Empty:
+                event = None
+
+            if event is not None:
+                kind, index, value = event
+                if kind == 'start':
+                    started[index] = value
+                elif index in pending:
+                    finish(index, value)
+                continue
+
+            now = time.monotonic()
+            lost = [index for index, limit in hard_limits.items() if index in pending and now >= limit]
+            if not started:
+                lost = sorted(pending)
+            for index in lost:
+                entry = entries[index]
+                logger.warning(f"Check {entry['check']} for {entry['host']} didn't finish, abandoning it")
+                end = time.time()
+                finish(index, {'state': STATE_UNKNOWN,
+                               'message': f"UNKNOWN: Check {entry['check']} didn't finish in time",
+                               'performance_data': '',
+                               'execution_start': end - (now - started.get(index, now)), 'execution_end': end})
+    finally:
+        pool.terminate()
+
+    logger.info(f"Ran {len(entries)} checks in {time.monotonic() - batch_start:.3f}s")
+    return finished
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Run the monitoring checks in a manifest and output passive check results.')
+    parser.add_argument('manifest', type=str, help="YAML or JSON manifest of checks")
+    parser.add_argument('--format', type=str, choices=['api', 'command'], default='api',
+                        help="Icinga 2 process-check-result API JSON lines or external command file lines")
+    parser.add_argument('--output', type=str, default='-',
+                        help="File or command pipe to write the results to, - for standard output")
+    parser.add_argument('--workers', type=int, default=None, help="The most checks run at once, defaults to the number of CPUs")
+    parser.add_argument('--executor', type=str, choices=['process', 'thread'], default='process',
+                        help="Run checks in worker processes, which isolates crashes, or threads")
+    parser.add_argument('--timeout', type=float, default=60, help="Seconds each check has unless the manifest sets one")
+    from .logging import initLogging, initLoggingArgparse
+    initLoggingArgparse(parser)
+    args = parser.parse_args(argv)
+    initLogging(debug=args.debug,
+                enable_screen_debug=args.enable_screen_debug,
+                enable_log_file=not args.disable_log_file,
+                log_file=args.log_file,
+                log_rotate=args.log_rotate,
+                log_retention=args.log_retention,
+                log_level=args.log_level,
+                enable_log_queue=args.enable_log_queue,
+                enable_log_shipper=args.enable_log_shipper,
+                log_shipper_socket=args.log_shipper_socket,
+                log_sample=args.log_sample,
+                log_rate_limit=args.log_rate_limit,
+                log_first=args.log_first)
+
+    try:
+        entries = loadManifest(args.manifest)
+    except (OSError, ValueError) as e:
+        print(f"Unable to read manifest {args.manifest}: {e}", file=sys.stderr)
+        sys.exit(os.EX_CONFIG)
+
+    if args.output == '-':
+        runBatch(entries, sys.stdout, args.format, args.executor, args.workers, args.timeout)
+    else:
+        with open(args.output, 'a') as output:
+            runBatch(entries, output, args.format, args.executor, args.workers, args.timeout)
+
+
+if __name__ == "__main__":
+    main()
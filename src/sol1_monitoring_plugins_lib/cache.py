@@ -0,0 +1,263 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+import hashlib
+import json
+import os
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:
+    # No file locking on platforms without fcntl, concurrent checks may run the probe at the same time
+    fcntl = None
+
+from . import logging as plugin_logging
+from .logging import logger
+from .monitoring_plugins import MonitoringPlugin
+
+DEFAULT_CACHE_DIR = '/var/tmp/sol1_monitoring_plugins/cache'
+
+# Arguments that don't change the result of a check so they aren't part of the cache key
+IGNORED_ARGS = ('debug', 'enable_screen_debug', 'disable_log_file', 'log_file', 'log_rotate', 'log_retention',
+                'log_level', 'enable_log_queue', 'enable_log_shipper', 'log_shipper_socket', 'log_sample',
+                'log_rate_limit', 'log_first', 'enable_cache', 'cache_dir', 'cache_ttl', 'cache_stale_ttl',
+                'cache_max_entries')
+
+
+def initCacheArgparse(parser,
+                      cache_dir=DEFAULT_CACHE_DIR,
+                      cache_ttl=60,
+                      cache_stale_ttl=0,
+                      cache_max_entries=1000,
+                      ):
+    """
+    Initalize argparse arguments for the result cache, you can change the argparse argument defaults with the function arguments
+
+    Args:
+        parser (obj): Argparse parser object
+        cache_dir (str, optional): Override default argument value for --cache-dir. Defaults to DEFAULT_CACHE_DIR.
+        cache_ttl (int, optional): Override default argument value for --cache-ttl. Defaults to 60.
+        cache_stale_ttl (int, optional): Override default argument value for --cache-stale-ttl. Defaults to 0.
+        cache_max_entries (int, optional): Override default argument value for --cache-max-entries. Defaults to 1000.
+    """
+    parser.add_argument('--enable-cache', action="store_true", help="Reuses recent results of the same check with the same arguments")
+    parser.add_argument('--cache-dir', type=str, default=cache_dir, help="The directory for cached results")
+    parser.add_argument('--cache-ttl', type=float, default=cache_ttl, help="Seconds a cached result is used for")
+    parser.add_argument('--cache-stale-ttl', type=float, default=cache_stale_ttl,
+                        help="Seconds after the ttl a stale result is returned while it is refreshed in the background")
+    parser.add_argument('--cache-max-entries', type=int, default=cache_max_entries, help="The most results kept in the cache")
+
+
+def cacheKey(checktype, args, ignored_args=IGNORED_ARGS):
+    """Returns the cache key for a check type and its arguments
+
+    Args:
+        checktype (str): Check type, so different checks with the same arguments don't share results
+        args (Namespace or dict or list): Argparse arguments, a dict of arguments or a list of command line arguments
+        ignored_args (tuple, optional): Argument names left out of the key. Defaults to IGNORED_ARGS.
+
+    Returns:
+        str: Hex digest identifying the check run
+    """
+    if hasattr(args, '__dict__') and not isinstance(args, dict):
+        args = vars(args)
+    if isinstance(args, dict):
+        args = sorted((key, value) for key, value in args.items() if key not in ignored_args)
+    normalized = json.dumps([checktype, args], sort_keys=True, default=str)
+    return hashlib.sha256(normalized.encode('utf-8')).hexdigest()
+
+
+class ResultCache:
+    """On disk cache of (state, message, performance_data) results from MonitoringPlugin.exit(do_exit=False)
+    so several services running the same expensive check can share one probe.
+
+    Results are fresh for ttl seconds. For stale_ttl seconds after that the stale result is returned straight
+    away and a forked child refreshes it in the background. The least recently used results are removed once
+    there are more than max_entries. Results are written atomically and probe runs are locked per key so
+    concurrent checks wait for one probe instead of all running it.
+    """
+
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, ttl=60, stale_ttl=0, max_entries=1000):
+        """
+        Args:
+            cache_dir (str, optional): Directory for cached results. Defaults to DEFAULT_CACHE_DIR.
+            ttl (float, optional): Seconds a result is fresh for. Defaults to 60.
+            stale_ttl (float, optional): Seconds after the ttl a stale result is returned while it is refreshed. Defaults to 0.
+            max_entries (int, optional): The most results kept. Defaults to 1000.
+        """
+        self.cache_dir = cache_dir
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.max_entries = max_entries
+
+    def _path(self, key, suffix='.json'):
+        return os.path.join(self.cache_dir, key + suffix)
+
+    @contextmanager
+    def _lock(self, name, blocking=True):
+        """Holds an exclusive lock file, yields False if blocking is False and the lock is held elsewhere"""
+        os.makedirs(self.cache_dir, exist_ok=True)
+        with open(self._path(name, '.lock'), 'a') as lock_file:
+            if fcntl is None:
+                yield True
+                return
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                yield False
+                return
+            try:
+                yield True
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def get(self, key):
+        """Returns a cached result and its age
+
+        Args:
+            key (str): Key from cacheKey()
+
+        Returns:
+            tuple: ((state, message, performance_data), age in seconds) or None if there is no usable result
+        """
+        path = self._path(key)
+        try:
+            with open(path) as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        age = time.time() - entry['created']
+        if age > self.ttl + self.stale_ttl:
+            return None
+        # The modification time records the last use for LRU eviction
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return (entry['state'], entry['message'], entry['performance_data']), age
+
+    def set(self, key, result):
+        """Stores a result and evicts the least recently used results if there are too many
+
+        Args:
+            key (str): Key from cacheKey()
+            result (tuple): (state, message, performance_data) from MonitoringPlugin.exit(do_exit=False)
+        """
+        state, message, performance_data = result
+        os.makedirs(self.cache_dir, exist_ok=True)
+        entry = {'created': time.time(), 'state': state, 'message': message, 'performance_data': performance_data}
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, prefix='.', suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w') as f:
+                json.dump(entry, f)
+            os.replace(tmp_path, self._path(key))
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+        self._evict()
+
+    def _evict(self):
+        with self._lock('.evict', blocking=False) as locked:
+            if not locked:
+                # Another process is already evicting
+                return
+            entries = []
+            for entry in os.scandir(self.cache_dir):
+                if entry.name.endswith('.json'):
+                    try:
+                        entries.append((entry.stat().st_mtime, entry.path))
+                    except OSError:
+                        pass
+            if len(entries) <= self.max_entries:
+                return
+            entries.sort()
+            for _, path in entries[:len(entries) - self.max_entries]:
+                if plugin_logging.debug_enabled:
+                    logger.debug(f"Evicting cached result {path}")
+                # The empty lock file stays, if it was removed a process holding the lock on it and a process
+                # creating a new one could both run the probe
+                try:
+                    os.unlink(path)
+                except OSError:
+                    pass
+
+    def _probe(self, key, checktype, probe, plugin_class):
+        from .daemon import runCheck
+        result = runCheck(lambda plugin, argv: probe(plugin), checktype=checktype, plugin_class=plugin_class)
+        self.set(key, result)
+        return result
+
+    def _refreshInBackground(self, key, checktype, probe, plugin_class):
+        if not hasattr(os, 'fork'):
+            return
+        sys.stdout.flush()
+        sys.stderr.flush()
+        if os.fork() != 0:
+            return
+        # The child mustn't hold the check's output pipes open or the monitoring system waits for it
+        try:
+            os.setsid()
+            devnull = os.open(os.devnull, os.O_RDWR)
+            for fd in (0, 1, 2):
+                os.dup2(devnull, fd)
+            with self._lock(key, blocking=False) as locked:
+                if locked:
+                    self._probe(key, checktype, probe, plugin_class)
+        except BaseException:
+            logger.exception("Background refresh of cached result failed")
+        finally:
+            plugin_logging.flushLogging()
+            os._exit(0)
+
+    def run(self, checktype, args, probe, plugin_class=MonitoringPlugin):
+        """Returns the cached result for the check, running the probe if there isn't a fresh one
+
+        Args:
+            checktype (str): Check type passed to the plugin constructor and used in the cache key
+            args (Namespace or dict or list): Check arguments used in the cache key
+            probe (callable): Called with a fresh plugin, probe(plugin), to run the check, see daemon.runCheck()
+            plugin_class (class, optional): MonitoringPlugin or a child class. Defaults to MonitoringPlugin.
+
+        Returns:
+            tuple: return state, message and performance data of check
+        """
+        key = cacheKey(checktype, args)
+        cached = self.get(key)
+        if cached is not None:
+            result, age = cached
+            if age <= self.ttl:
+                if plugin_logging.debug_enabled:
+                    logger.debug(f"Using cached result {key} from {age:.1f}s ago")
+                return result
+            if plugin_logging.debug_enabled:
+                logger.debug(f"Using stale cached result {key} from {age:.1f}s ago and refreshing it")
+            self._refreshInBackground(key, checktype, probe, plugin_class)
+            return result
+
+        with self._lock(key):
+            # Another process may have run the probe while we waited for the lock
+            cached = self.get(key)
+            if cached is not None and cached[1] <= self.ttl:
+                return cached[0]
+            return self._probe(key, checktype, probe, plugin_class)
+
+    def exit(self, checktype, args, probe, plugin_class=MonitoringPlugin):
+        """Runs the check through the cache then prints the output and exits like MonitoringPlugin.exit()
+
+        Args:
+            checktype (str): Check type passed to the plugin constructor and used in the cache key
+            args (Namespace or dict or list): Check arguments used in the cache key
+            probe (callable): Called with a fresh plugin, probe(plugin), to run the check
+            plugin_class (class, optional): MonitoringPlugin or a child class. Defaults to MonitoringPlugin.
+        """
+        state, message, performance_data = self.run(checktype, args, probe, plugin_class=plugin_class)
+        # Add the pipe '|' before perfdata if we have any
+        if performance_data != "":
+            performance_data = "|" + performance_data
+        print(f"{message}{performance_data}")
+        plugin_logging.flushLogging()
+        exit(state)
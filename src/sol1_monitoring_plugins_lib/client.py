@@ -0,0 +1,67 @@
+#!/usr/bin/env python
+# coding: utf-8
+"""Client shim for the check daemon, prints the check output and exits with the check state
+just like a standalone check would. Only uses the standard library so it starts quickly.
+"""
+
+import json
+import socket
+import sys
+
+DEFAULT_SOCKET_PATH = '/run/icinga2/sol1_check_daemon.sock'
+STATE_UNKNOWN = 3
+
+
+def requestCheck(check, args=None, socket_path=DEFAULT_SOCKET_PATH, timeout=60):
+    """Asks the check daemon to run a check
+
+    Args:
+        check (str): Name the check was registered with
+        args (list, optional): Arguments for the check. Defaults to None.
+        socket_path (str, optional): Path of the daemon UNIX socket. Defaults to DEFAULT_SOCKET_PATH.
+        timeout (int, optional): Seconds to wait for the daemon. Defaults to 60.
+
+    Returns:
+        dict: state, message and performance_data of the check
+    """
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.settimeout(timeout)
+        sock.connect(socket_path)
+        sock.sendall(json.dumps({'check': check, 'args': list(args or [])}).encode('utf-8') + b"\n")
+        with sock.makefile('rb') as response:
+            return json.loads(response.readline().decode('utf-8'))
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    socket_path = DEFAULT_SOCKET_PATH
+    timeout = 60
+    # Options for the client come before the check name, everything after it belongs to the check
+    while argv and argv[0] in ('--socket', '--timeout'):
+        if len(argv) < 2:
+            break
+        if argv[0] == '--socket':
+            socket_path = argv[1]
+        else:
+            timeout = float(argv[1])
+        argv = argv[2:]
+    if not argv:
+        print("UNKNOWN: usage: client [--socket PATH] [--timeout SECONDS] CHECK [ARGS...]")
+        sys.exit(STATE_UNKNOWN)
+
+    try:
+        result = requestCheck(argv[0], argv[1:], socket_path=socket_path, timeout=timeout)
+    except (OSError, ValueError) as e:
+        print(f"UNKNOWN: Unable to get check result from check daemon at {socket_path}: {e}")
+        sys.exit(STATE_UNKNOWN)
+
+    # Same output as MonitoringPlugin.exit()
+    performance_data = result['performance_data']
+    if performance_data != "":
+        performance_data = "|" + performance_data
+    print(f"{result['message']}{performance_data}")
+    sys.exit(result['state'])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,349 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+import asyncio
+import http.client
+import os
+import select
+import socket
+import ssl
+import threading
+import time
+from collections import namedtuple
+from contextlib import contextmanager
+from functools import partial
+from urllib.parse import urlsplit
+
+from . import logging as plugin_logging
+from .logging import logger
+
+# Methods that are safe to send again on a fresh connection when a reused keep-alive connection was closed by the server
+_IDEMPOTENT_METHODS = ('GET', 'HEAD', 'OPTIONS', 'PUT', 'DELETE', 'TRACE')
+# Errors from sending on a keep-alive connection the server has closed since it was last used
+_STALE_CONNECTION_ERRORS = (http.client.RemoteDisconnected, http.client.BadStatusLine, ConnectionResetError,
+                            ConnectionAbortedError, BrokenPipeError)
+
+HTTPResult = namedtuple('HTTPResult', ['status', 'reason', 'headers', 'body'])
+HTTPResult.__doc__ = """Response from ConnectionPool.request(), the body is read in full so the connection can be reused"""
+
+
+class PoolStats(namedtuple('PoolStats', ['connects', 'reuses', 'connect_seconds'])):
+    """Counts of new and reused connections and the total time spent connecting, including TLS handshakes
+    """
+    __slots__ = ()
+
+    @property
+    def reuse_ratio(self):
+        """Fraction of connections that were reused, 0 if no connections were used"""
+        total = self.connects + self.reuses
+        return self.reuses / total if total else 0.0
+
+    @property
+    def connect_time(self):
+        """Average seconds per new connection, 0 if there were none"""
+        return self.connect_seconds / self.connects if self.connects else 0.0
+
+    def __sub__(self, other):
+        return PoolStats(self.connects - other.connects, self.reuses - other.reuses,
+                         self.connect_seconds - other.connect_seconds)
+
+
+def _socketIsAlive(sock):
+    """An idle connection shouldn't have anything to read, if it does the server closed it or sent something unexpected"""
+    if sock is None or sock.fileno() < 0:
+        return False
+    try:
+        readable, _, _ = select.select([sock], [], [], 0)
+    except (OSError, ValueError):
+        return False
+    return not readable
+
+
+def _closeQuietly(connection):
+    try:
+        connection.close()
+    except OSError:
+        pass
+
+
+class ConnectionPool:
+    """Keeps HTTP keep-alive connections and TCP/TLS sockets open between probes so repeated requests to the
+    same host skip the TCP and TLS handshakes.
+
+    Connections are pooled per (scheme, host, port) with at most max_per_host open at once, callers wait for
+    one to be released when the limit is reached. The pool is thread safe, asyncio checks can use
+    requestAsync() which runs the request in the event loop's executor.
+
+        pool = ConnectionPool(max_per_host=4)
+        for url in urls:
+            result = pool.request("GET", url, timeout=plugin.remaining)
+        pool.setPerformanceData(plugin)
+    """
+
+    def __init__(self, max_per_host=4, idle_timeout=60, connect_timeout=10, ssl_context=None):
+        """
+        Args:
+            max_per_host (int, optional): Most connections open to one host and port at once. Defaults to 4.
+            idle_timeout (float, optional): Seconds an idle connection is kept for. Defaults to 60.
+            connect_timeout (float, optional): Seconds to wait for a connection and for the pool limit. Defaults to 10.
+            ssl_context (ssl.SSLContext, optional): Context for https and TLS connections. Defaults to
+                ssl.create_default_context().
+        """
+        self.max_per_host = max_per_host
+        self.idle_timeout = idle_timeout
+        self.connect_timeout = connect_timeout
+        self.ssl_context = ssl_context
+        self._condition = threading.Condition()
+        self._idle = {}
+        self._open = {}
+        self._connects = 0
+        self._reuses = 0
+        self._connect_seconds = 0.0
+        self._closed = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
+
+    def _sslContext(self):
+        if self.ssl_context is None:
+            self.ssl_context = ssl.create_default_context()
+        return self.ssl_context
+
+    def _acquire(self, key, connect, is_alive):
+        """Returns (connection, reused), reusing an idle connection or calling connect() if the host is under its limit
+        """
+        expired = []
+        wait_until = time.monotonic() + self.connect_timeout if self.connect_timeout is not None else None
+        try:
+            with self._condition:
+                while True:
+                    if self._closed:
+                        raise RuntimeError("Connection pool is closed")
+                    now = time.monotonic()
+                    idle = self._idle.get(key)
+                    while idle:
+                        # Newest first, it is the least likely to have been closed by the server
+                        connection, last_used = idle.pop()
+                        if now - last_used <= self.idle_timeout and is_alive(connection):
+                            self._reuses += 1
+                            return connection, True
+                        self._open[key] -= 1
+                        expired.append(connection)
+                    if self._open.get(key, 0) < self.max_per_host:
+                        self._open[key] = self._open.get(key, 0) + 1
+                        break
+                    if wait_until is not None and now >= wait_until:
+                        raise socket.timeout(f"Timed out waiting for a connection to {key[1]}:{key[2]}")
+                    self._condition.wait(None if wait_until is None else wait_until - now)
+        finally:
+            for connection in expired:
+                _closeQuietly(connection)
+
+        start = time.perf_counter()
+        try:
+            connection = connect()
+        except BaseException:
+            with self._condition:
+                self._open[key] -= 1
+                self._condition.notify()
+            raise
+        elapsed = time.perf_counter() - start
+        with self._condition:
+            self._connects += 1
+            self._connect_seconds += elapsed
+        if plugin_logging.debug_enabled:
+            logger.debug(f"Connected to {key[0]}://{key[1]}:{key[2]} in {elapsed:.3f}s")
+        return connection, False
+
+    def _release(self, key, connection, reusable):
+        with self._condition:
+            if reusable and not self._closed:
+                self._idle.setdefault(key, []).append((connection, time.monotonic()))
+                connection = None
+            else:
+                self._open[key] -= 1
+            self._condition.notify()
+        if connection is not None:
+            _closeQuietly(connection)
+
+    def _connectSocket(self, host, port, tls, server_hostname):
+        sock = socket.create_connection((host, port), timeout=self.connect_timeout)
+        if tls:
+            try:
+                sock = self._sslContext().wrap_socket(sock, server_hostname=server_hostname or host)
+            except BaseException:
+                sock.close()
+                raise
+        return sock
+
+    @contextmanager
+    def connection(self, host, port, tls=False, server_hostname=None, timeout=None):
+        """Lends a pooled TCP or TLS socket for a request and response exchange. The socket goes back to the pool
+        when the block finishes, or is closed if the block raises an exception or the socket is closed.
+        Only leave a socket in a state the next user can start a new exchange from.
+
+            with pool.connection("db.example.com", 6379) as sock:
+                sock.sendall(b"PING\\r\\n")
+                reply = sock.recv(64)
+
+        Args:
+            host (str): Host name or address
+            port (int): Port
+            tls (bool, optional): Wraps the socket in TLS with ssl_context. Defaults to False.
+            server_hostname (str, optional): Name for TLS SNI and certificate checks. Defaults to host.
+            timeout (float, optional): Socket timeout while it is lent out. Defaults to connect_timeout.
+
+        Yields:
+            socket.socket: Connected socket
+        """
+        key = ('tls' if tls else 'tcp', host, port)
+        sock, _ = self._acquire(key, partial(self._connectSocket, host, port, tls, server_hostname), _socketIsAlive)
+        sock.settimeout(timeout if timeout is not None else self.connect_timeout)
+        reusable = False
+        try:
+            yield sock
+            reusable = sock.fileno() >= 0
+        finally:
+            self._release(key, sock, reusable)
+
+    def _connectHTTP(self, scheme, host, port):
+        if scheme == 'https':
+            connection = http.client.HTTPSConnection(host, port, timeout=self.connect_timeout,
+                                                     context=self._sslContext())
+        else:
+            connection = http.client.HTTPConnection(host, port, timeout=self.connect_timeout)
+        # Connect now so the handshake is counted in the connect time
+        connection.connect()
+        return connection
+
+    def request(self, method, url, body=None, headers=None, timeout=None):
+        """Sends an HTTP request on a pooled keep-alive connection and reads the whole response.
+        If a reused connection turns out to have been closed by the server an idempotent request is sent again
+        on a new connection.
+
+        Args:
+            method (str): HTTP method
+            url (str): http or https URL
+            body (bytes or str, optional): Request body. Defaults to None.
+            headers (dict, optional): Request headers. Defaults to None.
+            timeout (float, optional): Socket timeout for the request, eg. plugin.remaining. Defaults to connect_timeout.
+
+        Returns:
+            HTTPResult: status, reason, headers and body
+        """
+        parts = urlsplit(url)
+        scheme = parts.scheme.lower()
+        if scheme not in ('http', 'https'):
+            raise ValueError(f"Unsupported URL scheme {parts.scheme!r}, use http or https")
+        host = parts.hostname
+        port = parts.port or (443 if scheme == 'https' else 80)
+        path = parts.path or '/'
+        if parts.query:
+            path += '?' + parts.query
+        key = (scheme, host, port)
+        is_alive = lambda connection: _socketIsAlive(connection.sock)
+
+        while True:
+            connection, reused = self._acquire(key, partial(self._connectHTTP, scheme, host, port), is_alive)
+            reusable = False
+            try:
+                connection.sock.settimeout(timeout if timeout is not None else self.connect_timeout)
+                connection.request(method, path, body=body, headers=headers or {})
+                response = connection.getresponse()
+                result = HTTPResult(response.status, response.reason, response.headers, response.read())
+                reusable = not response.will_close
+                return result
+            except _STALE_CONNECTION_ERRORS:
+                if not reused or method.upper() not in _IDEMPOTENT_METHODS:
+                    raise
+                if plugin_logging.debug_enabled:
+                    logger.debug(f"Reused connection to {host}:{port} was closed, retrying on a new connection")
+            finally:
+                self._release(key, connection, reusable)
+
+    async def requestAsync(self, method, url, body=None, headers=None, timeout=None):
+        """request() for asyncio checks, the request runs in the event loop's default executor so it doesn't
+        block other probes. Arguments and result are the same as request().
+        """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, partial(self.request, method, url, body, headers, timeout))
+
+    def stats(self):
+        """Returns the connection counts since the pool was created, subtract an earlier snapshot to get the
+        counts for one check run when the pool is shared
+
+        Returns:
+            PoolStats: connects, reuses and connect_seconds
+        """
+        with self._condition:
+            return PoolStats(self._connects, self._reuses, self._connect_seconds)
+
+    def setPerformanceData(self, plugin, since=None, prefix="pool_"):
+        """Adds the pool statistics to the plugin's performance data:
+        {prefix}connects, {prefix}reuses, {prefix}reuse_ratio in % and average {prefix}connect_time in s
+
+        Args:
+            plugin (MonitoringPlugin): Plugin to add the performance data to
+            since (PoolStats, optional): Earlier stats() snapshot to report the change from. Defaults to None.
+            prefix (str, optional): Prefix for the performance data labels. Defaults to "pool_".
+
+        Returns:
+            PoolStats: The statistics that were reported
+        """
+        stats = self.stats()
+        if since is not None:
+            stats = stats - since
+        plugin.setPerformanceData(f"{prefix}connects", stats.connects, minimum=0)
+        plugin.setPerformanceData(f"{prefix}reuses", stats.reuses, minimum=0)
+        plugin.setPerformanceData(f"{prefix}reuse_ratio", round(stats.reuse_ratio * 100, 2), "%", minimum=0, maximum=100)
+        plugin.setPerformanceData(f"{prefix}connect_time", f"{stats.connect_time:.6f}", "s", minimum=0)
+        return stats
+
+    def close(self):
+        """Closes all idle connections, connections that are lent out are closed when they are released
+        """
+        with self._condition:
+            self._closed = True
+            idle, self._idle = self._idle, {}
+            for key, connections in idle.items():
+                self._open[key] -= len(connections)
+            self._condition.notify_all()
+        for connections in idle.values():
+            for connection, _ in connections:
+                _closeQuietly(connection)
+
+
+_shared_pool = None
+_shared_pool_lock = threading.Lock()
+
+
+def getSharedPool(**kwargs):
+    """Returns the process wide pool, created with kwargs on first use. Under the threading check daemon every
+    check invocation shares it so connections stay open between runs. Forked children start with a new pool.
+
+    Args:
+        **kwargs: ConnectionPool() arguments, only used when the pool is created
+
+    Returns:
+        ConnectionPool: The shared pool
+    """
+    global _shared_pool
+    with _shared_pool_lock:
+        if _shared_pool is None:
+            _shared_pool = ConnectionPool(**kwargs)
+        return _shared_pool
+
+
+def _resetSharedPool():
+    # A forked child mustn't share sockets, or a lock another thread held, with its parent
+    global _shared_pool, _shared_pool_lock
+    _shared_pool = None
+    _shared_pool_lock = threading.Lock()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_resetSharedPool)
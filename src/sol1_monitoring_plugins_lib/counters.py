@@ -0,0 +1,201 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+import os
+import struct
+import tempfile
+import time
+from collections import namedtuple
+
+from . import logging as plugin_logging
+from .logging import logger
+
+DEFAULT_STATE_DIR = '/var/tmp/sol1_monitoring_plugins/counters'
+
+# File layout, all little endian:
+#   header: magic, version, record count
+#   record: label length, label (utf-8), value type, value (uint64 or float64), timestamp (float64)
+_MAGIC = b'S1CT'
+_VERSION = 1
+_HEADER = struct.Struct('<4sBI')
+_LABEL_LENGTH = struct.Struct('<H')
+_INT_RECORD = struct.Struct('<BQd')
+_FLOAT_RECORD = struct.Struct('<Bdd')
+_INT, _FLOAT = 0, 1
+
+CounterRate = namedtuple('CounterRate', ['delta', 'interval', 'rate'])
+CounterRate.__doc__ = """Change of a counter since the last run: delta, interval in seconds and rate per second"""
+
+
+def counterStorePath(checktype, args, state_dir=DEFAULT_STATE_DIR):
+    """Returns a state file path for a check type and its arguments, see cache.cacheKey()
+
+    Args:
+        checktype (str): Check type
+        args (Namespace or dict or list): Check arguments
+        state_dir (str, optional): Directory for state files. Defaults to DEFAULT_STATE_DIR.
+
+    Returns:
+        str: Path of the state file
+    """
+    from .cache import cacheKey
+    return os.path.join(state_dir, cacheKey(checktype, args) + '.counters')
+
+
+class CounterStore:
+    """Persistent per-check store of counter values (the `c` UOM) so checks can report rates and deltas.
+
+    The whole store is read with one read when it is opened and written with one atomic write when it is
+    saved, so thousands of counters cost one I/O operation each way per check run.
+
+        with CounterStore(counterStorePath("Interfaces", args), counter_max=2**64) as counters:
+            for name, octets in interfaces.items():
+                change = counters.update(f"{name}_octets", octets)
+                if change is not None:
+                    plugin.setPerformanceData(f"{name}_bps", change.rate * 8)
+    """
+
+    def __init__(self, path, counter_max=None, max_age=86400):
+        """
+        Args:
+            path (str): Path of the state file, see counterStorePath()
+            counter_max (int, optional): Value the counters wrap at, eg. 2**32 or 2**64. Defaults to None
+                which treats every decrease as a reset.
+            max_age (float, optional): Seconds after which counters that aren't updated are dropped. Defaults to 86400.
+        """
+        self.path = path
+        self.counter_max = counter_max
+        self.max_age = max_age
+        self._counters = self._load()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.save()
+        return False
+
+    def __len__(self):
+        return len(self._counters)
+
+    def __contains__(self, label):
+        return label in self._counters
+
+    def _load(self):
+        try:
+            with open(self.path, 'rb') as f:
+                data = f.read()
+        except FileNotFoundError:
+            return {}
+
+        counters = {}
+        try:
+            magic, version, count = _HEADER.unpack_from(data, 0)
+            if magic != _MAGIC or version != _VERSION:
+                raise ValueError(f"unsupported format {magic!r} version {version}")
+            offset = _HEADER.size
+            for _ in range(count):
+                (label_length,) = _LABEL_LENGTH.unpack_from(data, offset)
+                offset += _LABEL_LENGTH.size
+                label = data[offset:offset + label_length].decode('utf-8')
+                offset += label_length
+                record = _INT_RECORD if data[offset] == _INT else _FLOAT_RECORD
+                _, value, timestamp = record.unpack_from(data, offset)
+                offset += record.size
+                counters[label] = (value, timestamp)
+        except (struct.error, ValueError, IndexError) as e:
+            # A corrupt state file only costs one run without rates
+            logger.warning(f"Ignoring unreadable counter state file {self.path}: {e}")
+            return {}
+        return counters
+
+    def get(self, label):
+        """Returns the stored (value, timestamp) of a counter or None"""
+        return self._counters.get(label)
+
+    def update(self, label, value, timestamp=None):
+        """Stores a new counter value and returns the change since the last value
+
+        Args:
+            label (str): Counter label
+            value (int or float): Current counter value
+            timestamp (float, optional): Time of the value. Defaults to now.
+
+        Returns:
+            CounterRate: delta, interval and rate per second, None on the first run, after a reset or
+                if no time has passed
+        """
+        if timestamp is None:
+            timestamp = time.time()
+        previous = self._counters.get(label)
+        self._counters[label] = (value, timestamp)
+        if previous is None:
+            return None
+
+        previous_value, previous_timestamp = previous
+        interval = timestamp - previous_timestamp
+        if interval <= 0:
+            return None
+        delta = value - previous_value
+        if delta < 0:
+            if self.counter_max is None or previous_value >= self.counter_max:
+                if plugin_logging.debug_enabled:
+                    logger.debug(f"Counter {label} reset from {previous_value} to {value}")
+                return None
+            wrapped_delta = self.counter_max - previous_value + value
+            # A big jump is more likely a reset than a wrap
+            if wrapped_delta > self.counter_max // 2:
+                if plugin_logging.debug_enabled:
+                    logger.debug(f"Counter {label} reset from {previous_value} to {value}")
+                return None
+            delta = wrapped_delta
+        return CounterRate(delta, interval, delta / interval)
+
+    def updateMany(self, values, timestamp=None):
+        """Stores many counter values at once, see update()
+
+        Args:
+            values (dict or iterable): Dict of label to value or (label, value) pairs
+            timestamp (float, optional): Time of the values. Defaults to now.
+
+        Returns:
+            dict: Label to CounterRate or None
+        """
+        if timestamp is None:
+            timestamp = time.time()
+        if isinstance(values, dict):
+            values = values.items()
+        return {label: self.update(label, value, timestamp) for label, value in values}
+
+    def save(self):
+        """Writes all counters to the state file in one atomic write, dropping counters older than max_age
+        """
+        now = time.time()
+        parts = []
+        count = 0
+        for label, (value, timestamp) in self._counters.items():
+            if self.max_age is not None and now - timestamp > self.max_age:
+                continue
+            encoded = label.encode('utf-8')
+            parts.append(_LABEL_LENGTH.pack(len(encoded)))
+            parts.append(encoded)
+            if isinstance(value, int) and 0 <= value < 2**64:
+                parts.append(_INT_RECORD.pack(_INT, value, timestamp))
+            else:
+                parts.append(_FLOAT_RECORD.pack(_FLOAT, value, timestamp))
+            count += 1
+        data = _HEADER.pack(_MAGIC, _VERSION, count) + b"".join(parts)
+
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.', suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, self.path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+        if plugin_logging.debug_enabled:
+            logger.debug(f"Saved {count} counters to {self.path}")
@@ -0,0 +1,237 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+import argparse
+import importlib
+import json
+import os
+import socket
+import socketserver
+
+from .logging import logger
+from .monitoring_plugins import MonitoringPlugin
+
+DEFAULT_SOCKET_PATH = '/run/icinga2/sol1_check_daemon.sock'
+STATE_UNKNOWN = 3
+
+
+class _CheckExit(Exception):
+    """Raised by a daemon plugin's exit() to stop the check function without exiting the daemon"""
+
+    def __init__(self, result):
+        super().__init__()
+        self.result = result
+
+
+_daemon_plugin_classes = {}
+
+
+def _resultTuple(plugin, result):
+    # exit(output_format='json') gives a JSON string, it takes the place of the message so the client,
+    # cache and batch runner output it as it is and the state is still the exit code
+    if isinstance(result, str):
+        return (plugin.state, result, "")
+    return result
+
+
+def _daemonPluginClass(plugin_class):
+    """Returns a subclass of plugin_class where exit() never prints or exits the process,
+    it stops the check and hands back the same tuple as exit(do_exit=False)
+    """
+    if plugin_class not in _daemon_plugin_classes:
+        def exit(self, exit_state=None, force_state=False, do_exit=True, **kwargs):
+            # Nothing is written to standard output so there is nothing to stream, max_bytes still applies
+            kwargs.pop('stream', None)
+            result = plugin_class.exit(self, exit_state=exit_state, force_state=force_state, do_exit=False, **kwargs)
+            if do_exit:
+                raise _CheckExit(_resultTuple(self, result))
+            return result
+
+        _daemon_plugin_classes[plugin_class] = type(plugin_class.__name__, (plugin_class,), {'exit': exit})
+    return _daemon_plugin_classes[plugin_class]
+
+
+def runCheck(func, argv=None, checktype=None, plugin_class=MonitoringPlugin):
+    """Runs a check function against a fresh plugin and returns what exit(do_exit=False) would.
+
+    The check function is called as func(plugin, argv). It can call plugin.exit() the same way a
+    standalone check does, return the tuple from plugin.exit(do_exit=False) or just return, in which
+    case plugin.exit(do_exit=False) is called for it. With output_format='json' the message is the JSON
+    result and the performance data is empty, the JSON has the performance data points.
+
+    Args:
+        func (callable): Check function taking (plugin, argv)
+        argv (list, optional): Arguments for the check, usually passed to argparse. Defaults to None.
+        checktype (str, optional): Check type passed to the plugin constructor. Defaults to None.
+        plugin_class (class, optional): MonitoringPlugin or a child class. Defaults to MonitoringPlugin.
+
+    Returns:
+        tuple: return state, message and performance data of check
+    """
+    plugin = _daemonPluginClass(plugin_class)(checktype)
+    try:
+        result = func(plugin, list(argv or []))
+    except _CheckExit as e:
+        return e.result
+    except SystemExit as e:
+        # argparse errors and --help end up here
+        logger.warning(f"Check {func.__name__} exited early with code {e.code}")
+        plugin.setMessage(f"Check exited early with code {e.code}\n", plugin.STATE_UNKNOWN)
+        return plugin.exit(exit_state=plugin.STATE_UNKNOWN, force_state=True, do_exit=False)
+    except Exception as e:
+        logger.exception(f"Check {func.__name__} raised an exception")
+        plugin.setMessage(f"Check raised {type(e).__name__}: {e}\n", plugin.STATE_UNKNOWN)
+        return plugin.exit(exit_state=plugin.STATE_UNKNOWN, force_state=True, do_exit=False)
+
+    if isinstance(result, tuple) and len(result) == 3:
+        return result
+    if isinstance(result, str):
+        # The JSON string from exit(output_format='json', do_exit=False)
+        return _resultTuple(plugin, result)
+    return plugin.exit(do_exit=False)
+
+
+class _CheckRequestHandler(socketserver.StreamRequestHandler):
+
+    def handle(self):
+        try:
+            request = json.loads(self.rfile.readline().decode('utf-8'))
+            response = self.server.check_daemon.handleRequest(request)
+        except ValueError as e:
+            response = {'state': STATE_UNKNOWN,
+                        'message': f"UNKNOWN: Invalid check daemon request: {e}",
+                        'performance_data': ''}
+        self.wfile.write(json.dumps(response).encode('utf-8') + b"\n")
+
+
+class _ForkingCheckServer(socketserver.ForkingMixIn, socketserver.UnixStreamServer):
+    pass
+
+
+class _ThreadingCheckServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+class CheckDaemon:
+    """Long lived worker that runs registered check functions for the client shim over a UNIX socket.
+    The library, loguru and the check modules are imported once when the daemon starts instead of
+    on every check run.
+    """
+
+    def __init__(self, socket_path=DEFAULT_SOCKET_PATH, forking=True, socket_mode=0o660):
+        """
+        Args:
+            socket_path (str, optional): Path of the UNIX socket to listen on. Defaults to DEFAULT_SOCKET_PATH.
+            forking (bool, optional): Run each check in a forked child, otherwise in a thread. Defaults to True.
+            socket_mode (int, optional): File mode of the socket. Defaults to 0o660.
+        """
+        self.socket_path = socket_path
+        self.forking = forking
+        self.socket_mode = socket_mode
+        self._checks = {}
+        self._server = None
+
+    def register(self, name, func, checktype=None, plugin_class=MonitoringPlugin):
+        """Registers a check function to be run by name
+
+        Args:
+            name (str): Name the client uses to request the check
+            func (callable): Check function taking (plugin, argv), see runCheck()
+            checktype (str, optional): Check type passed to the plugin constructor. Defaults to None.
+            plugin_class (class, optional): MonitoringPlugin or a child class. Defaults to MonitoringPlugin.
+        """
+        logger.debug(f"Registering check {name}")
+        self._checks[name] = (func, checktype, plugin_class)
+
+    def check(self, name, checktype=None, plugin_class=MonitoringPlugin):
+        """Decorator version of register()
+        """
+        def decorator(func):
+            self.register(name, func, checktype=checktype, plugin_class=plugin_class)
+            return func
+        return decorator
+
+    def handleRequest(self, request):
+        """Runs one check request and returns the response sent to the client
+
+        Args:
+            request (dict): {"check": name, "args": [...]}
+
+        Returns:
+            dict: state, message and performance_data of the check
+        """
+        name = request.get('check')
+        if name not in self._checks:
+            logger.warning(f"Unknown check requested: {name}")
+            return {'state': STATE_UNKNOWN,
+                    'message': f"UNKNOWN: Check {name} isn't registered with the check daemon",
+                    'performance_data': ''}
+
+        func, checktype, plugin_class = self._checks[name]
+        logger.debug(f"Running check {name} with args {request.get('args')}")
+        state, message, performance_data = runCheck(func, request.get('args'),
+                                                    checktype=checktype, plugin_class=plugin_class)
+        return {'state': state, 'message': message, 'performance_data': performance_data}
+
+    def _removeStaleSocket(self):
+        if not os.path.exists(self.socket_path):
+            return
+        probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            probe.connect(self.socket_path)
+        except OSError:
+            logger.info(f"Removing stale socket {self.socket_path}")
+            os.unlink(self.socket_path)
+        else:
+            raise RuntimeError(f"Check daemon already listening on {self.socket_path}")
+        finally:
+            probe.close()
+
+    def serveForever(self):
+        """Listens on the socket and runs check requests until shutdown() is called
+        """
+        self._removeStaleSocket()
+        server_class = _ForkingCheckServer if self.forking else _ThreadingCheckServer
+        self._server = server_class(self.socket_path, _CheckRequestHandler)
+        self._server.check_daemon = self
+        os.chmod(self.socket_path, self.socket_mode)
+        logger.info(f"Check daemon listening on {self.socket_path} with {len(self._checks)} checks")
+        try:
+            self._server.serve_forever()
+        finally:
+            self._server.server_close()
+            if os.path.exists(self.socket_path):
+                os.unlink(self.socket_path)
+
+    def shutdown(self):
+        """Stops serveForever(), must be called from another thread
+        """
+        if self._server is not None:
+            self._server.shutdown()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Run registered monitoring checks for the check client.')
+    parser.add_argument('--socket', type=str, default=DEFAULT_SOCKET_PATH, help="The path to the UNIX socket")
+    parser.add_argument('--check-module', type=str, action='append', default=[], required=True,
+                        help="Module with a registerChecks(daemon) function, can be repeated")
+    parser.add_argument('--threading', action="store_true", help="Run checks in threads instead of forked children")
+    from .logging import initLogging, initLoggingArgparse
+    initLoggingArgparse(parser)
+    args = parser.parse_args(argv)
+    initLogging(debug=args.debug,
+                enable_screen_debug=args.enable_screen_debug,
+                enable_log_file=not args.disable_log_file,
+                log_file=args.log_file,
+                log_rotate=args.log_rotate,
+                log_retention=args.log_retention,
+                log_level=args.log_level)
+
+    daemon = CheckDaemon(socket_path=args.socket, forking=not args.threading)
+    for module_name in args.check_module:
+        importlib.import_module(module_name).registerChecks(daemon)
+    daemon.serveForever()
+
+
+if __name__ == "__main__":
+    main()
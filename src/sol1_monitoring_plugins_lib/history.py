@@ -0,0 +1,349 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+import math
+import mmap
+import os
+import struct
+import sys
+import time
+
+from . import logging as plugin_logging
+from .logging import logger
+
+DEFAULT_STATE_DIR = '/var/tmp/sol1_monitoring_plugins/history'
+
+# File layout, a fixed size file that is memory mapped so a run only touches the pages it reads and writes:
+#   header (64 bytes): magic, version, max labels, size, next slot, record count, label count
+#   label table: max labels * LABEL_BYTES, utf-8 labels padded with nulls
+#   timestamps: size * float64
+#   values: max labels columns of size * float64, NaN where a label wasn't recorded
+# Values are native doubles, the file is only read on the host that wrote it.
+_MAGIC = b'S1HI'
+_VERSION = 1
+_HEADER = struct.Struct('<4sBHIIIH')
+_HEADER_BYTES = 64
+LABEL_BYTES = 64
+_FLOAT = struct.Struct('d')
+_NAN = _FLOAT.pack(math.nan)
+
+
+def _numpy():
+    # numpy is optional and slow to import, only use it when the check has already imported it
+    return sys.modules.get('numpy')
+
+
+def historyPath(checktype, args, state_dir=DEFAULT_STATE_DIR):
+    """Returns a history file path for a check type and its arguments, see cache.cacheKey()
+
+    Args:
+        checktype (str): Check type
+        args (Namespace or dict or list): Check arguments
+        state_dir (str, optional): Directory for history files. Defaults to DEFAULT_STATE_DIR.
+
+    Returns:
+        str: Path of the history file
+    """
+    from .cache import cacheKey
+    return os.path.join(state_dir, cacheKey(checktype, args) + '.history')
+
+
+def _percentile(values, q):
+    # Linear interpolation between the closest ranks, the same as numpy.percentile()
+    values = sorted(values)
+    position = (len(values) - 1) * q / 100
+    lower = math.floor(position)
+    upper = min(lower + 1, len(values) - 1)
+    return values[lower] + (values[upper] - values[lower]) * (position - lower)
+
+
+class PerfDataHistory:
+    """Ring buffer of recent performance data values on local disk, one record per check run, so checks can
+    alert on change and not just on fixed thresholds.
+
+    The file has a fixed size and is memory mapped, opening it, reading a label's history and adding a record
+    take microseconds so it can be used on every run. The helpers work on the last window records of a label
+    and are vectorized with numpy if the check has imported it.
+
+        with PerfDataHistory(historyPath("Latency", args)) as history:
+            average = history.movingAverage('latency', window=12)
+            history.record({'latency': latency})
+        if average is not None and latency > average * 3:
+            plugin.setState(plugin.STATE_WARNING)
+    """
+
+    def __init__(self, path, size=288, max_labels=64):
+        """
+        Args:
+            path (str): Path of the history file, see historyPath()
+            size (int, optional): Records kept for each label, older records are overwritten. Defaults to 288,
+                a day of runs every five minutes.
+            max_labels (int, optional): Labels the file has room for. Defaults to 64.
+
+        Raises:
+            ValueError: If size or max_labels is less than 1
+        """
+        if size < 1 or max_labels < 1:
+            raise ValueError("size and max_labels must be at least 1")
+        self.path = path
+        self.size = size
+        self.max_labels = max_labels
+        self._timestamps_offset = _HEADER_BYTES + max_labels * LABEL_BYTES
+        self._values_offset = self._timestamps_offset + size * _FLOAT.size
+        self._file_size = self._values_offset + max_labels * size * _FLOAT.size
+        self._mmap = None
+        self._floats = None
+        self._open()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
+
+    def __len__(self):
+        return self._count
+
+    def __contains__(self, label):
+        return label in self._columns
+
+    @property
+    def labels(self):
+        return list(self._columns)
+
+    def _open(self):
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, exist_ok=True)
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            if os.fstat(fd).st_size != self._file_size:
+                self._create(fd)
+            self._mmap = mmap.mmap(fd, self._file_size)
+        finally:
+            os.close(fd)
+
+        magic, version, max_labels, size, self._next, self._count, label_count = _HEADER.unpack_from(self._mmap, 0)
+        if magic != _MAGIC or version != _VERSION or max_labels != self.max_labels or size != self.size:
+            # A corrupt or resized history file only costs the history
+            logger.warning(f"Starting new history file {self.path}, it is unreadable or has a different size")
+            self._mmap.close()
+            fd = os.open(self.path, os.O_RDWR)
+            try:
+                self._create(fd)
+                self._mmap = mmap.mmap(fd, self._file_size)
+            finally:
+                os.close(fd)
+            self._next, self._count, label_count = 0, 0, 0
+
+        self._columns = {}
+        for column in range(label_count):
+            offset = _HEADER_BYTES + column * LABEL_BYTES
+            label = self._mmap[offset:offset + LABEL_BYTES].rstrip(b"\0").decode('utf-8', 'replace')
+            self._columns[label] = column
+        self._floats = memoryview(self._mmap).cast('d')
+
+    def _create(self, fd):
+        # Every value starts as NaN, written in one go
+        os.ftruncate(fd, 0)
+        header = _HEADER.pack(_MAGIC, _VERSION, self.max_labels, self.size, 0, 0, 0).ljust(_HEADER_BYTES, b"\0")
+        data = header + bytes(self.max_labels * LABEL_BYTES) + _NAN * (self.size * (self.max_labels + 1))
+        os.pwrite(fd, data, 0)
+
+    def _writeHeader(self):
+        _HEADER.pack_into(self._mmap, 0, _MAGIC, _VERSION, self.max_labels, self.size,
+                          self._next, self._count, len(self._columns))
+
+    def _addLabel(self, label):
+        encoded = label.encode('utf-8')
+        if len(encoded) > LABEL_BYTES:
+            logger.warning(f"Not keeping history for {label}, labels can be {LABEL_BYTES} bytes at most")
+            return None
+        if len(self._columns) < self.max_labels:
+            column = len(self._columns)
+        else:
+            # Reuse the column of a label that hasn't been recorded for a whole ring
+            column = next((column for old_label, column in self._columns.items()
+                           if all(math.isnan(value) for value in self._column(column))), None)
+            if column is None:
+                logger.warning(f"Not keeping history for {label}, the history file has room for {self.max_labels} labels")
+                return None
+            self._columns = {old_label: old_column for old_label, old_column in self._columns.items()
+                             if old_column != column}
+        offset = _HEADER_BYTES + column * LABEL_BYTES
+        self._mmap[offset:offset + LABEL_BYTES] = encoded.ljust(LABEL_BYTES, b"\0")
+        self._columns[label] = column
+        return column
+
+    def _column(self, column):
+        start = (self._values_offset // _FLOAT.size) + column * self.size
+        return self._floats[start:start + self.size]
+
+    def record(self, values, timestamp=None):
+        """Adds one record, the values of this run. Labels without a value in this run are stored as missing.
+
+        Args:
+            values (dict or iterable): Dict of label to value or (label, value) pairs
+            timestamp (float, optional): Time of the run. Defaults to now.
+        """
+        if timestamp is None:
+            timestamp = time.time()
+        if isinstance(values, dict):
+            values = values.items()
+        slot = self._next
+        row = {}
+        for label, value in values:
+            column = self._columns.get(label)
+            if column is None:
+                column = self._addLabel(label)
+                if column is None:
+                    continue
+            row[column] = float(value)
+
+        floats = self._floats
+        values_start = self._values_offset // _FLOAT.size
+        for column in self._columns.values():
+            floats[values_start + column * self.size + slot] = row.get(column, math.nan)
+        floats[self._timestamps_offset // _FLOAT.size + slot] = timestamp
+        self._next = (slot + 1) % self.size
+        self._count = min(self._count + 1, self.size)
+        self._writeHeader()
+        if plugin_logging.debug_enabled:
+            logger.debug(f"Recorded {len(row)} values in {self.path}")
+
+    def recordPlugin(self, plugin, timestamp=None):
+        """Adds one record with the numeric performance data points set with setPerformanceData()
+
+        Args:
+            plugin (MonitoringPlugin): Plugin to record
+            timestamp (float, optional): Time of the run. Defaults to now.
+        """
+        from .monitoring_plugins import PerfDataPoint
+        values = {}
+        for point in plugin._performance_data:
+            if isinstance(point, PerfDataPoint):
+                try:
+                    values[str(point.label)] = float(point.value)
+                except (TypeError, ValueError):
+                    pass
+        self.record(values, timestamp)
+
+    def _window(self, floats_start, window):
+        # The last window slots oldest first, as a numpy array if the check has imported numpy
+        count = self._count if window is None else min(window, self._count)
+        start = floats_start + (self._next - count) % self.size
+        end = floats_start + self._next
+        numpy = _numpy()
+        if numpy is not None:
+            ring = numpy.frombuffer(self._mmap, dtype=float, count=self.size, offset=floats_start * _FLOAT.size)
+            start, end = start - floats_start, end - floats_start
+            if count == 0:
+                return ring[:0].copy()
+            if start < end:
+                return ring[start:end].copy()
+            return numpy.concatenate((ring[start:], ring[:end]))
+        if count == 0:
+            return []
+        if start < end:
+            return self._floats[start:end].tolist()
+        return self._floats[start:floats_start + self.size].tolist() + self._floats[floats_start:end].tolist()
+
+    def timestamps(self, window=None):
+        """Returns the times of the last window records, oldest first
+
+        Args:
+            window (int, optional): Number of records. Defaults to None for all of them.
+
+        Returns:
+            list or numpy.ndarray: Timestamps
+        """
+        return self._window(self._timestamps_offset // _FLOAT.size, window)
+
+    def values(self, label, window=None):
+        """Returns a label's values from the last window records, oldest first, records without the label are NaN
+
+        Args:
+            label (str): Performance data label
+            window (int, optional): Number of records. Defaults to None for all of them.
+
+        Returns:
+            list or numpy.ndarray: Values, empty if the label has no history
+        """
+        column = self._columns.get(label)
+        if column is None:
+            return self._window(0, 0)
+        return self._window(self._values_offset // _FLOAT.size + column * self.size, window)
+
+    def movingAverage(self, label, window=None):
+        """Returns the mean of a label's values in the last window records
+
+        Args:
+            label (str): Performance data label
+            window (int, optional): Number of records. Defaults to None for all of them.
+
+        Returns:
+            float: Mean, None if there are no values
+        """
+        values = self.values(label, window)
+        numpy = _numpy()
+        if numpy is not None:
+            values = values[~numpy.isnan(values)]
+            return float(values.mean()) if len(values) else None
+        values = [value for value in values if value == value]
+        return math.fsum(values) / len(values) if values else None
+
+    def percentile(self, label, q, window=None):
+        """Returns a percentile of a label's values in the last window records, interpolated like numpy.percentile()
+
+        Args:
+            label (str): Performance data label
+            q (float): Percentile from 0 to 100
+            window (int, optional): Number of records. Defaults to None for all of them.
+
+        Raises:
+            ValueError: If q isn't from 0 to 100
+
+        Returns:
+            float: Percentile, None if there are no values
+        """
+        if not 0 <= q <= 100:
+            raise ValueError(f"Percentile must be from 0 to 100, not {q}")
+        values = self.values(label, window)
+        numpy = _numpy()
+        if numpy is not None:
+            values = values[~numpy.isnan(values)]
+            return float(numpy.percentile(values, q)) if len(values) else None
+        values = [value for value in values if value == value]
+        return _percentile(values, q) if values else None
+
+    def rateOfChange(self, label, window=None):
+        """Returns how fast a label's value changed per second from its oldest to its newest value in the last window records
+
+        Args:
+            label (str): Performance data label
+            window (int, optional): Number of records. Defaults to None for all of them.
+
+        Returns:
+            float: Change per second, None if there are less than two values or no time passed between them
+        """
+        values = self.values(label, window)
+        timestamps = self.timestamps(window)
+        numpy = _numpy()
+        if numpy is not None:
+            present = ~numpy.isnan(values)
+            values, timestamps = values[present], timestamps[present]
+        else:
+            pairs = [(timestamp, value) for timestamp, value in zip(timestamps, values) if value == value]
+            timestamps = [timestamp for timestamp, _ in pairs]
+            values = [value for _, value in pairs]
+        if len(values) < 2 or timestamps[-1] <= timestamps[0]:
+            return None
+        return float((values[-1] - values[0]) / (timestamps[-1] - timestamps[0]))
+
+    def close(self):
+        """Closes the history file, records are already in the file and the kernel writes them to disk
+        """
+        if self._mmap is not None:
+            self._floats.release()
+            self._mmap.close()
+            self._mmap = None
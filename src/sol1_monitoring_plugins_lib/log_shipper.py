@@ -0,0 +1,335 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+import argparse
+import glob
+import gzip
+import os
+import queue
+import re
+import shutil
+import signal
+import socket
+import sys
+import threading
+import time
+from datetime import datetime
+
+from .logging import DEFAULT_LOG_SHIPPER_SOCKET
+
+DEFAULT_LOG_FILE = '/var/log/icinga2/check_monitoring.log'
+
+# Largest record the collector reads, bigger records are written straight to the log file by the check
+MAX_RECORD_BYTES = 65536
+
+_DURATION_UNITS = {'second': 1, 'minute': 60, 'hour': 3600, 'day': 86400, 'week': 604800, 'month': 2592000}
+_SIZE_UNITS = {'b': 1, 'kb': 1000, 'mb': 1000 ** 2, 'gb': 1000 ** 3, 'kib': 1024, 'mib': 1024 ** 2, 'gib': 1024 ** 3}
+_POLICY = re.compile(r'^\s*(\d+(?:\.\d+)?)\s*([a-z]+?)s?\s*$')
+# loguru keeps the time it started a log file in this extended attribute on Linux, the collector sets and reads the
+# same one so files rotated by either keep their rotation time across restarts
+_STARTED_XATTR = b"user.loguru_crtime"
+_ROTATED_TIME_FORMAT = '%Y-%m-%d_%H-%M-%S_%f'
+
+
+def parsePolicy(policy):
+    """Parses a loguru style rotation or retention policy such as '1 day', '12 hours' or '50 MB'
+
+    Args:
+        policy (str or int): Policy, an int is a number of files for retention
+
+    Raises:
+        ValueError: If the policy isn't a duration, size or number
+
+    Returns:
+        tuple: ('seconds', float), ('bytes', int) or ('count', int)
+    """
+    if isinstance(policy, int):
+        return ('count', policy)
+    text = str(policy).strip().lower()
+    if text.isdigit():
+        return ('count', int(text))
+    match = _POLICY.match(text)
+    if match:
+        value, unit = float(match.group(1)), match.group(2)
+        if unit in _DURATION_UNITS:
+            return ('seconds', value * _DURATION_UNITS[unit])
+        if unit in _SIZE_UNITS:
+            return ('bytes', int(value * _SIZE_UNITS[unit]))
+    raise ValueError(f"Unsupported log policy {policy!r}, use a duration such as '1 day' or a size such as '50 MB'")
+
+
+def _applyRetentionPolicy(paths, retention):
+    """Removes the files a retention policy from parsePolicy() expires, the oldest first
+
+    Args:
+        paths (list): Rotated log files, callers pass only compressed files so a file being compressed is never removed
+        retention (tuple): Policy from parsePolicy()
+    """
+    rotated = sorted(paths, key=os.path.getmtime)
+    kind, limit = retention
+    if kind == 'count':
+        expired = rotated[:max(0, len(rotated) - limit)]
+    elif kind == 'seconds':
+        expired = [path for path in rotated if time.time() - os.path.getmtime(path) > limit]
+    else:
+        # Keep the newest files that fit in the size limit
+        expired, total = [], 0
+        for path in reversed(rotated):
+            total += os.path.getsize(path)
+            if total > limit:
+                expired.append(path)
+    for path in expired:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+def _appendToFile(path, data):
+    # O_APPEND writes from many processes don't overwrite each other
+    fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+    try:
+        os.write(fd, data)
+    finally:
+        os.close(fd)
+
+
+class LogShipperSink:
+    """loguru sink that sends each formatted record as one datagram to the log collector. If the collector
+    can't take a record, because it isn't running, is too slow or the record is too big, the record is
+    appended to the log file directly so it isn't lost and the check never waits on the collector.
+    """
+
+    def __init__(self, socket_path, log_file):
+        """
+        Args:
+            socket_path (str): Path of the collector's UNIX datagram socket
+            log_file (str): Log file used when the collector can't take a record
+
+        Raises:
+            OSError: If the collector isn't listening on socket_path
+        """
+        self.socket_path = socket_path
+        self.log_file = log_file
+        self._socket = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        try:
+            self._socket.connect(socket_path)
+        except OSError:
+            self._socket.close()
+            raise
+        self._socket.setblocking(False)
+
+    def write(self, message):
+        data = str(message).encode('utf-8')
+        if len(data) <= MAX_RECORD_BYTES:
+            try:
+                self._socket.send(data)
+                return
+            except OSError:
+                pass
+        _appendToFile(self.log_file, data)
+
+    def stop(self):
+        self._socket.close()
+
+
+class LogCollector:
+    """Receives formatted log records from checks over a UNIX datagram socket and writes them to one log file
+    in batches, rotating the file and gzipping rotated files in the background.
+
+    Rotated files are named like loguru names them, {name}.{YYYY-MM-DD_HH-MM-SS_ffffff}{ext}, so the retention
+    policy also cleans up files rotated by checks that wrote to the file directly.
+    """
+
+    def __init__(self, socket_path=DEFAULT_LOG_SHIPPER_SOCKET, log_file=DEFAULT_LOG_FILE, log_rotate='1 day',
+                 log_retention='3 days', flush_interval=1.0, batch_size=1000, socket_mode=0o660):
+        """
+        Args:
+            socket_path (str, optional): Path of the UNIX datagram socket. Defaults to DEFAULT_LOG_SHIPPER_SOCKET.
+            log_file (str, optional): Log file to write. Defaults to DEFAULT_LOG_FILE.
+            log_rotate (str, optional): Rotation policy, a duration or size. Defaults to '1 day'.
+            log_retention (str or int, optional): Retention policy, a duration or number of files. Defaults to '3 days'.
+            flush_interval (float, optional): Most seconds a record waits before it is written. Defaults to 1.0.
+            batch_size (int, optional): Records written at once when they arrive faster. Defaults to 1000.
+            socket_mode (int, optional): Permissions of the socket so checks run as other users can log. Defaults to 0o660.
+        """
+        self.socket_path = socket_path
+        self.log_file = log_file
+        self.rotation = parsePolicy(log_rotate)
+        self.retention = parsePolicy(log_retention)
+        if self.rotation[0] == 'count':
+            raise ValueError(f"Unsupported rotation policy {log_rotate!r}, use a duration or size")
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.socket_mode = socket_mode
+        self._socket = None
+        self._file = None
+        self._file_started = None
+        self._running = False
+        # Rotated files are compressed one at a time by one worker so retention never removes a file being compressed
+        self._compress_queue = queue.Queue()
+        self._compress_thread = None
+
+    def _bind(self):
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+        self._socket = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self._socket.bind(self.socket_path)
+        os.chmod(self.socket_path, self.socket_mode)
+        self._socket.settimeout(self.flush_interval)
+
+    def _openLogFile(self):
+        directory = os.path.dirname(os.path.abspath(self.log_file))
+        os.makedirs(directory, exist_ok=True)
+        existing = os.path.exists(self.log_file)
+        self._file = open(self.log_file, 'ab')
+        # An existing file carries on from when it was started so a restarted collector still rotates on time
+        started = self._fileStarted() if existing else None
+        if started is None:
+            started = time.time()
+            self._setFileStarted(started)
+        self._file_started = min(time.time(), started)
+
+    def _fileStarted(self):
+        # st_ctime changes on every write, so the start is the birth time where the platform has one, the time
+        # loguru or the collector recorded or, as the file was started when the last one was rotated, the time
+        # in the newest rotated file name. None if the file was never rotated and nothing was recorded.
+        started = getattr(os.stat(self.log_file), 'st_birthtime', None)
+        if started is None and hasattr(os, 'getxattr'):
+            try:
+                started = float(os.getxattr(self.log_file, _STARTED_XATTR))
+            except (OSError, ValueError):
+                pass
+        if started is None:
+            started = self._lastRotated()
+        return started
+
+    def _setFileStarted(self, started):
+        if hasattr(os, 'setxattr'):
+            try:
+                os.setxattr(self.log_file, _STARTED_XATTR, str(started).encode('ascii'))
+            except OSError:
+                # Not every file system has extended attributes, the rotated file names are used after the first rotation
+                pass
+
+    def _lastRotated(self):
+        stem, extension = os.path.splitext(self.log_file)
+        prefix = os.path.basename(stem) + '.'
+        latest = None
+        for path in glob.glob(glob.escape(stem) + '.*' + glob.escape(extension) + '*'):
+            stamp = os.path.basename(path)[len(prefix):].split('.', 1)[0]
+            try:
+                rotated = datetime.strptime(stamp, _ROTATED_TIME_FORMAT).timestamp()
+            except ValueError:
+                continue
+            if latest is None or rotated > latest:
+                latest = rotated
+        return latest
+
+    def _shouldRotate(self):
+        kind, limit = self.rotation
+        if kind == 'bytes':
+            return self._file.tell() >= limit
+        return time.time() - self._file_started >= limit
+
+    def _rotatedName(self):
+        stem, extension = os.path.splitext(self.log_file)
+        return f"{stem}.{datetime.now().strftime(_ROTATED_TIME_FORMAT)}{extension}"
+
+    def rotate(self):
+        """Closes the log file, renames it and compresses it in the background, then starts a new file
+        """
+        self._file.close()
+        rotated = self._rotatedName()
+        os.rename(self.log_file, rotated)
+        self._openLogFile()
+        if self._compress_thread is None:
+            self._compress_thread = threading.Thread(target=self._compressWorker, daemon=True)
+            self._compress_thread.start()
+        self._compress_queue.put(rotated)
+
+    def _compressWorker(self):
+        while True:
+            path = self._compress_queue.get()
+            try:
+                self._compress(path)
+            except OSError as e:
+                # The rotated file is still there uncompressed, it isn't lost
+                print(f"Unable to compress rotated log file {path}: {e}", file=sys.stderr)
+            finally:
+                self._compress_queue.task_done()
+
+    def _compress(self, path):
+        with open(path, 'rb') as f_in, gzip.open(path + '.gz', 'wb') as f_out:
+            shutil.copyfileobj(f_in, f_out)
+        os.remove(path)
+        self._applyRetention()
+
+    def _applyRetention(self):
+        # Only compressed files, a rotated file that isn't compressed yet is never removed
+        stem, extension = os.path.splitext(self.log_file)
+        _applyRetentionPolicy(glob.glob(glob.escape(stem) + '.*' + glob.escape(extension) + '.gz'), self.retention)
+
+    def _writeBatch(self, batch):
+        if not batch:
+            return
+        self._file.write(b"".join(batch))
+        self._file.flush()
+        if self._shouldRotate():
+            self.rotate()
+
+    def serveForever(self):
+        """Receives and writes records until stop() is called or the process gets SIGTERM or SIGINT
+        """
+        self._bind()
+        self._openLogFile()
+        self._running = True
+        batch = []
+        flush_at = time.monotonic() + self.flush_interval
+        try:
+            while self._running:
+                try:
+                    batch.append(self._socket.recv(MAX_RECORD_BYTES))
+                except socket.timeout:
+                    pass
+                except OSError:
+                    if self._running:
+                        raise
+                    break
+                if len(batch) >= self.batch_size or time.monotonic() >= flush_at:
+                    self._writeBatch(batch)
+                    batch = []
+                    flush_at = time.monotonic() + self.flush_interval
+        finally:
+            self._writeBatch(batch)
+            self._file.close()
+            self._socket.close()
+            if os.path.exists(self.socket_path):
+                os.unlink(self.socket_path)
+            # Finish compressing the rotated files before exiting
+            self._compress_queue.join()
+
+    def stop(self):
+        """Stops serveForever() after it writes the records it has
+        """
+        self._running = False
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Collect monitoring check logs sent to a UNIX socket into one log file.')
+    parser.add_argument('--socket', type=str, default=DEFAULT_LOG_SHIPPER_SOCKET, help="The path to the UNIX socket")
+    parser.add_argument('--log-file', type=str, default=DEFAULT_LOG_FILE, help="The path to the log file")
+    parser.add_argument('--log-rotate', type=str, default='1 day', help="The log file rotation policy")
+    parser.add_argument('--log-retention', type=str, default='3 days', help="The log file retention policy")
+    parser.add_argument('--flush-interval', type=float, default=1.0, help="Most seconds a record waits to be written")
+    args = parser.parse_args(argv)
+
+    collector = LogCollector(socket_path=args.socket, log_file=args.log_file, log_rotate=args.log_rotate,
+                             log_retention=args.log_retention, flush_interval=args.flush_interval)
+    for signum in (signal.SIGTERM, signal.SIGINT):
+        signal.signal(signum, lambda signum, frame: collector.stop())
+    collector.serveForever()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,189 @@
 
 import os
 import sys
-from loguru import logger
+import threading
+import time
 
 DEFAULT_LOG_LEVELS = ['TRACE', 'DEBUG', 'INFO', 'SUCCESS', 'WARNING', 'ERROR', 'CRITICAL']
+DEFAULT_LOG_SHIPPER_SOCKET = '/run/icinga2/sol1_log_shipper.sock'
+
+_FILE_LOG_FORMAT = "<blue>{time:YYYY-MM-DD HH:mm:ss.SSS}</blue> <yellow>({process.id})</yellow> <level>{level}</level>: {message}"
+
+# Cached level checks so library hot paths can skip building log messages nobody will see.
+# loguru starts with a DEBUG sink on standard error so everything is enabled until initLogging() runs.
+debug_enabled = True
+info_enabled = True
+# Set when the file sink writes from a background queue that must be flushed before the check exits
+log_queue_enabled = False
+# Seconds the last initLogging() call took, reported by MonitoringPlugin.enableSelfTiming()
+init_logging_seconds = None
+
+# Set by initLogging() when debug messages are sampled or rate limited
+_sampler = None
+
+# Run by a detached python process so gzipping a rotated log file doesn't hold up the check
+_COMPRESS_SCRIPT = """
+import gzip, os, shutil, sys
+with open(sys.argv[1], 'rb') as f_in, gzip.open(sys.argv[1] + '.gz', 'wb') as f_out:
+    shutil.copyfileobj(f_in, f_out)
+os.remove(sys.argv[1])
+"""
+
+
+class _LazyLogger:
+    """Stands in for the loguru logger so loguru is only imported once logging is set up or something is logged
+    """
+    __slots__ = ()
+
+    def __getattr__(self, name):
+        global _remove_default_sink
+        from loguru import logger as loguru_logger
+        if _remove_default_sink:
+            _remove_default_sink = False
+            loguru_logger.remove()
+        return getattr(loguru_logger, name)
+
+
+# Set when initLogging() ran without any sinks before loguru was imported
+_remove_default_sink = False
+
+
+logger = _LazyLogger()
+
+
+class _LogSampler:
+    """loguru filter that thins out DEBUG and TRACE messages per call site so debug runs over many items
+    stay representative without writing every message. A message is kept only if every enabled limit keeps it,
+    messages at INFO and above are always kept. Suppressed messages are counted and reported by logSuppressed().
+    """
+
+    def __init__(self, sample=1, rate_limit=None, first=None):
+        """
+        Args:
+            sample (int, optional): Keep 1 in sample messages from each call site. Defaults to 1 which keeps every message.
+            rate_limit (float, optional): Most messages a second from each call site, bursts of up to one second's worth
+                are kept, or a single message for limits below one a second. Defaults to None for no limit.
+            first (int, optional): Keep only the first messages from each call site. Defaults to None for no limit.
+        """
+        self.sample = max(1, int(sample or 1))
+        self.rate_limit = rate_limit
+        # Limits below one a second still need room for a whole message
+        self._capacity = None if rate_limit is None else max(1.0, rate_limit)
+        self.first = first
+        self._debug_no = logger.level('DEBUG').no
+        # call site: [seen, suppressed, tokens, last refill]
+        self._sites = {}
+        self._lock = threading.Lock()
+        # Every sink filters the same record, it is only counted once
+        self._last_record = None
+        self._last_result = True
+
+    def __call__(self, record):
+        if record['level'].no > self._debug_no:
+            return True
+        with self._lock:
+            if record is self._last_record:
+                return self._last_result
+            site = (record['name'], record['function'], record['line'])
+            counts = self._sites.get(site)
+            if counts is None:
+                counts = self._sites[site] = [0, 0, self._capacity, time.monotonic()]
+            counts[0] += 1
+            keep = (counts[0] - 1) % self.sample == 0
+            if keep and self.first is not None and counts[0] - counts[1] > self.first:
+                keep = False
+            if keep and self.rate_limit is not None:
+                now = time.monotonic()
+                counts[2] = min(self._capacity, counts[2] + (now - counts[3]) * self.rate_limit)
+                counts[3] = now
+                if counts[2] >= 1:
+                    counts[2] -= 1
+                else:
+                    keep = False
+            if not keep:
+                counts[1] += 1
+            self._last_record = record
+            self._last_result = keep
+            return keep
+
+    def suppressed(self):
+        """
+        Returns:
+            dict: (module, function, line) call site: (messages seen, messages suppressed) for call sites with suppressed messages
+        """
+        with self._lock:
+            return {site: (counts[0], counts[1]) for site, counts in self._sites.items() if counts[1]}
+
+    def logSuppressed(self):
+        """Logs how many messages each call site had suppressed at INFO, then starts counting again
+        """
+        suppressed = self.suppressed()
+        with self._lock:
+            for site in suppressed:
+                self._sites[site][:2] = [0, 0]
+        for (name, function, line), (seen, count) in sorted(suppressed.items()):
+            logger.info(f"Suppressed {count} of {seen} debug messages from {name}:{function}:{line}")
+
+
+def _compressInBackground(path):
+    import subprocess
+    subprocess.Popen([sys.executable, '-c', _COMPRESS_SCRIPT, path],
+                     stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+                     close_fds=True, start_new_session=True)
+
+
+def _compressedRetention(log_retention):
+    """Returns a loguru retention function that only removes compressed files. loguru applies retention as soon as
+    _compressInBackground() has started the gzip, the rotated .log file is still being read and must be kept.
+
+    Args:
+        log_retention (str or int or datetime.timedelta): Retention policy, a duration or number of files
+
+    Raises:
+        ValueError: If the policy isn't a duration or number of files
+    """
+    from .log_shipper import _applyRetentionPolicy, parsePolicy
+    if hasattr(log_retention, 'total_seconds'):
+        retention = ('seconds', log_retention.total_seconds())
+    else:
+        retention = parsePolicy(log_retention)
+    if retention[0] == 'bytes':
+        raise ValueError(f"Cannot parse retention from: {log_retention!r}")
+
+    def retain(logs):
+        _applyRetentionPolicy([log for log in logs if log.endswith('.gz')], retention)
+    return retain
+
+
+def flushLogging():
+    """
+    Waits for queued log messages to be written, MonitoringPlugin.exit() calls this before exiting.
+    Also logs how many debug messages were suppressed when initLogging() sampled or rate limited them.
+    """
+    if _sampler is not None:
+        _sampler.logSuppressed()
+    if log_queue_enabled:
+        logger.complete()
+
+
+def setLibraryLogLevel(level):
+    """
+    Sets the lowest log level the library builds log messages for, initLogging() calls this for you.
+    Call it yourself if you add or remove loguru sinks after initLogging().
+
+    Args:
+        level (str or int): Log level name or number, None if nothing is logged.
+    """
+    global debug_enabled, info_enabled
+    if level is None:
+        debug_enabled = info_enabled = False
+        return
+    if isinstance(level, int):
+        level_no = level
+    else:
+        level_no = logger.level(str(level).upper()).no
+    debug_enabled = level_no <= logger.level('DEBUG').no
+    info_enabled = level_no <= logger.level('INFO').no
 
 
 def initLoggingArgparse(parser,
@@ -12,6 +192,10 @@ def initLoggingArgparse(parser,
                         log_retention='3 days',
                         log_level='WARNING',
                         available_log_levels=DEFAULT_LOG_LEVELS,
+                        log_shipper_socket=DEFAULT_LOG_SHIPPER_SOCKET,
+                        log_sample=1,
+                        log_rate_limit=None,
+                        log_first=None,
                         ):
     """
     Initalize argparse arguments for logging, you can change the argparse argument defaults with the function arguments
@@ -23,6 +207,10 @@ def initLoggingArgparse(parser,
         log_retention (str, optional): Override default argument value for --log-retention. Defaults to '3 days'.
         log_level (str, optional): Override default argument value for --log-level. Defaults to 'WARNING'.
         available_log_levels (list, optional): Override default argument value for --available-log-levels. Defaults to DEFAULT_LOG_LEVELS.
+        log_shipper_socket (str, optional): Override default argument value for --log-shipper-socket. Defaults to DEFAULT_LOG_SHIPPER_SOCKET.
+        log_sample (int, optional): Override default argument value for --log-sample. Defaults to 1.
+        log_rate_limit (float, optional): Override default argument value for --log-rate-limit. Defaults to None.
+        log_first (int, optional): Override default argument value for --log-first. Defaults to None.
     """
     parser.add_argument('--debug', action="store_true", help="Sets the log level to DEBUG.")
     parser.add_argument('--enable-screen-debug', action="store_true", help="Enables screen logging to standard error.")
@@ -32,6 +220,18 @@ def initLoggingArgparse(parser,
     parser.add_argument('--log-retention', type=str, default=log_retention, help="The log file retention policy")
     parser.add_argument('--log-level', type=str, choices=available_log_levels,
                         default=log_level, help="The logging level")
+    parser.add_argument('--enable-log-queue', action="store_true",
+                        help="Writes the log file from a background queue and compresses rotated logs in the background")
+    parser.add_argument('--enable-log-shipper', action="store_true",
+                        help="Sends log messages to the log collector process, falls back to the log file if it isn't running")
+    parser.add_argument('--log-shipper-socket', type=str, default=log_shipper_socket,
+                        help="The path to the log collector's UNIX socket")
+    parser.add_argument('--log-sample', type=int, default=log_sample,
+                        help="Log 1 in N debug messages from each line of code")
+    parser.add_argument('--log-rate-limit', type=float, default=log_rate_limit,
+                        help="Most debug messages a second from each line of code")
+    parser.add_argument('--log-first', type=int, default=log_first,
+                        help="Log only the first N debug messages from each line of code")
 
 
 def initLogging(debug=False,
@@ -42,6 +242,12 @@ def initLogging(debug=False,
                 log_retention='3 days',
                 log_level='WARNING',
                 available_log_levels=DEFAULT_LOG_LEVELS,
+                enable_log_queue=False,
+                enable_log_shipper=False,
+                log_shipper_socket=DEFAULT_LOG_SHIPPER_SOCKET,
+                log_sample=1,
+                log_rate_limit=None,
+                log_first=None,
                 **kwargs
                 ):
     """
@@ -58,8 +264,18 @@ def initLogging(debug=False,
         log_retention (str, optional): The log file retention policy. Defaults to '3 days'.
         log_level (str, optional): The logging level. Defaults to 'WARNING'.
         available_log_levels (list, optional): A list of available logging levels. Aliased as available_log_levels. Defaults to DEFAULT_LOG_LEVELS.
+        enable_log_queue (bool, optional): If True, log calls hand messages to a background writer instead of writing to the file
+            and rotated files are compressed by a detached process. Defaults to False.
+        enable_log_shipper (bool, optional): If True, log messages are sent to the log collector process which writes, rotates
+            and compresses the log file for every check. Falls back to the log file if the collector isn't running. Defaults to False.
+        log_shipper_socket (str, optional): The path to the log collector's UNIX socket. Defaults to DEFAULT_LOG_SHIPPER_SOCKET.
+        log_sample (int, optional): Log 1 in log_sample DEBUG and TRACE messages from each call site. Defaults to 1.
+        log_rate_limit (float, optional): Most DEBUG and TRACE messages a second from each call site. Defaults to None.
+        log_first (int, optional): Log only the first log_first DEBUG and TRACE messages from each call site. Defaults to None.
+            Suppressed messages are counted and the counts are logged at INFO by flushLogging() when the check exits.
 
     """
+    start = time.perf_counter()
     #
     # Legacy vars, will override function args if they exist
     # If true screen logging is added to standard error
@@ -77,16 +293,34 @@ def initLogging(debug=False,
     if log_level not in available_log_levels:
         log_level = 'INFO'
 
+    global log_queue_enabled, _remove_default_sink, init_logging_seconds, _sampler
+
+    if not enable_screen_debug and not enable_log_file and 'loguru' not in sys.modules:
+        # Nothing will be logged so don't pay for importing loguru, if it is imported later the default sink is removed
+        _remove_default_sink = True
+        log_queue_enabled = False
+        _sampler = None
+        setLibraryLogLevel(None)
+        init_logging_seconds = time.perf_counter() - start
+        return
+
     # Because the library comes with a logger to std.err initalized and we get rid of that
     logger.remove()
+    log_queue_enabled = False
+    _sampler = None
+    if (log_sample or 1) > 1 or log_rate_limit is not None or log_first is not None:
+        _sampler = _LogSampler(log_sample, log_rate_limit, log_first)
+    sink_levels = []
     # Now add the screen std.err logger back using the right log level
     if enable_screen_debug:
         logger.add(sys.stderr, colorize=True,
                    level='DEBUG',
                    backtrace=True,
                    diagnose=True,
+                   filter=_sampler,
                    format="<blue>{time:YYYY-MM-DD HH:mm:ss.SSS}</blue> <cyan>{name}</cyan>:<cyan>{function}</cyan>:<cyan>{line}</cyan> <level>{level}</level>: {message}"
                    )
+        sink_levels.append(logger.level('DEBUG').no)
 
     # Add file logging if required
     if enable_log_file:
@@ -95,13 +329,39 @@ def initLogging(debug=False,
                 print("Permissions error, unable to write to log file ({})".format(log_file))
                 sys.exit(os.EX_CONFIG)
 
-        logger.add(log_file, colorize=True,
-                   format="<blue>{time:YYYY-MM-DD HH:mm:ss.SSS}</blue> <yellow>({process.id})</yellow> <level>{level}</level>: {message}",
-                   level=log_level,
-                   rotation=log_rotate,
-                   retention=log_retention,
-                   compression="gz"
-                   )
-    
+        shipper = None
+        if enable_log_shipper:
+            from .log_shipper import LogShipperSink
+            try:
+                shipper = LogShipperSink(log_shipper_socket, log_file)
+            except OSError as e:
+                shipper_error = e
+
+        if shipper is not None:
+            # The collector writes, rotates and compresses the file so the check only sends each message
+            logger.add(shipper, colorize=True,
+                       format=_FILE_LOG_FORMAT,
+                       level=log_level,
+                       filter=_sampler
+                       )
+        else:
+            logger.add(log_file, colorize=True,
+                       format=_FILE_LOG_FORMAT,
+                       level=log_level,
+                       rotation=log_rotate,
+                       retention=(_compressedRetention(log_retention)
+                                  if enable_log_queue and log_retention is not None and not callable(log_retention)
+                                  else log_retention),
+                       compression=_compressInBackground if enable_log_queue else "gz",
+                       enqueue=enable_log_queue,
+                       filter=_sampler
+                       )
+            log_queue_enabled = enable_log_queue
+            if enable_log_shipper:
+                logger.warning(f"Log collector isn't running on {log_shipper_socket}, writing to the log file: {shipper_error}")
+        sink_levels.append(logger.level(log_level).no)
+
+    setLibraryLogLevel(min(sink_levels) if sink_levels else None)
     logger.debug(
-        f"Log initalized with level: {log_level}, enable screen debug: {enable_screen_debug}, enable log file: {enable_log_file}, file: {log_file}, rotate: {log_rotate}, retention: {log_retention}")
+        f"Log initalized with level: {log_level}, enable screen debug: {enable_screen_debug}, enable log file: {enable_log_file}, file: {log_file}, rotate: {log_rotate}, retention: {log_retention}, queue: {enable_log_queue}, shipper: {enable_log_shipper}, sample: {log_sample}, rate limit: {log_rate_limit}, first: {log_first}")
+    init_logging_seconds = time.perf_counter() - start
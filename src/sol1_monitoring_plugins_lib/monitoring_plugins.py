@@ -1,7 +1,398 @@
 #!/usr/bin/env python
 # coding: utf-8
 
-from loguru import logger
+import os
+import sys
+import time
+from enum import IntEnum
+from functools import wraps
+from itertools import chain, repeat, starmap
+
+from . import logging as plugin_logging
+from .logging import logger
+
+
+class State(IntEnum):
+    """Monitoring plugin states, the exit codes the monitoring system expects.
+    They format as plain numbers so messages and logs read the same as with int states.
+    """
+    OK = 0          # We know it is OK and it isn't WARN or CRIT when set
+    WARNING = 1     # We know it is WARN and isn't CRIT when set
+    CRITICAL = 2    # We know it is CRIT
+    UNKNOWN = 3     # We don't know anything yet
+
+    __str__ = int.__repr__
+    __format__ = int.__format__
+
+    @property
+    def label(self):
+        return _STATE_LABEL[self]
+
+    @property
+    def prefix(self):
+        return _STATE_PREFIX[self]
+
+
+STATE_LABELS = ('OK', 'WARNING', 'CRITICAL', 'UNKNOWN')
+# Precomputed so getStateLabel() and setMessage() are a dict lookup, keys compare equal to ints
+_STATE_LABEL = {state: STATE_LABELS[state] for state in State}
+_STATE_PREFIX = {state: f"{STATE_LABELS[state].title()}: " for state in State}
+
+
+def _stateTransitions():
+    """Returns the state setState() moves to for each (requested state, current state) following the set*() rules"""
+    transitions = {}
+    for current in State:
+        # setOk() only replaces UNKNOWN
+        transitions[(State.OK, current)] = State.OK if current == State.UNKNOWN else current
+        # setWarning() doesn't replace CRITICAL
+        transitions[(State.WARNING, current)] = current if current == State.CRITICAL else State.WARNING
+        # setCritical() always sets CRITICAL
+        transitions[(State.CRITICAL, current)] = State.CRITICAL
+        # setState() doesn't use setUnknown(), UNKNOWN leaves the state unchanged
+        transitions[(State.UNKNOWN, current)] = current
+    return transitions
+
+
+_STATE_TRANSITIONS = _stateTransitions()
+
+# Icinga 2 keeps the plugin output in 64 KiB text columns in the IDO and Icinga DB databases, pass this
+# to exit(max_bytes=...) to keep long output from being cut off somewhere that breaks the perfdata
+MAX_OUTPUT_BYTES = 65535
+TRUNCATION_MARKER = "\n... output truncated\n"
+
+
+def initDeadlineArgparse(parser, timeout=None, timeout_state='UNKNOWN'):
+    """
+    Initalize argparse arguments for the check deadline, you can change the argparse argument defaults with the function arguments
+
+    Args:
+        parser (obj): Argparse parser object
+        timeout (float, optional): Override default argument value for --timeout. Defaults to None.
+        timeout_state (str, optional): Override default argument value for --timeout-state. Defaults to 'UNKNOWN'.
+    """
+    parser.add_argument('--timeout', type=float, default=timeout,
+                        help="Seconds the check has before it exits with what it has so far, keep it below the check_timeout")
+    parser.add_argument('--timeout-state', type=str.upper, choices=STATE_LABELS, default=timeout_state,
+                        help="The state the check exits with when it runs out of time")
+
+
+def initOutputArgparse(parser, output_format='text'):
+    """
+    Initalize the argparse argument for the check output format, you can change the argparse argument default with the function argument
+
+    Args:
+        parser (obj): Argparse parser object
+        output_format (str, optional): Override default argument value for --output-format. Defaults to 'text'.
+    """
+    parser.add_argument('--output-format', type=str.lower, choices=OUTPUT_FORMATS, default=output_format,
+                        help="Plugin output as text for the monitoring system or one line of JSON for collectors")
+
+
+def quoteLabel(label):
+    """Quotes a performance data label if it contains spaces, equals signs or single quotes.
+    Labels already in single quotes are left as they are so plugins that quote their own labels don't change.
+
+    Args:
+        label (str): Performance data label
+
+    Returns:
+        str: The label, in single quotes with single quotes doubled if it needs quoting
+    """
+    label = str(label)
+    if len(label) > 1 and label[0] == "'" and label[-1] == "'":
+        return label
+    if " " in label or "=" in label or "'" in label:
+        return "'" + label.replace("'", "''") + "'"
+    return label
+
+
+# label=value[UOM];[warn];[crit];[min];[max] followed by a space to separate points
+_PERFORMANCE_DATA_FORMAT = "{}={}{};{};{};{};{} "
+_performance_data_point = None
+_performance_data_fields = None
+
+
+def _performanceDataPoint():
+    """Returns the regex for label=value;warn;crit;min;max with the label optionally in single quotes, see quoteLabel().
+    Compiled on first use so importing the module doesn't import re, only max_bytes and reading perfdata back need it
+    """
+    global _performance_data_point
+    if _performance_data_point is None:
+        import re
+        _performance_data_point = re.compile(r"(?:'(?:[^']|'')*'|[^\s=']+)=\S*")
+    return _performance_data_point
+
+
+def _performanceDataFields():
+    """Returns the same regex as _performanceDataPoint() with each field in a group so rendered performance data
+    can be read back into points
+    """
+    global _performance_data_fields
+    if _performance_data_fields is None:
+        import re
+        _performance_data_fields = re.compile(r"('(?:[^']|'')*'|[^\s=']+)=([-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?|U)?"
+                                              r"([^;\s]*);?([^;\s]*);?([^;\s]*);?([^;\s]*);?([^;\s]*)")
+    return _performance_data_fields
+
+OUTPUT_FORMATS = ('text', 'json')
+
+
+def renderPerformanceData(label, value, unit_of_measurement="", warn="", crit="", minimum="", maximum=""):
+    """Renders one performance data point, the same format is used by every performance data method
+    """
+    return _PERFORMANCE_DATA_FORMAT.format(quoteLabel(label), value, unit_of_measurement, warn, crit, minimum, maximum)
+
+
+def _jsonValue(value):
+    """Returns a performance data value as a JSON number when it is one, None when it is empty and a string otherwise
+    """
+    if value is None or isinstance(value, (int, float)):
+        return value
+    if isinstance(value, str):
+        if value == "":
+            return None
+        try:
+            return int(value)
+        except ValueError:
+            pass
+        try:
+            return float(value)
+        except ValueError:
+            return value
+    # numpy scalars
+    item = getattr(value, 'item', None)
+    if item is not None:
+        return _jsonValue(item())
+    # Threshold ranges and anything else are kept as they render
+    return str(value)
+
+
+def _unquoteLabel(label):
+    if label.startswith("'") and label.endswith("'") and len(label) > 1:
+        return label[1:-1].replace("''", "'")
+    return label
+
+
+def _pointDict(label, value, unit_of_measurement, warn, crit, minimum, maximum):
+    return {'label': str(label), 'value': _jsonValue(value), 'uom': str(unit_of_measurement),
+            'warn': _jsonValue(warn), 'crit': _jsonValue(crit), 'min': _jsonValue(minimum), 'max': _jsonValue(maximum)}
+
+
+def parsePerformanceData(performance_data):
+    """Reads rendered performance data back into typed points, the inverse of renderPerformanceData()
+
+    Args:
+        performance_data (str): Performance data such as the performance_data property or exit(do_exit=False) returns
+
+    Returns:
+        list: A dict per point with label, value, uom, warn, crit, min and max, numbers are int or float
+            and empty fields are None
+    """
+    return [_pointDict(_unquoteLabel(label), value, *fields)
+            for label, value, *fields in _performanceDataFields().findall(performance_data.lstrip("|"))]
+
+
+_json_dumps = None
+
+
+def dumpsResult(result):
+    """Serializes a result from MonitoringPlugin.getResult() as one line of JSON, with orjson when it is installed
+
+    Args:
+        result (dict): Result to serialize
+
+    Returns:
+        str: JSON without a trailing new line
+    """
+    global _json_dumps
+    if _json_dumps is None:
+        try:
+            import orjson
+            _json_dumps = lambda obj: orjson.dumps(obj).decode('utf-8')
+        except ImportError:
+            # Imported here so checks with text output don't pay for it
+            import json
+            _json_dumps = lambda obj: json.dumps(obj, separators=(',', ':'))
+    return _json_dumps(result)
+
+
+class MessageLine:
+    """A piece of the plugin message added by setMessage(), kept as a record and rendered when the message is read
+    """
+    __slots__ = ('text', 'state', 'prefix')
+
+    def __init__(self, text, state=None, prefix=""):
+        self.text = text
+        self.state = state
+        self.prefix = prefix
+
+    def __str__(self):
+        return f"{self.prefix}{self.text}"
+
+    def toDict(self):
+        return {'text': str(self.text), 'state': None if self.state is None else int(self.state), 'prefix': self.prefix}
+
+
+class PerfDataPoint:
+    """A performance data point added by setPerformanceData(), kept as a record and rendered when the performance data is read
+    """
+    __slots__ = ('label', 'value', 'unit_of_measurement', 'warn', 'crit', 'minimum', 'maximum')
+
+    def __init__(self, label, value, unit_of_measurement="", warn="", crit="", minimum="", maximum=""):
+        self.label = label
+        self.value = value
+        self.unit_of_measurement = unit_of_measurement
+        self.warn = warn
+        self.crit = crit
+        self.minimum = minimum
+        self.maximum = maximum
+
+    def __str__(self):
+        return renderPerformanceData(self.label, self.value, self.unit_of_measurement,
+                                     self.warn, self.crit, self.minimum, self.maximum)
+
+    def toDict(self):
+        return _pointDict(self.label, self.value, self.unit_of_measurement,
+                          self.warn, self.crit, self.minimum, self.maximum)
+
+
+class _Deadline:
+    """Time budget set by MonitoringPlugin.setDeadline()
+    """
+    __slots__ = ('expires_at', 'seconds', 'state', 'message', 'callbacks', 'previous_handler', 'armed')
+
+    def __init__(self, expires_at, seconds, state, message, previous_handler, armed):
+        self.expires_at = expires_at
+        self.seconds = seconds
+        self.state = state
+        self.message = message
+        self.callbacks = []
+        # SIGALRM handler restored when the deadline is cancelled, armed is False if no signal was set
+        self.previous_handler = previous_handler
+        self.armed = armed
+
+
+class _SelfTiming:
+    """Section times and options set by MonitoringPlugin.enableSelfTiming()
+    """
+    __slots__ = ('prefix', 'sections', 'usage')
+
+    def __init__(self, prefix):
+        self.prefix = prefix
+        self.sections = {}
+        # Resource usage when self timing was enabled, so the run is reported and not everything the process used
+        self.usage = _resourceUsage()
+
+
+class _TimedSection:
+    """Context manager and decorator returned by MonitoringPlugin.timeSection(), it does nothing unless
+    self timing is enabled
+    """
+    __slots__ = ('plugin', 'name', 'start')
+
+    def __init__(self, plugin, name):
+        self.plugin = plugin
+        self.name = name
+        self.start = None
+
+    def __enter__(self):
+        if self.plugin._self_timing is not None:
+            self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self_timing = self.plugin._self_timing
+        if self.start is not None and self_timing is not None:
+            elapsed = time.perf_counter() - self.start
+            self_timing.sections[self.name] = self_timing.sections.get(self.name, 0.0) + elapsed
+        self.start = None
+        return False
+
+    def __call__(self, func):
+        plugin, name = self.plugin, self.name
+
+        # A new section for each call so recursive and concurrent calls each keep their own start time
+        @wraps(func)
+        def timed(*args, **kwargs):
+            with _TimedSection(plugin, name):
+                return func(*args, **kwargs)
+        return timed
+
+
+def _resourceUsage():
+    """Returns (cpu user seconds, cpu system seconds, peak rss bytes or None) for this process so far,
+    self timing takes the difference between enableSelfTiming() and exit()"""
+    try:
+        import resource
+    except ImportError:
+        times = os.times()
+        return times.user, times.system, None
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    max_rss = usage.ru_maxrss if sys.platform == 'darwin' else usage.ru_maxrss * 1024
+    return usage.ru_utime, usage.ru_stime, max_rss
+
+
+def _byteLength(text):
+    return len(text) if text.isascii() else len(text.encode('utf-8'))
+
+
+def _limitOutput(chunks, max_bytes, marker=TRUNCATION_MARKER):
+    """Yields chunks of text up to max_bytes UTF-8 bytes, if there is more the text is cut short enough for
+    the marker to fit and ends with the marker. Only a marker's worth of text is held back at a time.
+    """
+    marker_size = _byteLength(marker)
+    if marker_size > max_bytes:
+        # No room for the marker, text that doesn't all fit is left out rather than cut off without one
+        marker, marker_size = "", max_bytes
+    # Text up to the soft limit is always written, text past it is held until we know the marker isn't needed
+    soft_limit = max_bytes - marker_size
+    written = 0
+    pending = []
+    pending_size = 0
+    for chunk in chunks:
+        size = _byteLength(chunk)
+        if written + pending_size + size <= max_bytes:
+            if pending or written + size > soft_limit:
+                pending.append(chunk)
+                pending_size += size
+            else:
+                written += size
+                yield chunk
+            continue
+
+        # Too long, cut the held back text and this chunk to the soft limit, a character is at least one byte
+        room = soft_limit - written
+        text = "".join(pending) + chunk[:room]
+        yield text.encode('utf-8')[:room].decode('utf-8', 'ignore')
+        yield marker
+        return
+    yield from pending
+
+
+def _isColumn(values):
+    # Strings and single values are used for every row, anything else iterable is a column
+    return not isinstance(values, str) and hasattr(values, '__iter__')
+
+
+def _zipColumns(labels, *columns):
+    """Returns an iterator of rows from performance data columns, single values are repeated for every row
+
+    Raises:
+        ValueError: If the columns have different lengths
+    """
+    iterators = [labels]
+    for values in columns:
+        if _isColumn(values):
+            if not hasattr(values, '__len__'):
+                values = list(values)
+            if len(values) != len(labels):
+                raise ValueError("Performance data columns must be the same length as the labels")
+            iterators.append(values)
+        else:
+            iterators.append(repeat(values))
+    return zip(*iterators)
 
 
 class MonitoringPlugin:
@@ -9,24 +400,43 @@ class MonitoringPlugin:
     Can be used by itself or by a child class
     """
 
+    # Class attributes so every instance doesn't carry its own copy, plugin.STATE_OK still works
+    STATE_OK = State.OK
+    STATE_WARNING = State.WARNING
+    STATE_CRITICAL = State.CRITICAL
+    STATE_UNKNOWN = State.UNKNOWN
+
+    # Child classes without __slots__ still get a __dict__ for their own attributes
+    __slots__ = ('_current_state', '_message', '_performance_data', '_type', '_success_summary', '_failure_summary',
+                 '_deadline', '_self_timing', '_created', '__weakref__')
+
     def __init__(self, checktype=None):
-        # The states of the server
-        self.STATE_OK = 0            # We know it is OK and it isn't WARN or CRIT when set
-        self.STATE_WARNING = 1       # We know it is WARN and isn't CRIT when set
-        self.STATE_CRITICAL = 2      # We know it is CRIT
-        self.STATE_UNKNOWN = 3       # We don't know anything yet
         self._current_state = self.STATE_UNKNOWN
-        self._message = ""
-        self._performance_data = ""
+        # Lists of records and raw strings, joined when read so adding to them doesn't copy the whole text
+        self._message = []
+        self._performance_data = []
         self._type = checktype
         self._success_summary = []
         self._failure_summary = []
+        self._deadline = None
+        self._self_timing = None
+        self._created = time.perf_counter()
 
     def __iter__(self):
-        for key, value in self.__dict__.items():
-            yield key, value
-
-    def exit(self, exit_state=None, force_state=False, do_exit=True):
+        yield 'STATE_OK', self.STATE_OK
+        yield 'STATE_WARNING', self.STATE_WARNING
+        yield 'STATE_CRITICAL', self.STATE_CRITICAL
+        yield 'STATE_UNKNOWN', self.STATE_UNKNOWN
+        yield '_current_state', self._current_state
+        yield '_message', self.message
+        yield '_performance_data', self.performance_data
+        yield '_type', self._type
+        yield '_success_summary', self._success_summary
+        yield '_failure_summary', self._failure_summary
+        # Attributes added by child classes
+        yield from getattr(self, '__dict__', {}).items()
+
+    def exit(self, exit_state=None, force_state=False, do_exit=True, stream=False, max_bytes=None, output_format='text'):
         """Exits the check outputing the correct state, message and perfdata
         or returns a tuple with (state, message, perfdata).
 
@@ -34,41 +444,145 @@ class MonitoringPlugin:
             exit_state (int, optional): Lets you add a state on exit. Defaults to None.
             force_state (bool, optional): Forces the added state on exit to be used. Defaults to False.
             do_exit (bool, optional): Controls normal check exit or return of plugin exit data. Defaults to True.
+            stream (bool, optional): Writes the message to standard output piece by piece instead of building
+                it as one string first, for very large messages. Only used when do_exit is True. Defaults to False.
+            max_bytes (int, optional): Caps the message and perfdata at this many UTF-8 bytes, the message is cut
+                and ends with a truncation marker so the perfdata is always complete, see MAX_OUTPUT_BYTES.
+                Defaults to None which doesn't cap the output.
+            output_format (str, optional): 'text' for the usual plugin output or 'json' for the result from
+                getResult() as one line of JSON, stream and max_bytes only apply to text. Defaults to 'text'.
+
+        Raises:
+            ValueError: If output_format isn't one of OUTPUT_FORMATS
 
         Returns:
-            tuple: return state, message and performance data of check
+            tuple: return state, message and performance data of check, or the JSON string for 'json'
         """
+        if output_format not in OUTPUT_FORMATS:
+            raise ValueError(f"Unknown output format {output_format}, use one of {', '.join(OUTPUT_FORMATS)}")
+        # The output is being written now so the deadline can't interrupt it
+        if self._deadline is not None:
+            self.cancelDeadline()
+
+        if self._self_timing is not None:
+            self._addSelfTiming()
+
         # If we pass in a new exit state then only change to it if we at a start state
         if exit_state is not None:
             if self.state < exit_state or self.state == self.STATE_UNKNOWN or force_state:
                 self.state = exit_state
 
-        first_line = "\n"
+        if output_format == 'json':
+            result = dumpsResult(self.getResult())
+            if plugin_logging.info_enabled:
+                logger.info(f"Exiting check with state {self.state}")
+            if not do_exit:
+                return result
+            sys.stdout.write(result + "\n")
+            plugin_logging.flushLogging()
+            exit(self.state)
+
         # add the summary to the top of the message
-        if self.state == self.STATE_OK:
-            if self.success_summary:
-                first_line = f"{', '.join(list(set(self.success_summary)))}{first_line}"
-        else:
-            if self.failure_summary:
-                first_line = f"{', '.join(list(set(self.failure_summary)))}{first_line}"
+        first_line = f"{self._summary()}\n"
 
         # Add the check type to the top of the message
         if self._type:
             first_line = f"{self._type} check {first_line}"
 
         # Set the prefix for the message
-        self._message = f"{self.getStateLabel(self.state)}: {first_line}{self.message}"
+        header = f"{self.getStateLabel(self.state)}: {first_line}"
+        performance_data = self.performance_data
 
         # Print the message and perfdata, log the exit and exit with error code
-        logger.info(f"Exiting check with state {self.state}")
+        if plugin_logging.info_enabled:
+            logger.info(f"Exiting check with state {self.state}")
+        if max_bytes is not None:
+            performance_data = self._fitPerformanceData(header, performance_data, max_bytes)
+        if do_exit and stream:
+            # The message records are written as they are rendered so the whole message is never in memory
+            sys.stdout.writelines(self._iterMessage(header, performance_data, max_bytes))
+            if performance_data != "":
+                sys.stdout.write("|" + performance_data)
+            sys.stdout.write("\n")
+            plugin_logging.flushLogging()
+            exit(self.state)
+
+        if max_bytes is None:
+            message = f"{header}{self.message}"
+        else:
+            message = "".join(self._iterMessage(header, performance_data, max_bytes))
+        self._message = [message]
         if do_exit:
             # Add the pipe '|' before perfdata if we have any
-            if self.performance_data != "":
-                self._performance_data = "|" + self.performance_data
-            print(f"{self.message}{self.performance_data}")
+            if performance_data != "":
+                performance_data = "|" + performance_data
+                self._performance_data = [performance_data]
+            print(f"{message}{performance_data}")
+            plugin_logging.flushLogging()
             exit(self.state)
         else:
-            return (self.state, self.message, self.performance_data)
+            return (self.state, message, performance_data)
+
+    def _summary(self):
+        # Summaries repeated by sub-checks are only shown once
+        summary = self._success_summary if self.state == self.STATE_OK else self._failure_summary
+        return ', '.join(dict.fromkeys(summary))
+
+    def getResult(self):
+        """Returns the result of the check as plain types, the structure exit(output_format='json') writes.
+        The message and performance data records are kept apart so a collector doesn't have to parse the text.
+
+        Returns:
+            dict: state, label, checktype, summary, success_summary, failure_summary, message as a list of
+                text, state and prefix dicts and performance_data as a list of points like parsePerformanceData()
+        """
+        message = []
+        for line in self._message:
+            if isinstance(line, MessageLine):
+                message.append(line.toDict())
+            else:
+                message.append({'text': str(line), 'state': None, 'prefix': ""})
+        performance_data = []
+        for point in self._performance_data:
+            if isinstance(point, PerfDataPoint):
+                performance_data.append(point.toDict())
+            else:
+                performance_data.extend(parsePerformanceData(str(point)))
+        return {'state': int(self.state),
+                'label': self.getStateLabel(self.state),
+                'checktype': self._type,
+                'summary': self._summary(),
+                'success_summary': list(self._success_summary),
+                'failure_summary': list(self._failure_summary),
+                'message': message,
+                'performance_data': performance_data}
+
+    def _fitPerformanceData(self, header, performance_data, max_bytes):
+        """Returns the perfdata with whole points dropped from the end if it doesn't fit in max_bytes after the header"""
+        room = max_bytes - _byteLength(header) - 1
+        if performance_data == "" or _byteLength(performance_data) <= room:
+            return performance_data
+        points = _performanceDataPoint().findall(performance_data)
+        kept = []
+        for point in points:
+            room -= _byteLength(point) + 1
+            if room < 0:
+                break
+            kept.append(point)
+        if plugin_logging.info_enabled:
+            logger.info(f"Dropped {len(points) - len(kept)} performance data points to fit the output in {max_bytes} bytes")
+        return "".join(point + " " for point in kept)
+
+    def _iterMessage(self, header, performance_data, max_bytes):
+        """Yields the header and rendered message records, the records are cut to fit max_bytes with the perfdata.
+        The header is always kept so the output starts with the state."""
+        if max_bytes is None:
+            return chain((header,), map(str, self._message))
+        max_bytes -= _byteLength(header)
+        if performance_data != "":
+            # Room for the pipe and the perfdata, see _fitPerformanceData()
+            max_bytes -= _byteLength(performance_data) + 1
+        return chain((header,), _limitOutput(map(str, self._message), max(0, max_bytes)))
 
     @property
     def state(self):
@@ -76,7 +590,8 @@ class MonitoringPlugin:
 
     @state.setter
     def state(self, new_state):
-        logger.debug(f"State change from old {self.state} to new {new_state}")
+        if plugin_logging.debug_enabled:
+            logger.debug(f"State change from old {self.state} to new {new_state}")
         self._current_state = new_state
 
     def getStateLabel(self, state):
@@ -88,38 +603,42 @@ class MonitoringPlugin:
         Returns:
             str: Human readable state text
         """
-        label = "INVALID ({state})"
-        if state == self.STATE_OK:
-            label = "OK"
-        elif state == self.STATE_WARNING:
-            label = "WARNING"
-        elif state == self.STATE_CRITICAL:
-            label = "CRITICAL"
-        elif state == self.STATE_UNKNOWN:
-            label = "UNKNOWN"
-        logger.debug(f"Return state label for state ({state}): {label}")
+        label = _STATE_LABEL.get(state)
+        if label is None:
+            return f"INVALID ({state})"
         return label
 
     def setOk(self):
         """Set the plugin state to OK if current state is UNKNOWN
         """
-        logger.debug("setOk")
+        if plugin_logging.debug_enabled:
+            logger.debug("setOk")
         if self.state == self.STATE_UNKNOWN:
             self.state = self.STATE_OK
 
     def setWarning(self):
         """Set the plugin state to WARNING if current state is not CRITICAL
         """
-        logger.debug("setWarning")
+        if plugin_logging.debug_enabled:
+            logger.debug("setWarning")
         if self.state != self.STATE_CRITICAL:
             self.state = self.STATE_WARNING
 
     def setCritical(self):
         """Set the plugin state to CRITICAL
         """
-        logger.debug("setCritical")
+        if plugin_logging.debug_enabled:
+            logger.debug("setCritical")
         self.state = self.STATE_CRITICAL
 
+    def setUnknown(self):
+        """Set the plugin state to UNKNOWN if current state is OK
+        """
+        if plugin_logging.debug_enabled:
+            logger.debug("setUnknown")
+        if self.state == self.STATE_OK:
+            self.state = self.STATE_UNKNOWN
+
     def setState(self, state):
         """Requests the plugin state be updated based on set*() rules and 
         return the value of the plugin state afterwards
@@ -130,27 +649,32 @@ class MonitoringPlugin:
         Returns:
             int: One of the 4 class STATE constants
         """
-        logger.debug(f"setState({state})")
-        if state == self.STATE_OK:
-            self.setOk()
-        elif state == self.STATE_WARNING:
-            self.setWarning()
-        elif state == self.STATE_CRITICAL:
-            self.setCritical()
-        return self.state
+        if plugin_logging.debug_enabled:
+            logger.debug(f"setState({state})")
+        current_state = self._current_state
+        new_state = _STATE_TRANSITIONS.get((state, current_state))
+        if new_state is None:
+            # The current state was set directly to something that isn't one of the 4 STATE constants
+            if state == self.STATE_WARNING or state == self.STATE_CRITICAL:
+                new_state = state
+            else:
+                return current_state
+        if new_state != current_state:
+            self.state = new_state
+        return new_state
 
     @property
     def message(self):
-        return self._message
+        return "".join(map(str, self._message))
 
     @message.setter
     def message(self, msg):
         # message only
-        self._message += msg
+        self._message.append(msg)
 
     @message.deleter
     def message(self):
-        self._message = ""
+        self._message = []
 
     def setMessage(self, msg, state=None, set_state=False, no_prefix=False):
         """Adds a message to the plugin output. 
@@ -170,27 +694,30 @@ class MonitoringPlugin:
             self.setState(state)
         # message only
         if no_prefix:
-            self._message += msg
+            self._message.append(MessageLine(msg, state))
         else:
-            self._message += f"{self.getStateLabel(state).title()}: {msg}"
+            prefix = _STATE_PREFIX.get(state)
+            if prefix is None:
+                prefix = f"{self.getStateLabel(state).title()}: "
+            self._message.append(MessageLine(msg, state, prefix))
 
     @property
     def performance_data(self):
-        return self._performance_data
+        return "".join(map(str, self._performance_data))
 
     @performance_data.setter
     def performance_data(self, data):
-        self._performance_data += data
+        self._performance_data.append(data)
 
     @performance_data.deleter
     def performance_data(self):
-        self._performance_data = ""
+        self._performance_data = []
 
     def setPerformanceData(self, label: str, value, unit_of_measurement: str = "", warn="", crit="", minimum="", maximum=""):
         """Renders a performance data string and appends it to the plugin's performance data
 
         Args:
-            label (str): String for the label
+            label (str): String for the label, quoted if it contains spaces, equals signs or single quotes
             value (int): Numeric value only
             unit_of_measurement (str, optional): Unit of Measurement [s, us, ms, %, B, KB, MB, TB, c]. Defaults to "".
             warn (str, optional): Numeric value for warning value. Defaults to "".
@@ -205,7 +732,199 @@ class MonitoringPlugin:
             B - bytes (also KB, MB, TB)
             c - a continous counter (such as bytes transmitted on an interface)
         """
-        self.performance_data = f"{label}={value}{unit_of_measurement};{warn};{crit};{minimum};{maximum} "
+        self._performance_data.append(PerfDataPoint(label, value, unit_of_measurement, warn, crit, minimum, maximum))
+
+    def setPerformanceDataBulk(self, labels, values, unit_of_measurement="", warn="", crit="", minimum="", maximum="",
+                               stream=False):
+        """Adds many performance data points in one pass, the output is the same as calling setPerformanceData()
+        for each point. Every argument after labels can be a column (list, tuple, numpy array or generator)
+        with one item per label, or a single value used for every label.
+
+        Args:
+            labels (iterable): Labels, they are quoted if they contain spaces, equals signs or single quotes
+            values (iterable): Numeric values
+            unit_of_measurement (str or iterable, optional): Unit of Measurement, see setPerformanceData(). Defaults to "".
+            warn (str or iterable, optional): Warning values or ranges. Defaults to "".
+            crit (str or iterable, optional): Critical values or ranges. Defaults to "".
+            minimum (str or iterable, optional): Minimum values. Defaults to "".
+            maximum (str or iterable, optional): Maximum values. Defaults to "".
+            stream (bool, optional): Renders the points straight into one block of text without keeping
+                a record for each point, for very large sets. Defaults to False.
+
+        Generator columns are read into a list first so their length can be checked before anything is added.
+
+        Raises:
+            TypeError: If labels isn't a column
+            ValueError: If the columns have different lengths or a label is empty
+
+        Returns:
+            int: The number of performance data points added
+        """
+        if not _isColumn(labels):
+            raise TypeError("labels must be a list, tuple, array or generator of labels")
+        labels = list(labels)
+        if "" in labels or None in labels:
+            raise ValueError("Performance data labels can't be empty")
+
+        if stream:
+            # Quote all the labels up front and format every row in one pass
+            rows = _zipColumns(list(map(quoteLabel, labels)), values, unit_of_measurement, warn, crit, minimum, maximum)
+            self._performance_data.append("".join(starmap(_PERFORMANCE_DATA_FORMAT.format, rows)))
+        else:
+            rows = _zipColumns(labels, values, unit_of_measurement, warn, crit, minimum, maximum)
+            self._performance_data.extend(starmap(PerfDataPoint, rows))
+        if plugin_logging.debug_enabled:
+            logger.debug(f"Added {len(labels)} performance data points")
+        return len(labels)
+
+    def setDeadline(self, seconds, state=None, message=None):
+        """Gives the check a time budget. When it runs out the callbacks added with onDeadline() are called to
+        cancel outstanding work, the timeout is added to the message and failure summary with state and the check
+        exits with the message and performance data gathered so far.
+
+        The deadline is armed with SIGALRM so it can interrupt a blocked probe, that only works in the main thread.
+        In other threads, such as the threading check daemon, nothing is armed and only the remaining property is set.
+
+        Args:
+            seconds (float): Seconds from now, None or 0 cancels the deadline
+            state (int or str, optional): State, or state label from --timeout-state, to exit with. Defaults to STATE_UNKNOWN.
+            message (str, optional): Message added when the deadline is reached. Defaults to "Check timed out after {seconds}s".
+        """
+        if self._deadline is not None:
+            self.cancelDeadline()
+        if not seconds:
+            return
+        if state is None:
+            state = self.STATE_UNKNOWN
+        elif isinstance(state, str):
+            state = State[state.upper()]
+        if message is None:
+            message = f"Check timed out after {seconds}s"
+
+        import signal
+        import threading
+        previous_handler = None
+        armed = hasattr(signal, 'setitimer') and threading.current_thread() is threading.main_thread()
+        if armed:
+            previous_handler = signal.signal(signal.SIGALRM, self._expireDeadline)
+            signal.setitimer(signal.ITIMER_REAL, seconds)
+        self._deadline = _Deadline(time.monotonic() + seconds, seconds, state, message, previous_handler, armed)
+        if plugin_logging.debug_enabled:
+            logger.debug(f"Deadline set for {seconds}s with state {state}, armed: {armed}")
+
+    def cancelDeadline(self):
+        """Cancels the deadline set with setDeadline(), exit() calls this for you
+        """
+        if self._deadline is None:
+            return
+        deadline, self._deadline = self._deadline, None
+        if deadline.armed:
+            import signal
+            signal.setitimer(signal.ITIMER_REAL, 0)
+            signal.signal(signal.SIGALRM, deadline.previous_handler if deadline.previous_handler is not None else signal.SIG_DFL)
+
+    def onDeadline(self, callback):
+        """Adds a callback called with no arguments when the deadline is reached, before the check exits.
+        Use it to cancel outstanding work such as closing sockets or terminating a pool.
+
+        Args:
+            callback (callable): Function to call
+
+        Returns:
+            callable: The callback so this can be used as a decorator
+        """
+        if self._deadline is not None:
+            self._deadline.callbacks.append(callback)
+        return callback
+
+    @property
+    def remaining(self):
+        """Seconds left before the deadline, None if there is no deadline.
+        Use it to size socket and request timeouts for probes.
+        """
+        if self._deadline is None:
+            return None
+        return max(0.0, self._deadline.expires_at - time.monotonic())
+
+    def _expireDeadline(self, signum=None, frame=None):
+        deadline = self._deadline
+        if deadline is None:
+            return
+        self.cancelDeadline()
+        state = deadline.state
+        logger.warning(f"Check deadline of {deadline.seconds}s reached")
+        for callback in deadline.callbacks:
+            try:
+                callback()
+            except Exception as e:
+                logger.warning(f"Deadline callback raised {type(e).__name__}: {e}")
+        self.setMessage(f"{deadline.message}\n", state)
+        self.failure_summary = deadline.message
+        # Like the runner UNKNOWN only replaces OK so a WARNING or CRITICAL result is kept
+        if state == self.STATE_UNKNOWN:
+            self.setUnknown()
+        else:
+            self.setState(state)
+        self.exit()
+
+    def enableSelfTiming(self, prefix="check_"):
+        """Reports what the check run cost as performance data when it exits: wall time since the plugin
+        was created, CPU user and system time and peak RSS growth since self timing was enabled, peak RSS of the
+        process, time spent in initLogging() and in each timeSection(). The same values are logged at INFO level.
+        Call it right after creating the plugin, resource usage is only read while self timing is enabled.
+
+        Args:
+            prefix (str, optional): Prefix for the performance data labels. Defaults to "check_".
+        """
+        if self._self_timing is None:
+            self._self_timing = _SelfTiming(prefix)
+        else:
+            self._self_timing.prefix = prefix
+
+    def timeSection(self, name):
+        """Times a named part of the check for enableSelfTiming(), use it as a context manager or decorator.
+        Time in a section that runs more than once is added up. Without enableSelfTiming() nothing is recorded.
+
+            with plugin.timeSection("api"):
+                response = session.get(url)
+
+            @plugin.timeSection("parse")
+            def parse(response):
+                ...
+
+        Args:
+            name (str): Section name, reported as {prefix}section_{name}
+
+        Returns:
+            _TimedSection: Context manager and decorator
+        """
+        return _TimedSection(self, name)
+
+    def _addSelfTiming(self):
+        self_timing, self._self_timing = self._self_timing, None
+        prefix = self_timing.prefix
+        wall_time = time.perf_counter() - self._created
+        cpu_user, cpu_system, max_rss = _resourceUsage()
+        enabled_user, enabled_system, enabled_max_rss = self_timing.usage
+        cpu_user -= enabled_user
+        cpu_system -= enabled_system
+        # How much the peak grew during the run, mostly useful in the daemon and batch workers where the
+        # process peak was set by earlier runs
+        rss_growth = None if max_rss is None else max_rss - enabled_max_rss
+
+        timings = [('time', wall_time), ('cpu_user', cpu_user), ('cpu_system', cpu_system)]
+        if plugin_logging.init_logging_seconds is not None:
+            timings.append(('init_logging', plugin_logging.init_logging_seconds))
+        timings.extend((f"section_{name}", seconds) for name, seconds in self_timing.sections.items())
+        for name, seconds in timings:
+            self.setPerformanceData(f"{prefix}{name}", f"{seconds:.6f}", "s", minimum=0)
+        if max_rss is not None:
+            self.setPerformanceData(f"{prefix}max_rss", max_rss, "B", minimum=0)
+            self.setPerformanceData(f"{prefix}max_rss_growth", rss_growth, "B", minimum=0)
+
+        if plugin_logging.info_enabled:
+            logger.info("Check cost " + ", ".join(f"{name}: {seconds:.6f}s" for name, seconds in timings)
+                        + (f", max_rss: {max_rss}B, max_rss_growth: {rss_growth}B" if max_rss is not None else ""))
 
     @property
     def failure_summary(self):
@@ -230,3 +949,18 @@ class MonitoringPlugin:
     @success_summary.deleter
     def success_summary(self):
         self._success_summary = []
+
+    def merge(self, plugin):
+        """Merges the state, message, performance data and summaries of another plugin into this plugin.
+        The state is merged with setState() so the usual set*() rules apply.
+
+        Args:
+            plugin (MonitoringPlugin): Plugin to merge, usually from a sub-check
+        """
+        if plugin_logging.debug_enabled:
+            logger.debug(f"Merging plugin with state {plugin.state}")
+        self.setState(plugin.state)
+        self._message.extend(plugin._message)
+        self._performance_data.extend(plugin._performance_data)
+        self._success_summary.extend(plugin.success_summary)
+        self._failure_summary.extend(plugin.failure_summary)
@@ -0,0 +1,144 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+import multiprocessing
+import multiprocessing.pool
+import queue
+import time
+
+from .logging import logger
+from .monitoring_plugins import MonitoringPlugin
+
+STATE_CRITICAL = 2
+STATE_UNKNOWN = 3
+
+# Set in each process worker by _initWorker(), sub-checks report when they start so their timeout starts then
+_events = None
+
+
+def _initWorker(events):
+    global _events
+    _events = events
+
+
+def _runSubCheck(index, func, plugin_class, events=None):
+    # Module level so it can be pickled for the process pool, thread workers are given the queue directly
+    (events or _events).put((index, time.monotonic()))
+    plugin = plugin_class()
+    func(plugin)
+    return plugin
+
+
+def _waitForStart(events, started, index, results, timeouts):
+    """Waits until sub-check index has started and records start times in started. Returns False if it can't
+    start because every worker is held by a sub-check past its timeout, or nothing started within its own timeout.
+    """
+    idle_deadline = time.monotonic() + timeouts[index]
+    while index not in started:
+        busy = [i for i in started if not results[i].ready()]
+        if any(timeouts[i] is None for i in busy):
+            wait = None
+        elif busy:
+            # A worker is freed when a running sub-check finishes, give up once they have all run past their timeout
+            wait = max(started[i] + timeouts[i] for i in busy) - time.monotonic()
+        else:
+            wait = idle_deadline - time.monotonic()
+        if wait is not None and wait <= 0:
+            return False
+        try:
+            started_index, started_at = events.get(timeout=wait)
+        except queue.Empty:
+            continue
+        started[started_index] = started_at
+    return True
+
+
+def _checkName(func):
+    return getattr(func, '__name__', None) or repr(func)
+
+
+def runChecks(plugin, checks, executor='thread', max_workers=None, timeout=None,
+              timeout_state=STATE_UNKNOWN, error_state=STATE_UNKNOWN, plugin_class=MonitoringPlugin):
+    """Runs sub-checks concurrently and merges their results into plugin.
+
+    Each sub-check is called with its own fresh plugin, func(sub_plugin), and uses the normal
+    set*() methods. When they are done each sub-check plugin is merged into plugin with
+    MonitoringPlugin.merge() in the order the checks were given.
+
+    A sub-check that runs past its timeout or raises an exception adds a message and failure summary
+    and sets timeout_state or error_state. UNKNOWN only replaces an OK state so a WARNING or CRITICAL
+    result from another sub-check is kept.
+
+    Args:
+        plugin (MonitoringPlugin): Plugin to merge the results into
+        checks (dict or list): Dict of name to callable, or a list of callables named by __name__
+        executor (str, optional): 'thread' or 'process', process sub-checks must be picklable. Defaults to 'thread'.
+        max_workers (int, optional): Pool size. Defaults to None which runs all sub-checks at once.
+        timeout (float or dict, optional): Seconds each sub-check has from when it starts running, time waiting for
+            a worker doesn't count, or a dict of name to seconds. Defaults to None which waits forever.
+        timeout_state (int, optional): State for sub-checks that time out. Defaults to STATE_UNKNOWN.
+        error_state (int, optional): State for sub-checks that raise an exception. Defaults to STATE_UNKNOWN.
+        plugin_class (class, optional): Class used for the sub-check plugins. Defaults to MonitoringPlugin.
+
+    Returns:
+        int: One of the 4 class STATE constants
+    """
+    if not isinstance(checks, dict):
+        checks = {_checkName(func): func for func in checks}
+    if not checks:
+        return plugin.state
+
+    if executor == 'thread':
+        pool_class = multiprocessing.pool.ThreadPool
+    elif executor == 'process':
+        pool_class = multiprocessing.Pool
+    else:
+        raise ValueError(f"Unknown executor {executor}, use 'thread' or 'process'")
+
+    logger.debug(f"Running {len(checks)} sub-checks with {executor} executor, timeout {timeout}")
+    start = time.monotonic()
+    # Pool workers are daemons so a hung sub-check can't stop the check from exiting
+    if executor == 'process':
+        events = multiprocessing.Queue()
+        pool = pool_class(max_workers or len(checks), initializer=_initWorker, initargs=(events,))
+        worker_events = None
+    else:
+        events = worker_events = queue.Queue()
+        pool = pool_class(max_workers or len(checks))
+    timeouts = [timeout.get(name) if isinstance(timeout, dict) else timeout for name in checks]
+    started = {}
+    failures = []
+    try:
+        results = [pool.apply_async(_runSubCheck, (index, func, plugin_class, worker_events))
+                   for index, func in enumerate(checks.values())]
+        for index, (name, result) in enumerate(zip(checks, results)):
+            item_timeout = timeouts[index]
+            remaining = None
+            if item_timeout is not None:
+                if not _waitForStart(events, started, index, results, timeouts) and not result.ready():
+                    logger.warning(f"Sub-check {name} didn't start, no worker was free")
+                    failures.append((name, timeout_state, "didn't start, no worker was free"))
+                    continue
+                remaining = max(0, started.get(index, 0) + item_timeout - time.monotonic())
+            try:
+                plugin.merge(result.get(remaining))
+            except multiprocessing.TimeoutError:
+                logger.warning(f"Sub-check {name} timed out after {item_timeout}s")
+                failures.append((name, timeout_state, f"timed out after {item_timeout}s"))
+            except Exception as e:
+                logger.warning(f"Sub-check {name} raised {type(e).__name__}: {e}")
+                failures.append((name, error_state, f"raised {type(e).__name__}: {e}"))
+    finally:
+        pool.terminate()
+
+    # Applied after merging so an OK sub-check can't clear an UNKNOWN from a failed one
+    for name, state, reason in failures:
+        plugin.setMessage(f"{name} {reason}\n", state)
+        plugin.failure_summary = f"{name} {reason}"
+        if state == STATE_UNKNOWN:
+            plugin.setUnknown()
+        else:
+            plugin.setState(state)
+
+    logger.debug(f"Sub-checks finished in {time.monotonic() - start:.3f}s with state {plugin.state}")
+    return plugin.state
@@ -0,0 +1,215 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+import math
+import sys
+
+STATE_OK = 0
+STATE_WARNING = 1
+STATE_CRITICAL = 2
+
+
+def _numpy():
+    # numpy is optional and slow to import, only use it when the check has already imported it
+    return sys.modules.get('numpy')
+
+
+def _asArray(numpy, values):
+    # numpy.asarray() can't read a generator, fromiter() can
+    if not hasattr(values, '__len__'):
+        return numpy.fromiter(values, dtype=float)
+    return numpy.asarray(values, dtype=float)
+
+
+class ThresholdRange:
+    """A Nagios range spec parsed once into bounds so values can be checked without parsing the string again.
+
+    Range specs:
+        10      alert if the value is < 0 or > 10
+        10:     alert if the value is < 10
+        ~:10    alert if the value is > 10
+        10:20   alert if the value is < 10 or > 20
+        @10:20  alert if the value is >= 10 and <= 20
+    """
+    __slots__ = ('spec', 'start', 'end', 'inside')
+
+    def __init__(self, spec):
+        """
+        Args:
+            spec (str or int or float): Nagios range spec
+
+        Raises:
+            ValueError: If the spec isn't a valid range
+        """
+        self.spec = str(spec).strip()
+        text = self.spec
+        self.inside = text.startswith('@')
+        if self.inside:
+            text = text[1:]
+
+        try:
+            if ':' in text:
+                start, end = text.split(':', 1)
+                self.start = -math.inf if start == '~' else float(start or 0)
+                self.end = math.inf if end == '' else float(end)
+            else:
+                self.start = 0.0
+                self.end = float(text)
+        except ValueError:
+            raise ValueError(f"Invalid threshold range: {self.spec!r}") from None
+
+        if self.start > self.end:
+            raise ValueError(f"Invalid threshold range: {self.spec!r}, start is greater than end")
+
+    def __str__(self):
+        return self.spec
+
+    def __repr__(self):
+        return f"ThresholdRange({self.spec!r})"
+
+    def alert(self, value):
+        """Returns True if the value should raise an alert
+
+        Args:
+            value (int or float): Value to check
+
+        Returns:
+            bool: True if the value is outside the range, or inside it for @ ranges
+        """
+        if self.inside:
+            return self.start <= value <= self.end
+        return value < self.start or value > self.end
+
+    def alerts(self, values):
+        """Checks many values at once, vectorized with numpy if the check has imported it
+
+        Args:
+            values (iterable): Values to check, a list, generator or numpy array
+
+        Returns:
+            list or numpy.ndarray: True for each value that should raise an alert
+        """
+        numpy = _numpy()
+        if numpy is not None:
+            values = _asArray(numpy, values)
+            if self.inside:
+                return (values >= self.start) & (values <= self.end)
+            return (values < self.start) | (values > self.end)
+
+        start, end = self.start, self.end
+        if self.inside:
+            return [start <= value <= end for value in values]
+        return [value < start or value > end for value in values]
+
+
+def _toRange(spec):
+    if spec is None or spec == "" or isinstance(spec, ThresholdRange):
+        return spec or None
+    return ThresholdRange(spec)
+
+
+class Thresholds:
+    """Warning and critical ranges for a value, used to work out the state and write the ranges to the performance data.
+    """
+    __slots__ = ('warn', 'crit')
+
+    def __init__(self, warn=None, crit=None):
+        """
+        Args:
+            warn (str or ThresholdRange, optional): Warning range spec. Defaults to None.
+            crit (str or ThresholdRange, optional): Critical range spec. Defaults to None.
+        """
+        self.warn = _toRange(warn)
+        self.crit = _toRange(crit)
+
+    def getState(self, value):
+        """Returns the state for a value, critical is checked before warning
+
+        Args:
+            value (int or float): Value to check
+
+        Returns:
+            int: STATE_OK, STATE_WARNING or STATE_CRITICAL
+        """
+        if self.crit is not None and self.crit.alert(value):
+            return STATE_CRITICAL
+        if self.warn is not None and self.warn.alert(value):
+            return STATE_WARNING
+        return STATE_OK
+
+    def getStates(self, values):
+        """Returns the state for each value, vectorized with numpy if the check has imported it
+
+        Args:
+            values (iterable): Values to check, a list, generator or numpy array
+
+        Returns:
+            list or numpy.ndarray: STATE_OK, STATE_WARNING or STATE_CRITICAL for each value
+        """
+        numpy = _numpy()
+        if numpy is not None:
+            values = _asArray(numpy, values)
+            states = numpy.zeros(values.shape, dtype=numpy.int8)
+            if self.warn is not None:
+                states[self.warn.alerts(values)] = STATE_WARNING
+            if self.crit is not None:
+                states[self.crit.alerts(values)] = STATE_CRITICAL
+            return states
+
+        values = list(values)
+        warn_alerts = self.warn.alerts(values) if self.warn is not None else [False] * len(values)
+        crit_alerts = self.crit.alerts(values) if self.crit is not None else [False] * len(values)
+        return [STATE_CRITICAL if crit else STATE_WARNING if warn else STATE_OK
+                for warn, crit in zip(warn_alerts, crit_alerts)]
+
+    def getWorstState(self, values):
+        """Returns the worst state of all the values
+
+        Args:
+            values (iterable): Values to check, a list, generator or numpy array
+
+        Returns:
+            int: STATE_OK, STATE_WARNING or STATE_CRITICAL
+        """
+        states = self.getStates(values)
+        if len(states) == 0:
+            return STATE_OK
+        return int(max(states))
+
+    def check(self, plugin, label, value, unit_of_measurement="", minimum="", maximum="", msg=None):
+        """Sets the plugin state for a value with setState() and adds its performance data with these ranges
+
+        Args:
+            plugin (MonitoringPlugin): Plugin to update
+            label (str): String for the performance data label
+            value (int or float): Value to check
+            unit_of_measurement (str, optional): Unit of Measurement. Defaults to "".
+            minimum (str, optional): Numeric value for minimum value. Defaults to "".
+            maximum (str, optional): Numeric value for maximum value. Defaults to "".
+            msg (str, optional): Message added with setMessage() using the state of the value. Defaults to None.
+
+        Returns:
+            int: The state of the value
+        """
+        state = self.getState(value)
+        if msg is not None:
+            plugin.setMessage(msg, state)
+        plugin.setState(state)
+        plugin.setPerformanceData(label, value, unit_of_measurement,
+                                  warn=self.warn or "", crit=self.crit or "", minimum=minimum, maximum=maximum)
+        return state
+
+    def checkAll(self, plugin, values):
+        """Sets the plugin state with setState() to the worst state of many values
+
+        Args:
+            plugin (MonitoringPlugin): Plugin to update
+            values (iterable): Values to check, a list, generator or numpy array
+
+        Returns:
+            list or numpy.ndarray: The state of each value
+        """
+        states = self.getStates(values)
+        if len(states):
+            plugin.setState(int(max(states)))
+        return states
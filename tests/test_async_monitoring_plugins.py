@@ -0,0 +1,89 @@
+import asyncio
+import time
+
+import pytest
+from sol1_monitoring_plugins_lib import MonitoringPlugin
+from sol1_monitoring_plugins_lib.async_monitoring_plugins import AsyncMonitoringPlugin
+
+
+async def probe(plugin, name, delay, state):
+    await asyncio.sleep(delay)
+    plugin.setMessage(f"{name} done\n", state, True)
+    plugin.setPerformanceData(label=name, value=delay, unit_of_measurement='s')
+    return name
+
+
+async def broken_probe():
+    raise ConnectionError("refused")
+
+
+def test_exit_matches_sync():
+    async def check():
+        async with AsyncMonitoringPlugin("Async") as plugin:
+            results = await plugin.gather(probe(plugin, 'a', 0.01, 0), probe(plugin, 'b', 0.02, 1))
+        return plugin, results
+
+    plugin, results = asyncio.run(check())
+    assert results == ['a', 'b']
+
+    sync = MonitoringPlugin("Async")
+    sync.setMessage("a done\n", 0, True)
+    sync.setPerformanceData(label='a', value=0.01, unit_of_measurement='s')
+    sync.setMessage("b done\n", 1, True)
+    sync.setPerformanceData(label='b', value=0.02, unit_of_measurement='s')
+    assert plugin.exit(do_exit=False) == sync.exit(do_exit=False)
+
+
+def test_gather_timeout_and_errors():
+    async def check():
+        plugin = AsyncMonitoringPlugin()
+        results = await plugin.gather(probe(plugin, 'fast', 0, 0), probe(plugin, 'slow', 5, 0), broken_probe(),
+                                      names=['fast', 'slow', 'broken'], timeout=0.1, timeout_state=2)
+        return plugin, results
+
+    plugin, results = asyncio.run(check())
+    assert results[0] == 'fast'
+    assert results[1] is None
+    assert isinstance(results[2], ConnectionError)
+    assert plugin.state == plugin.STATE_CRITICAL
+    assert "Critical: slow timed out after 0.1s" in plugin.message
+    assert "broken raised ConnectionError: refused" in plugin.message
+
+
+@pytest.mark.parametrize('deadline_state', [2, 3])
+def test_deadline_cancels_check(deadline_state):
+    async def check():
+        async with AsyncMonitoringPlugin("Deadline", deadline=0.2, deadline_state=deadline_state) as plugin:
+            assert 0 < plugin.remaining <= 0.2
+            await plugin.gather(probe(plugin, 'fast', 0, 0), probe(plugin, 'slow', 5, 0), names=['fast', 'slow'])
+            plugin.setMessage("not reached\n")
+        return plugin
+
+    start = time.monotonic()
+    plugin = asyncio.run(check())
+    assert time.monotonic() - start < 2
+    assert plugin.state == deadline_state
+    assert "slow cancelled at the 0.2s deadline" in plugin.message
+    assert "not reached" not in plugin.message
+    assert 'fast=0s' in plugin.performance_data
+    state, message, _ = plugin.exit(do_exit=False)
+    assert state == deadline_state
+    assert "slow cancelled at the 0.2s deadline" in message
+
+
+def test_exit_and_setDeadline_with_async_deadline():
+    async def check():
+        async with AsyncMonitoringPlugin("TCP", deadline=25) as plugin:
+            plugin.setOk()
+        return plugin
+
+    plugin = asyncio.run(check())
+    calls = []
+    plugin.setDeadline(10)
+    plugin.onDeadline(lambda plugin: calls.append(plugin))
+    assert 0 < plugin.remaining <= 10
+    plugin.cancelDeadline()
+    assert plugin.exit(do_exit=False) == (0, "OK: TCP check \n", "")
+    with pytest.raises(SystemExit):
+        plugin.exit()
+    assert calls == []
@@ -0,0 +1,88 @@
+import json
+import os
+import time
+
+import pytest
+from sol1_monitoring_plugins_lib import batch
+from sol1_monitoring_plugins_lib.batch import loadManifest, runBatch, splitPerformanceData
+
+
+def check_value(plugin, argv):
+    value = int(argv[0])
+    plugin.setPerformanceData(label="disk /", value=value, unit_of_measurement="%")
+    plugin.setMessage(f"value is {value}\n", plugin.STATE_CRITICAL if value > 90 else plugin.STATE_OK, True)
+
+
+def check_raises(plugin, argv):
+    raise RuntimeError("probe failed")
+
+
+def check_crashes(plugin, argv):
+    os._exit(1)
+
+
+def check_hangs(plugin, argv):
+    time.sleep(30)
+
+
+def write_manifest(tmp_path, checks):
+    path = tmp_path / 'manifest.json'
+    path.write_text(json.dumps({'defaults': {'host': 'web01'}, 'checks': checks}))
+    return str(path)
+
+
+def test_loadManifest_yaml(tmp_path):
+    pytest.importorskip('yaml')
+    path = tmp_path / 'manifest.yaml'
+    path.write_text("defaults:\n  host: web01\nchecks:\n  - service: disk\n    check: mod:func\n    args: --warn 80\n")
+    assert loadManifest(str(path)) == [{'host': 'web01', 'service': 'disk', 'check': 'mod:func', 'args': ['--warn', '80']}]
+    path.write_text("checks:\n  - service: disk\n")
+    with pytest.raises(ValueError):
+        loadManifest(str(path))
+
+
+def test_splitPerformanceData():
+    assert splitPerformanceData("'disk /'=5%;;;; 'it''s'=1;;;; load=0.5;1;2;; ") == \
+        ["'disk /'=5%;;;;", "'it''s'=1;;;;", "load=0.5;1;2;;"]
+
+
+@pytest.mark.parametrize('executor', ['process', 'thread'])
+def test_runBatch_api(tmp_path, capsys, executor):
+    entries = loadManifest(write_manifest(tmp_path, [
+        {'service': 'ok', 'check': 'tests.test_batch:check_value', 'args': ['50']},
+        {'service': 'critical', 'check': 'tests.test_batch:check_value', 'args': '95'},
+        {'service': 'raises', 'check': 'tests.test_batch:check_raises'},
+        {'check': 'tests.test_batch:missing'},
+    ]))
+    finished = runBatch(entries, __import__('sys').stdout, 'api', executor=executor, max_workers=2)
+    assert len(finished) == 4
+    results = {(result.get('service') or result['host']): result
+               for result in map(json.loads, capsys.readouterr().out.splitlines())}
+    assert results['web01!ok']['exit_status'] == 0
+    assert results['web01!ok']['type'] == 'Service'
+    assert results['web01!ok']['performance_data'] == ["'disk /'=50%;;;;"]
+    assert results['web01!ok']['plugin_output'] == "OK: \nOk: value is 50"
+    assert results['web01!ok']['execution_end'] >= results['web01!ok']['execution_start']
+    assert results['web01!critical']['exit_status'] == 2
+    assert results['web01!raises']['exit_status'] == 3
+    assert "RuntimeError: probe failed" in results['web01!raises']['plugin_output']
+    assert results['web01']['type'] == 'Host'
+    assert results['web01']['exit_status'] == 3
+
+
+def test_runBatch_crash_isolation(tmp_path, capsys, monkeypatch):
+    monkeypatch.setattr(batch, 'TIMEOUT_GRACE', 0.5)
+    entries = loadManifest(write_manifest(tmp_path, [
+        {'service': 'crashes', 'check': 'tests.test_batch:check_crashes'},
+        {'service': 'hangs', 'check': 'tests.test_batch:check_hangs', 'timeout': 0.5},
+        {'service': 'ok', 'check': 'tests.test_batch:check_value', 'args': ['10']},
+    ]))
+    start = time.monotonic()
+    runBatch(entries, __import__('sys').stdout, 'command', max_workers=3, timeout=1)
+    assert time.monotonic() - start < 10
+    lines = {line.split(";")[2]: line for line in capsys.readouterr().out.splitlines()}
+    assert len(lines) == 3
+    assert lines['crashes'].endswith("PROCESS_SERVICE_CHECK_RESULT;web01;crashes;3;UNKNOWN: Check tests.test_batch:check_crashes didn't finish in time")
+    # The deadline stops the hung check with its partial output
+    assert "PROCESS_SERVICE_CHECK_RESULT;web01;hangs;3;UNKNOWN: Check timed out after 0.5s\\nUnknown: Check timed out after 0.5s" in lines['hangs']
+    assert lines['ok'].endswith("PROCESS_SERVICE_CHECK_RESULT;web01;ok;0;OK: \\nOk: value is 10|'disk /'=10%;;;;")
@@ -0,0 +1,98 @@
+import argparse
+import json
+import os
+import time
+
+import pytest
+from sol1_monitoring_plugins_lib import MonitoringPlugin, initLoggingArgparse
+from sol1_monitoring_plugins_lib.cache import ResultCache, cacheKey, initCacheArgparse
+
+
+class Probe:
+    def __init__(self):
+        self.calls = 0
+
+    def __call__(self, plugin):
+        self.calls += 1
+        plugin.setMessage(f"run {self.calls}\n", plugin.STATE_OK, True)
+        plugin.setPerformanceData(label='calls', value=self.calls)
+
+
+def test_cacheKey_ignores_logging_and_cache_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--host', type=str)
+    initLoggingArgparse(parser)
+    initCacheArgparse(parser)
+    key = cacheKey("API", parser.parse_args(['--host', 'a']))
+    assert key == cacheKey("API", parser.parse_args(['--host', 'a', '--debug', '--enable-cache']))
+    assert key != cacheKey("API", parser.parse_args(['--host', 'b']))
+    assert key != cacheKey("Other", parser.parse_args(['--host', 'a']))
+    assert cacheKey("API", {'host': 'a', 'port': 1}) == cacheKey("API", {'port': 1, 'host': 'a'})
+
+
+def test_cache_hit_and_expiry(tmp_path):
+    cache = ResultCache(str(tmp_path), ttl=60)
+    probe = Probe()
+    expected = MonitoringPlugin("API")
+    probe(expected)
+    expected = expected.exit(do_exit=False)
+    probe.calls = 0
+
+    assert cache.run("API", ['--host', 'a'], probe) == expected
+    assert cache.run("API", ['--host', 'a'], probe) == expected
+    assert probe.calls == 1
+
+    cache.ttl = 0
+    assert cache.run("API", ['--host', 'a'], probe)[1] == "OK: API check \nOk: run 2\n"
+    assert probe.calls == 2
+
+
+def test_stale_while_revalidate(tmp_path):
+    cache = ResultCache(str(tmp_path), ttl=60, stale_ttl=60)
+    probe = Probe()
+    key = cacheKey("API", [])
+    cache.set(key, (0, "OK: old\n", ""))
+    path = tmp_path / (key + '.json')
+    entry = json.loads(path.read_text())
+    entry['created'] -= 90
+    path.write_text(json.dumps(entry))
+
+    # The stale result comes back straight away and a forked child refreshes it
+    assert cache.run("API", [], probe) == (0, "OK: old\n", "")
+    for _ in range(100):
+        if "run 1" in path.read_text():
+            break
+        time.sleep(0.05)
+    assert cache.run("API", [], probe)[1] == "OK: API check \nOk: run 1\n"
+
+
+def test_lru_eviction(tmp_path):
+    cache = ResultCache(str(tmp_path), max_entries=2)
+    for i, key in enumerate(['a', 'b']):
+        cache.set(key, (0, key, ""))
+        os.utime(tmp_path / f"{key}.json", (i, i))
+    # Reading a result marks it as recently used so b is the one evicted
+    cache.get('a')
+    cache.set('c', (0, 'c', ""))
+    assert sorted(p.name for p in tmp_path.glob('*.json')) == ['a.json', 'c.json']
+
+
+def test_eviction_keeps_lock_files(tmp_path):
+    cache = ResultCache(str(tmp_path), max_entries=1)
+    with cache._lock('a'):
+        cache.set('a', (0, 'a', ""))
+        os.utime(tmp_path / "a.json", (0, 0))
+        cache.set('b', (0, 'b', ""))
+        assert not (tmp_path / 'a.json').exists()
+        # The lock held on a is still the file other processes lock
+        assert (tmp_path / 'a.lock').exists()
+        with cache._lock('a', blocking=False) as locked:
+            assert locked is False
+
+
+def test_cache_exit(tmp_path, capsys):
+    cache = ResultCache(str(tmp_path))
+    with pytest.raises(SystemExit) as e:
+        cache.exit("API", [], Probe())
+    assert e.value.code == 0
+    assert capsys.readouterr().out == "OK: API check \nOk: run 1\n|calls=1;;;; \n"
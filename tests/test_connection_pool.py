@@ -0,0 +1,103 @@
+import asyncio
+import http.server
+import socketserver
+import threading
+
+import pytest
+from sol1_monitoring_plugins_lib import MonitoringPlugin
+from sol1_monitoring_plugins_lib.connection_pool import ConnectionPool
+
+
+class KeepAliveHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        self.server.client_ports.add(self.client_address[1])
+        body = b"ok"
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class EchoHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        for line in self.rfile:
+            self.wfile.write(line)
+
+
+@pytest.fixture
+def http_server():
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), KeepAliveHandler)
+    server.daemon_threads = True
+    server.client_ports = set()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def test_http_keep_alive_reuse(http_server):
+    url = f"http://127.0.0.1:{http_server.server_address[1]}/status"
+    with ConnectionPool() as pool:
+        for _ in range(5):
+            result = pool.request("GET", url)
+            assert result.status == 200
+            assert result.body == b"ok"
+        stats = pool.stats()
+    assert stats.connects == 1
+    assert stats.reuses == 4
+    assert stats.reuse_ratio == 0.8
+    assert len(http_server.client_ports) == 1
+
+
+def test_http_per_host_limit(http_server):
+    url = f"http://127.0.0.1:{http_server.server_address[1]}/"
+    pool = ConnectionPool(max_per_host=2)
+    threads = [threading.Thread(target=lambda: [pool.request("GET", url) for _ in range(10)]) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert pool.stats().connects + pool.stats().reuses == 80
+    assert len(http_server.client_ports) <= 2
+    pool.close()
+
+
+def test_http_async(http_server):
+    url = f"http://127.0.0.1:{http_server.server_address[1]}/"
+    pool = ConnectionPool()
+
+    async def main():
+        return await asyncio.gather(*[pool.requestAsync("GET", url) for _ in range(4)])
+
+    assert [result.status for result in asyncio.run(main())] == [200] * 4
+    pool.close()
+
+
+def test_tcp_reuse_and_perfdata():
+    server = socketserver.ThreadingTCPServer(('127.0.0.1', 0), EchoHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        pool = ConnectionPool()
+        sockets = []
+        for i in range(3):
+            with pool.connection('127.0.0.1', server.server_address[1]) as sock:
+                sock.sendall(f"ping {i}\n".encode())
+                assert sock.recv(64) == f"ping {i}\n".encode()
+                sockets.append(sock)
+        assert sockets[0] is sockets[1] is sockets[2]
+
+        plugin = MonitoringPlugin()
+        pool.setPerformanceData(plugin)
+        assert "pool_connects=1;;;0; pool_reuses=2;;;0; pool_reuse_ratio=66.67%;;;0;100 " in plugin.performance_data
+        pool.close()
+    finally:
+        server.shutdown()
+        server.server_close()
@@ -0,0 +1,49 @@
+import pytest
+from sol1_monitoring_plugins_lib.counters import CounterStore, CounterRate, counterStorePath
+
+
+def test_rates_persist_between_runs(tmp_path):
+    path = str(tmp_path / 'check.counters')
+    with CounterStore(path, max_age=None) as counters:
+        assert counters.update('eth0_octets', 1000, timestamp=100) is None
+        assert counters.updateMany({'eth1_octets': 2**60, 'load': 1.5}, timestamp=100) == {
+            'eth1_octets': None, 'load': None}
+
+    with CounterStore(path, max_age=None) as counters:
+        assert len(counters) == 3
+        assert counters.get('eth1_octets') == (2**60, 100)
+        assert counters.update('eth0_octets', 3000, timestamp=110) == CounterRate(2000, 10, 200)
+        assert counters.update('eth1_octets', 2**60 + 10, timestamp=110).delta == 10
+        assert counters.update('load', 2.5, timestamp=110).rate == pytest.approx(0.1)
+
+
+def test_wraps_and_resets(tmp_path):
+    counters = CounterStore(str(tmp_path / 'check.counters'), counter_max=2**32)
+    counters.update('octets', 2**32 - 100, timestamp=0)
+    assert counters.update('octets', 100, timestamp=10) == CounterRate(200, 10, 20)
+    # A drop that would be a huge wrap is a reset
+    counters.update('octets', 2**31, timestamp=20)
+    assert counters.update('octets', 5, timestamp=30) is None
+    assert counters.update('octets', 10, timestamp=30) is None
+
+    counters = CounterStore(str(tmp_path / 'other.counters'))
+    counters.update('octets', 100, timestamp=0)
+    assert counters.update('octets', 50, timestamp=10) is None
+
+
+def test_old_counters_dropped_and_corrupt_file(tmp_path):
+    path = tmp_path / 'check.counters'
+    counters = CounterStore(str(path), max_age=60)
+    counters.update('old', 1, timestamp=0)
+    counters.update('new', 1)
+    counters.save()
+    assert 'old' not in CounterStore(str(path))
+    assert 'new' in CounterStore(str(path))
+
+    path.write_bytes(b'garbage')
+    assert len(CounterStore(str(path))) == 0
+
+
+def test_counterStorePath():
+    assert counterStorePath("Interfaces", ['--host', 'a'], state_dir='/tmp/x').startswith('/tmp/x/')
+    assert counterStorePath("Interfaces", ['--host', 'a']) != counterStorePath("Interfaces", ['--host', 'b'])
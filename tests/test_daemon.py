@@ -0,0 +1,118 @@
+import argparse
+import json
+import os
+import threading
+import time
+
+import pytest
+from sol1_monitoring_plugins_lib import MonitoringPlugin
+from sol1_monitoring_plugins_lib.client import requestCheck, main as client_main
+from sol1_monitoring_plugins_lib.daemon import CheckDaemon, runCheck
+from sol1_monitoring_plugins_lib.monitoring_plugins import TRUNCATION_MARKER
+
+
+def check_example(plugin, argv):
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--value', type=int, required=True)
+    args = parser.parse_args(argv)
+    plugin.setPerformanceData(label='value', value=args.value)
+    if args.value > 10:
+        plugin.setMessage("Too high\n", plugin.STATE_CRITICAL, True)
+        plugin.exit()
+    plugin.setMessage("Fine\n", plugin.STATE_OK, True)
+
+
+def check_raises(plugin, argv):
+    raise ValueError("broken probe")
+
+
+def expected(value):
+    plugin = MonitoringPlugin("Example")
+    plugin.setPerformanceData(label='value', value=value)
+    if value > 10:
+        plugin.setMessage("Too high\n", plugin.STATE_CRITICAL, True)
+    else:
+        plugin.setMessage("Fine\n", plugin.STATE_OK, True)
+    return plugin.exit(do_exit=False)
+
+
+def test_runCheck_matches_exit():
+    assert runCheck(check_example, ['--value', '5'], checktype="Example") == expected(5)
+    assert runCheck(check_example, ['--value', '50'], checktype="Example") == expected(50)
+
+
+def test_runCheck_passes_exit_options():
+    def check_large(plugin, argv):
+        plugin.setOk()
+        plugin.setMessage("x" * 1000 + "\n")
+        plugin.exit(stream=True, max_bytes=100)
+
+    state, message, _ = runCheck(check_large, checktype="Large")
+    assert state == 0
+    assert message.startswith("OK: Large check \n")
+    assert message.endswith(TRUNCATION_MARKER)
+    assert len(message) <= 100
+
+
+def test_runCheck_json_output():
+    def check_json(plugin, argv):
+        plugin.setMessage("Too high\n", plugin.STATE_CRITICAL, True)
+        plugin.setPerformanceData("value", 50)
+        plugin.exit(output_format=argv[0])
+
+    state, message, performance_data = runCheck(check_json, ['json'], checktype="Example")
+    assert state == 2
+    assert performance_data == ""
+    result = json.loads(message)
+    assert result['label'] == "CRITICAL"
+    assert result['performance_data'][0]['value'] == 50
+
+    assert runCheck(lambda plugin, argv: plugin.exit(do_exit=False, output_format='json'))[0] == 3
+    assert runCheck(check_json, ['text'])[1] == "CRITICAL: \nCritical: Too high\n"
+
+
+def test_runCheck_errors_are_unknown():
+    state, message, _ = runCheck(check_raises)
+    assert state == 3
+    assert "Check raised ValueError: broken probe" in message
+
+    state, _, _ = runCheck(check_example, [])
+    assert state == 3
+
+
+@pytest.fixture(params=[True, False], ids=['forking', 'threading'])
+def daemon(request, tmp_path):
+    daemon = CheckDaemon(socket_path=str(tmp_path / 'daemon.sock'), forking=request.param)
+    daemon.register('example', check_example, checktype="Example")
+    thread = threading.Thread(target=daemon.serveForever, daemon=True)
+    thread.start()
+    for _ in range(100):
+        if os.path.exists(daemon.socket_path):
+            break
+        time.sleep(0.01)
+    yield daemon
+    daemon.shutdown()
+    thread.join()
+
+
+def test_daemon_requests(daemon):
+    for value in (5, 50):
+        result = requestCheck('example', ['--value', str(value)], socket_path=daemon.socket_path)
+        assert (result['state'], result['message'], result['performance_data']) == expected(value)
+
+    result = requestCheck('missing', socket_path=daemon.socket_path)
+    assert result['state'] == 3
+
+
+def test_client_output(daemon, capsys):
+    with pytest.raises(SystemExit) as e:
+        client_main(['--socket', daemon.socket_path, 'example', '--value', '50'])
+    assert e.value.code == 2
+    assert capsys.readouterr().out == "CRITICAL: Example check \nCritical: Too high\n|value=50;;;; \n"
+
+
+def test_client_without_daemon(tmp_path, capsys):
+    with pytest.raises(SystemExit) as e:
+        client_main(['--socket', str(tmp_path / 'missing.sock'), 'example'])
+    assert e.value.code == 3
+    assert capsys.readouterr().out.startswith("UNKNOWN: Unable to get check result")
@@ -0,0 +1,72 @@
+import math
+
+import pytest
+from sol1_monitoring_plugins_lib import MonitoringPlugin
+from sol1_monitoring_plugins_lib.history import PerfDataHistory, historyPath
+
+
+def test_ring_buffer_persists_between_runs(tmp_path):
+    path = str(tmp_path / 'check.history')
+    with PerfDataHistory(path, size=5) as history:
+        for i in range(7):
+            history.record({'load': i, 'users': i * 2} if i % 2 else {'load': i}, timestamp=100 + i * 10)
+
+    with PerfDataHistory(path, size=5) as history:
+        assert len(history) == 5
+        assert history.labels == ['load', 'users']
+        assert list(history.timestamps()) == [120, 130, 140, 150, 160]
+        assert list(history.values('load')) == [2, 3, 4, 5, 6]
+        assert list(history.values('load', window=2)) == [5, 6]
+        assert [value if not math.isnan(value) else None for value in history.values('users')] == [None, 6, None, 10, None]
+        assert list(history.values('missing')) == []
+
+
+def test_helpers(tmp_path):
+    with PerfDataHistory(str(tmp_path / 'check.history'), size=10) as history:
+        assert history.movingAverage('latency') is None
+        for i, latency in enumerate([10, 20, 30, 40]):
+            history.record([('latency', latency)], timestamp=i * 60)
+        history.record({}, timestamp=300)
+        assert history.movingAverage('latency') == 25
+        assert history.movingAverage('latency', window=3) == 35
+        assert history.percentile('latency', 50) == 25
+        assert history.percentile('latency', 90) == pytest.approx(37)
+        assert history.rateOfChange('latency') == pytest.approx(0.5 / 3)
+        assert history.rateOfChange('latency', window=1) is None
+        with pytest.raises(ValueError):
+            history.percentile('latency', 101)
+
+
+def test_record_plugin_and_label_reuse(tmp_path):
+    plugin = MonitoringPlugin()
+    plugin.setPerformanceData('time', 0.5, 's')
+    plugin.setPerformanceData('status', 'U')
+    with PerfDataHistory(str(tmp_path / 'check.history'), size=2, max_labels=1) as history:
+        history.recordPlugin(plugin)
+        assert history.labels == ['time']
+        # There is no room for other until time hasn't been recorded for a whole ring
+        history.record({'other': 1})
+        history.record({'other': 2})
+        assert history.labels == ['time']
+        history.record({'other': 3})
+        history.record({'other': 4})
+        assert history.labels == ['other']
+        assert list(history.values('other')) == [3, 4]
+
+
+def test_resized_and_corrupt_files(tmp_path):
+    path = tmp_path / 'check.history'
+    with PerfDataHistory(str(path), size=5) as history:
+        history.record({'load': 1})
+    with PerfDataHistory(str(path), size=10) as history:
+        assert len(history) == 0
+    path.write_bytes(b"garbage" * 1000)
+    with PerfDataHistory(str(path), size=10) as history:
+        assert len(history) == 0
+        history.record({'load': 1})
+        assert list(history.values('load')) == [1]
+
+
+def test_historyPath():
+    assert historyPath("Latency", {'host': 'a'}, state_dir='/tmp/history').endswith('.history')
+    assert historyPath("Latency", {'host': 'a'}) != historyPath("Latency", {'host': 'b'})
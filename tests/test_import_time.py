@@ -0,0 +1,60 @@
+import os
+import subprocess
+import sys
+
+import sol1_monitoring_plugins_lib
+
+# Generous so slow CI runners pass, importing loguru alone takes around 100ms
+IMPORT_BUDGET_US = 50000
+
+PACKAGE_PARENT = os.path.dirname(os.path.dirname(os.path.abspath(sol1_monitoring_plugins_lib.__file__)))
+
+
+def run_python(code):
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join(filter(None, [PACKAGE_PARENT, env.get('PYTHONPATH')]))
+    return subprocess.run([sys.executable, '-X', 'importtime', '-c', code],
+                          env=env, capture_output=True, text=True, check=True)
+
+
+def import_times(stderr):
+    times = {}
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        self_us, cumulative_us, name = line.split(':', 1)[1].split('|')
+        times[name.strip()] = int(cumulative_us)
+    return times
+
+
+def test_import_time_budget():
+    # MonitoringPlugin is loaded by the package __getattr__ with importlib, which -X importtime doesn't report,
+    # so the import every check does is timed as a whole
+    code = ("import sys, time\n"
+            "re_preloaded = 're' in sys.modules\n"
+            "start = time.perf_counter()\n"
+            "from sol1_monitoring_plugins_lib import MonitoringPlugin\n"
+            "print(int((time.perf_counter() - start) * 1000000))\n"
+            "assert 'loguru' not in sys.modules\n"
+            # The perfdata regexes are compiled on first use
+            "assert re_preloaded or 're' not in sys.modules\n")
+    # The fastest of a few runs, so other processes competing for the CPU don't fail the test
+    results = [run_python(code) for _ in range(3)]
+    assert all('loguru' not in import_times(result.stderr) for result in results)
+    assert min(int(result.stdout) for result in results) < IMPORT_BUDGET_US
+
+
+def test_loguru_imported_on_first_use():
+    code = ("import sys\n"
+            "from sol1_monitoring_plugins_lib import MonitoringPlugin, initLoggingArgparse, DEFAULT_LOG_LEVELS\n"
+            "assert 'loguru' not in sys.modules\n"
+            "from sol1_monitoring_plugins_lib import initLogging\n"
+            "initLogging(enable_log_file=False)\n"
+            "plugin = MonitoringPlugin()\n"
+            "plugin.setOk()\n"
+            "assert 'loguru' not in sys.modules\n"
+            "from sol1_monitoring_plugins_lib.logging import logger\n"
+            "logger.warning('dropped')\n"
+            "assert 'loguru' in sys.modules\n")
+    # loguru's default standard error sink is removed when it is imported after initLogging()
+    assert 'dropped' not in run_python(code).stderr
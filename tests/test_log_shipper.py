@@ -0,0 +1,113 @@
+import gzip
+import os
+import threading
+import time
+
+import pytest
+from sol1_monitoring_plugins_lib import initLogging
+from sol1_monitoring_plugins_lib.log_shipper import LogCollector, parsePolicy
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.05)
+    return True
+
+
+@pytest.fixture
+def collector(tmp_path):
+    collector = LogCollector(socket_path=str(tmp_path / 'shipper.sock'), log_file=str(tmp_path / 'check.log'),
+                             log_rotate='200 B', log_retention=1, flush_interval=0.05)
+    thread = threading.Thread(target=collector.serveForever, daemon=True)
+    thread.start()
+    assert wait_for(lambda: (tmp_path / 'shipper.sock').exists())
+    yield collector
+    collector.stop()
+    thread.join()
+    initLogging(enable_log_file=False)
+
+
+def test_parsePolicy():
+    assert parsePolicy('1 day') == ('seconds', 86400)
+    assert parsePolicy('12 hours') == ('seconds', 43200)
+    assert parsePolicy('50 MB') == ('bytes', 50000000)
+    assert parsePolicy(3) == ('count', 3)
+    with pytest.raises(ValueError):
+        parsePolicy('sometimes')
+
+
+def test_shipped_logs_are_written_rotated_and_compressed(collector, tmp_path):
+    from loguru import logger
+    initLogging(log_file=collector.log_file, enable_log_shipper=True, log_shipper_socket=collector.socket_path)
+    for i in range(6):
+        logger.warning(f"shipped warning {i}")
+        # One batch per warning so the 200 byte rotation happens every couple of warnings
+        time.sleep(0.15)
+
+    def shipped():
+        try:
+            text = "".join(gzip.decompress(path.read_bytes()).decode() for path in tmp_path.glob('check.*.log.gz'))
+            return text + (tmp_path / 'check.log').read_text()
+        except (OSError, EOFError):
+            # A file is still being compressed
+            return ""
+
+    # The files were rotated and compressed, older rotated files are removed by the retention policy
+    assert wait_for(lambda: "shipped warning 5" in shipped() and "shipped warning 0" not in shipped())
+    assert len(list(tmp_path.glob('check.*.log.gz'))) == 1
+
+
+def test_falls_back_to_log_file(tmp_path):
+    from loguru import logger
+    log_file = tmp_path / 'check.log'
+    initLogging(log_file=str(log_file), enable_log_shipper=True, log_shipper_socket=str(tmp_path / 'missing.sock'))
+    logger.warning("direct warning")
+    initLogging(enable_log_file=False)
+    text = log_file.read_text()
+    assert "Log collector isn't running" in text
+    assert "direct warning" in text
+
+
+def test_rotations_compress_one_at_a_time(tmp_path, capsys):
+    collector = LogCollector(socket_path=str(tmp_path / 'shipper.sock'), log_file=str(tmp_path / 'check.log'),
+                             log_rotate='1 B', log_retention=2)
+    collector._openLogFile()
+    for i in range(6):
+        collector._writeBatch([f"line {i}\n".encode() * 10000])
+    collector._compress_queue.join()
+    collector._file.close()
+    # Retention only ever removes compressed files, so none of the rotated logs was lost half way through
+    assert "Unable to compress" not in capsys.readouterr().err
+    assert sorted(gzip.decompress(path.read_bytes()).decode()[:6] for path in tmp_path.glob('check.*.log.gz')) == [
+        "line 4", "line 5"]
+    assert list(tmp_path.glob('check.*.log')) == []
+
+
+def test_restarted_collector_keeps_the_rotation_time(tmp_path):
+    log_file = tmp_path / 'check.log'
+    # A file rotated two hours ago, the current file has been written since and has nothing recorded
+    (tmp_path / time.strftime('check.%Y-%m-%d_%H-%M-%S_000000.log.gz', time.localtime(time.time() - 7200))).write_bytes(b"")
+    log_file.write_text("written since\n")
+    collector = LogCollector(socket_path=str(tmp_path / 'shipper.sock'), log_file=str(log_file), log_rotate='1 hour')
+    collector._openLogFile()
+    assert collector._shouldRotate()
+    assert time.time() - collector._file_started == pytest.approx(7200, abs=5)
+    collector._file.close()
+
+    # A new file records when it was started
+    os.remove(log_file)
+    collector._openLogFile()
+    collector._file.close()
+    started = collector._file_started
+    if not hasattr(os.stat_result, 'st_birthtime'):
+        try:
+            os.getxattr(log_file, b"user.loguru_crtime")
+        except (AttributeError, OSError):
+            pytest.skip("The file system has no extended attributes")
+    log_file.write_text("written later\n")
+    collector._openLogFile()
+    collector._file.close()
+    assert collector._file_started == pytest.approx(started, abs=1)
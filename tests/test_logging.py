@@ -31,3 +31,125 @@ def test_initLogging(capfd):
     assert "debug: True" in err
     assert "Log initalized with level: DEBUG" in err
 
+
+
+def test_log_level_flags():
+    from sol1_monitoring_plugins_lib import logging as plugin_logging
+    initLogging(enable_log_file=False, log_level='WARNING')
+    assert plugin_logging.debug_enabled == False
+    assert plugin_logging.info_enabled == False
+
+    initLogging(debug=True, enable_log_file=False, enable_screen_debug=True)
+    assert plugin_logging.debug_enabled == True
+    assert plugin_logging.info_enabled == True
+
+
+def test_log_queue(tmp_path):
+    from loguru import logger
+    from sol1_monitoring_plugins_lib.logging import flushLogging
+    parser = argparse.ArgumentParser()
+    initLoggingArgparse(parser)
+    assert parser.parse_args([]).enable_log_queue == False
+    assert parser.parse_args(['--enable-log-queue']).enable_log_queue == True
+
+    log_file = tmp_path / 'check.log'
+    initLogging(enable_log_file=True, log_file=str(log_file), enable_log_queue=True)
+    logger.warning("queued warning")
+    flushLogging()
+    assert "queued warning" in log_file.read_text()
+    initLogging(enable_log_file=False)
+
+
+def test_background_compression(tmp_path):
+    import gzip
+    import time
+    from sol1_monitoring_plugins_lib.logging import _compressInBackground
+    rotated = tmp_path / 'check.2024-01-01_00-00-00_000000.log'
+    rotated.write_text("rotated log\n")
+    _compressInBackground(str(rotated))
+    compressed = tmp_path / (rotated.name + '.gz')
+    for _ in range(100):
+        if not rotated.exists():
+            break
+        time.sleep(0.05)
+    assert not rotated.exists()
+    assert gzip.decompress(compressed.read_bytes()) == b"rotated log\n"
+
+
+def test_compressed_retention(tmp_path):
+    import datetime
+    import os
+    from sol1_monitoring_plugins_lib.logging import _compressedRetention
+    paths = []
+    for i in range(3):
+        path = tmp_path / f'check.2024-01-0{i + 1}_00-00-00_000000.log.gz'
+        path.write_bytes(b"")
+        os.utime(path, (1000 + i, 1000 + i))
+        paths.append(str(path))
+    # The newest rotated file, its gzip is still running
+    compressing = tmp_path / 'check.2024-01-04_00-00-00_000000.log'
+    compressing.write_text("rotated log\n")
+    _compressedRetention(1)(paths + [str(compressing)])
+    assert sorted(os.listdir(tmp_path)) == [os.path.basename(paths[2]), compressing.name]
+    _compressedRetention(datetime.timedelta(days=1))([paths[2], str(compressing)])
+    assert os.listdir(tmp_path) == [compressing.name]
+    with pytest.raises(ValueError):
+        _compressedRetention('50 MB')
+
+
+def test_log_sampling(tmp_path):
+    from loguru import logger
+    from sol1_monitoring_plugins_lib.logging import flushLogging
+    parser = argparse.ArgumentParser()
+    initLoggingArgparse(parser)
+    args = parser.parse_args(['--log-sample', '10', '--log-first', '3', '--log-rate-limit', '5'])
+    assert (args.log_sample, args.log_first, args.log_rate_limit) == (10, 3, 5.0)
+
+    log_file = tmp_path / 'sample.log'
+    initLogging(debug=True, log_file=str(log_file), log_sample=10)
+    for i in range(100):
+        logger.debug(f"sampled {i}")
+    logger.warning("always logged")
+    flushLogging()
+    text = log_file.read_text()
+    assert [line.split()[-1] for line in text.splitlines() if "sampled" in line] == [str(i) for i in range(0, 100, 10)]
+    assert "always logged" in text
+    assert "Suppressed 90 of 100 debug messages from" in text
+
+    log_file = tmp_path / 'first.log'
+    initLogging(debug=True, log_file=str(log_file), log_first=3, log_rate_limit=1000)
+    for i in range(50):
+        logger.debug(f"first {i}")
+    flushLogging()
+    text = log_file.read_text()
+    assert text.count("first ") == 3
+    assert "Suppressed 47 of 50 debug messages from" in text
+    initLogging(enable_log_file=False)
+
+
+def test_log_rate_limit(tmp_path):
+    from loguru import logger
+    from sol1_monitoring_plugins_lib.logging import flushLogging
+    log_file = tmp_path / 'rate.log'
+    initLogging(debug=True, log_file=str(log_file), log_rate_limit=5)
+    for i in range(1000):
+        logger.debug(f"limited {i}")
+    flushLogging()
+    initLogging(enable_log_file=False)
+    # One second's worth up front, more only as time passes
+    assert 5 <= log_file.read_text().count("limited ") < 10
+
+
+def test_log_rate_limit_below_one_a_second(monkeypatch):
+    from types import SimpleNamespace
+    from sol1_monitoring_plugins_lib import logging as plugin_logging
+    now = [1000.0]
+    monkeypatch.setattr(plugin_logging.time, 'monotonic', lambda: now[0])
+    sampler = plugin_logging._LogSampler(rate_limit=0.5)
+    kept = []
+    for i in range(5):
+        record = {'level': SimpleNamespace(no=10), 'name': 'check', 'function': 'probe', 'line': 1}
+        kept.append(sampler(record))
+        now[0] += 0.6
+    # The first message, then one every two seconds
+    assert kept == [True, False, False, False, True]
@@ -1,5 +1,10 @@
+import argparse
+import json
+import time
+
 import pytest
-from sol1_monitoring_plugins_lib import MonitoringPlugin
+from sol1_monitoring_plugins_lib import MonitoringPlugin, State, initDeadlineArgparse, initOutputArgparse
+from sol1_monitoring_plugins_lib.monitoring_plugins import parsePerformanceData
 
 
 def test_initialization():
@@ -73,3 +78,269 @@ def test_exit_functionality():
     plugin.setMessage("Test Message", plugin.STATE_OK, True, False)
     plugin.setPerformanceData(label='test', value=5)
     assert plugin.exit(do_exit=False) == (0, 'OK: Test check \nOk: Test Message', 'test=5;;;; ')
+
+
+def test_message_and_performance_data_records():
+    plugin = MonitoringPlugin()
+    plugin.message = "Raw "
+    plugin.setMessage("Line\n", plugin.STATE_WARNING)
+    plugin.setMessage("No prefix\n", no_prefix=True)
+    plugin.setPerformanceData(label='a', value=1)
+    plugin.performance_data = "raw=2;;;; "
+    assert plugin.message == "Raw Warning: Line\nNo prefix\n"
+    assert plugin.performance_data == "a=1;;;; raw=2;;;; "
+    assert plugin._message[1].state == plugin.STATE_WARNING
+    assert plugin._performance_data[0].label == 'a'
+    assert dict(plugin)['_message'] == plugin.message
+    assert dict(plugin)['_performance_data'] == plugin.performance_data
+
+
+def test_many_messages_and_performance_data():
+    plugin = MonitoringPlugin()
+    expected_message = ""
+    expected_performance_data = ""
+    for i in range(1000):
+        plugin.setMessage(f"item {i}\n", plugin.STATE_OK)
+        plugin.setPerformanceData(label=f"item_{i}", value=i, unit_of_measurement="B")
+        expected_message += f"Ok: item {i}\n"
+        expected_performance_data += f"item_{i}={i}B;;;; "
+    state, message, performance_data = plugin.exit(do_exit=False)
+    assert message == "UNKNOWN: \n" + expected_message
+    assert performance_data == expected_performance_data
+
+
+def test_performance_data_label_quoting():
+    plugin = MonitoringPlugin()
+    plugin.setPerformanceData(label="disk /var/log", value=5)
+    plugin.setPerformanceData(label="it's", value=1)
+    assert plugin.performance_data == "'disk /var/log'=5;;;; 'it''s'=1;;;; "
+
+    # Labels plugins already quote themselves are left alone
+    plugin = MonitoringPlugin()
+    plugin.setPerformanceData(label="'disk C:'", value=5)
+    plugin.setPerformanceDataBulk(["'disk D:'"], [6])
+    assert plugin.performance_data == "'disk C:'=5;;;; 'disk D:'=6;;;; "
+
+
+def test_performance_data_bulk_matches_per_call():
+    labels = [f"if {i}" for i in range(100)]
+    values = [i * 1.5 for i in range(100)]
+    per_call = MonitoringPlugin()
+    for label, value in zip(labels, values):
+        per_call.setPerformanceData(label, value, "B", warn=80, crit=90, minimum=0)
+
+    for stream in (False, True):
+        plugin = MonitoringPlugin()
+        assert plugin.setPerformanceDataBulk(labels, (value for value in values), "B", warn=80, crit=[90] * 100,
+                                             minimum=0, stream=stream) == 100
+        assert plugin.performance_data == per_call.performance_data
+
+
+def test_performance_data_bulk_validation():
+    plugin = MonitoringPlugin()
+    with pytest.raises(ValueError):
+        plugin.setPerformanceDataBulk(['a', 'b'], [1])
+    with pytest.raises(ValueError):
+        plugin.setPerformanceDataBulk(['a', ''], [1, 2])
+    with pytest.raises(TypeError):
+        plugin.setPerformanceDataBulk('a', [1])
+    assert plugin.performance_data == ""
+
+
+def test_deadline_exits_with_partial_output(capsys):
+    plugin = MonitoringPlugin("Slow")
+    plugin.setDeadline(0.1, state="CRITICAL")
+    cancelled = []
+    plugin.onDeadline(lambda: cancelled.append(True))
+    plugin.setMessage("first probe done\n", plugin.STATE_OK, True)
+    plugin.setPerformanceData(label="first", value=1)
+    assert 0 < plugin.remaining <= 0.1
+    with pytest.raises(SystemExit) as e:
+        time.sleep(5)
+    assert e.value.code == plugin.STATE_CRITICAL
+    assert cancelled == [True]
+    assert plugin.remaining is None
+    output = capsys.readouterr().out
+    assert output.startswith("CRITICAL: Slow check Check timed out after 0.1s\n")
+    assert "Ok: first probe done\n" in output
+    assert output.rstrip("\n").endswith("|first=1;;;; ")
+
+
+def test_deadline_cancelled_on_exit():
+    plugin = MonitoringPlugin()
+    plugin.setDeadline(0.1)
+    plugin.setOk()
+    assert plugin.exit(do_exit=False)[0] == plugin.STATE_OK
+    time.sleep(0.2)
+    assert plugin.remaining is None
+
+
+def test_deadline_argparse():
+    parser = argparse.ArgumentParser()
+    initDeadlineArgparse(parser, timeout=50)
+    args = parser.parse_args(['--timeout-state', 'warning'])
+    assert args.timeout == 50
+    assert args.timeout_state == "WARNING"
+
+
+def test_self_timing():
+    # CPU used before self timing is enabled isn't part of the run
+    start = time.process_time()
+    while time.process_time() - start < 0.3:
+        pass
+    plugin = MonitoringPlugin()
+    plugin.enableSelfTiming()
+
+    @plugin.timeSection("probe")
+    def probe():
+        time.sleep(0.01)
+
+    probe()
+    with plugin.timeSection("probe"):
+        time.sleep(0.01)
+    plugin.setOk()
+    performance_data = plugin.exit(do_exit=False)[2]
+    points = dict(point.split("=", 1) for point in performance_data.split())
+    assert float(points['check_section_probe'].split("s;")[0]) >= 0.02
+    assert float(points['check_time'].split("s;")[0]) >= 0.02
+    assert 'check_cpu_user' in points and 'check_cpu_system' in points
+    assert int(points['check_max_rss'].split("B;")[0]) > 0
+    assert int(points['check_max_rss_growth'].split("B;")[0]) >= 0
+    assert float(points['check_cpu_user'].split("s;")[0]) + float(points['check_cpu_system'].split("s;")[0]) < 0.2
+
+
+def test_self_timing_disabled():
+    plugin = MonitoringPlugin()
+    with plugin.timeSection("probe"):
+        pass
+    assert plugin.exit(do_exit=False)[2] == ""
+
+
+def build_inventory_plugin():
+    plugin = MonitoringPlugin("Inventory")
+    for i in range(1000):
+        plugin.setMessage(f"item {i} ✓\n", plugin.STATE_OK, True)
+    plugin.setPerformanceData(label="items", value=1000)
+    return plugin
+
+
+def test_stream_exit_matches_exit(capsys):
+    with pytest.raises(SystemExit):
+        build_inventory_plugin().exit()
+    expected = capsys.readouterr().out
+    with pytest.raises(SystemExit) as e:
+        build_inventory_plugin().exit(stream=True)
+    assert e.value.code == 0
+    assert capsys.readouterr().out == expected
+
+
+def test_exit_max_bytes(capsys):
+    full = build_inventory_plugin().exit(do_exit=False)[1]
+    for max_bytes in (100, 1001, 4096):
+        for stream in (False, True):
+            with pytest.raises(SystemExit):
+                build_inventory_plugin().exit(stream=stream, max_bytes=max_bytes)
+            output = capsys.readouterr().out
+            assert len(output.rstrip("\n").encode('utf-8')) <= max_bytes
+            message, performance_data = output.rstrip("\n").rsplit("|", 1)
+            assert performance_data == "items=1000;;;; "
+            assert message.endswith("\n... output truncated\n")
+            assert full.startswith(message[:-len("\n... output truncated\n")])
+
+    # The state line is always kept, whole perfdata points are dropped if they still don't fit
+    for max_bytes in (20, 40):
+        plugin = build_inventory_plugin()
+        plugin.setPerformanceData(label="x" * 50, value=1)
+        state, message, performance_data = plugin.exit(do_exit=False, max_bytes=max_bytes)
+        assert message == "OK: Inventory check \n"
+        assert performance_data == ("items=1000;;;; " if max_bytes == 40 else "")
+
+    # Output that fits isn't changed
+    state, message, performance_data = build_inventory_plugin().exit(do_exit=False, max_bytes=len(full.encode()) + 16)
+    assert message == full
+
+
+def test_state_enum():
+    plugin = MonitoringPlugin()
+    assert plugin.STATE_WARNING is State.WARNING
+    assert MonitoringPlugin.STATE_CRITICAL == 2
+    assert f"{State.CRITICAL}" == "2"
+    assert State.WARNING.label == "WARNING"
+    assert State.WARNING.prefix == "Warning: "
+    assert plugin.getStateLabel(1) == "WARNING"
+    assert plugin.getStateLabel(7) == "INVALID (7)"
+    assert plugin.getStateLabel(-1) == "INVALID (-1)"
+
+
+def test_setState_rules():
+    rules = {
+        0: lambda current: 0 if current == 3 else current,
+        1: lambda current: current if current == 2 else 1,
+        2: lambda current: 2,
+        3: lambda current: current,
+    }
+    for requested, rule in rules.items():
+        for current in range(4):
+            plugin = MonitoringPlugin()
+            plugin.state = current
+            assert plugin.setState(requested) == rule(current)
+            assert plugin.state == rule(current)
+    plugin = MonitoringPlugin()
+    assert plugin.setState(9) == plugin.STATE_UNKNOWN
+
+
+def test_slots_and_iteration():
+    plugin = MonitoringPlugin("Example")
+    assert not hasattr(plugin, '__dict__')
+    with pytest.raises(AttributeError):
+        plugin.anything = 1
+    assert list(dict(plugin)) == ['STATE_OK', 'STATE_WARNING', 'STATE_CRITICAL', 'STATE_UNKNOWN', '_current_state',
+                                  '_message', '_performance_data', '_type', '_success_summary', '_failure_summary']
+
+    class ChildPlugin(MonitoringPlugin):
+        def __init__(self):
+            super().__init__()
+            self.extra = 1
+
+    assert dict(ChildPlugin())['extra'] == 1
+
+
+def test_json_result(capsys):
+    plugin = MonitoringPlugin("Disk")
+    plugin.setMessage("/ is fine\n", plugin.STATE_OK, True)
+    plugin.setMessage("/var is nearly full\n", plugin.STATE_WARNING, True)
+    plugin.failure_summary = "/var 91% used"
+    plugin.setPerformanceData("/var used", 91.5, "%", warn="90", crit="95:", minimum=0, maximum=100)
+    plugin.setPerformanceDataBulk(["a", "b"], [1, 2], stream=True)
+    result = json.loads(plugin.exit(do_exit=False, output_format='json'))
+    assert result['state'] == 1
+    assert result['label'] == "WARNING"
+    assert result['summary'] == "/var 91% used"
+    assert result['message'][1] == {'text': "/var is nearly full\n", 'state': 1, 'prefix': "Warning: "}
+    assert result['performance_data'] == [
+        {'label': "/var used", 'value': 91.5, 'uom': "%", 'warn': 90, 'crit': "95:", 'min': 0, 'max': 100},
+        {'label': "a", 'value': 1, 'uom': "", 'warn': None, 'crit': None, 'min': None, 'max': None},
+        {'label': "b", 'value': 2, 'uom': "", 'warn': None, 'crit': None, 'min': None, 'max': None}]
+
+    with pytest.raises(SystemExit) as e:
+        plugin.exit(output_format='json')
+    assert e.value.code == 1
+    assert json.loads(capsys.readouterr().out) == result
+    with pytest.raises(ValueError):
+        plugin.exit(do_exit=False, output_format='xml')
+
+
+def test_parsePerformanceData():
+    plugin = MonitoringPlugin()
+    plugin.setPerformanceData("it's = odd", "U")
+    plugin.setPerformanceData("time", 0.25, "s", minimum=0)
+    assert parsePerformanceData("|" + plugin.performance_data) == [
+        {'label': "it's = odd", 'value': "U", 'uom': "", 'warn': None, 'crit': None, 'min': None, 'max': None},
+        {'label': "time", 'value': 0.25, 'uom': "s", 'warn': None, 'crit': None, 'min': 0, 'max': None}]
+
+
+def test_initOutputArgparse():
+    parser = argparse.ArgumentParser()
+    initOutputArgparse(parser)
+    assert parser.parse_args([]).output_format == 'text'
+    assert parser.parse_args(['--output-format', 'JSON']).output_format == 'json'
@@ -0,0 +1,79 @@
+import time
+
+import pytest
+from sol1_monitoring_plugins_lib import MonitoringPlugin
+from sol1_monitoring_plugins_lib.runner import runChecks
+
+
+def check_ok(plugin):
+    plugin.setMessage("disk ok\n", plugin.STATE_OK, True)
+    plugin.setPerformanceData(label='disk', value=10, unit_of_measurement='%')
+    plugin.success_summary = "disk ok"
+
+
+def check_warning(plugin):
+    plugin.setMessage("load high\n", plugin.STATE_WARNING, True)
+    plugin.setPerformanceData(label='load', value=5)
+    plugin.failure_summary = "load high"
+
+
+def check_slow(plugin):
+    time.sleep(5)
+    plugin.setOk()
+
+
+def check_raises(plugin):
+    raise RuntimeError("probe failed")
+
+
+@pytest.mark.parametrize('executor', ['thread', 'process'])
+def test_merge_matches_sequential(executor):
+    sequential = MonitoringPlugin("Multi")
+    check_ok(sequential)
+    check_warning(sequential)
+
+    plugin = MonitoringPlugin("Multi")
+    assert runChecks(plugin, [check_ok, check_warning], executor=executor) == plugin.STATE_WARNING
+    assert plugin.exit(do_exit=False) == sequential.exit(do_exit=False)
+
+
+@pytest.mark.parametrize('executor', ['thread', 'process'])
+def test_timeout_state(executor):
+    plugin = MonitoringPlugin()
+    start = time.monotonic()
+    runChecks(plugin, {'ok': check_ok, 'slow': check_slow}, executor=executor, timeout=0.2)
+    assert time.monotonic() - start < 2
+    assert plugin.state == plugin.STATE_UNKNOWN
+    assert "Unknown: slow timed out after 0.2s" in plugin.message
+    assert plugin.failure_summary == ["slow timed out after 0.2s"]
+
+    plugin = MonitoringPlugin()
+    runChecks(plugin, {'slow': check_slow}, timeout={'slow': 0.1}, timeout_state=plugin.STATE_CRITICAL)
+    assert plugin.state == plugin.STATE_CRITICAL
+
+
+def check_short(plugin):
+    time.sleep(0.15)
+    plugin.setOk()
+
+
+@pytest.mark.parametrize('executor', ['thread', 'process'])
+def test_timeout_starts_with_each_sub_check(executor):
+    # Each sub-check waits for the one worker, only the time it runs counts
+    plugin = MonitoringPlugin()
+    checks = {f"short {i}": check_short for i in range(4)}
+    assert runChecks(plugin, checks, executor=executor, max_workers=1, timeout=0.4) == plugin.STATE_OK
+
+    # A sub-check that can't start because the worker is held by a hung one isn't reported as timed out
+    plugin = MonitoringPlugin()
+    start = time.monotonic()
+    runChecks(plugin, {'slow': check_slow, 'ok': check_ok}, executor=executor, max_workers=1, timeout=0.2)
+    assert time.monotonic() - start < 2
+    assert plugin.failure_summary == ["slow timed out after 0.2s", "ok didn't start, no worker was free"]
+
+
+def test_errors_keep_worse_state():
+    plugin = MonitoringPlugin()
+    runChecks(plugin, [check_warning, check_raises])
+    assert plugin.state == plugin.STATE_WARNING
+    assert "check_raises raised RuntimeError: probe failed" in plugin.message
@@ -0,0 +1,60 @@
+import pytest
+from sol1_monitoring_plugins_lib import MonitoringPlugin
+from sol1_monitoring_plugins_lib.thresholds import ThresholdRange, Thresholds
+
+
+@pytest.mark.parametrize('spec, alerts, no_alerts', [
+    ('10', [-1, 11], [0, 5, 10]),
+    ('10:', [9.9, -5], [10, 1000]),
+    ('~:10', [10.1], [-1000, 10]),
+    ('10:20', [9, 21], [10, 15, 20]),
+    ('@10:20', [10, 15, 20], [9, 21]),
+    (5, [6, -1], [0, 5]),
+])
+def test_range(spec, alerts, no_alerts):
+    threshold = ThresholdRange(spec)
+    assert str(threshold) == str(spec)
+    assert all(threshold.alert(value) for value in alerts)
+    assert not any(threshold.alert(value) for value in no_alerts)
+    assert list(threshold.alerts(alerts + no_alerts)) == [True] * len(alerts) + [False] * len(no_alerts)
+
+
+@pytest.mark.parametrize('spec', ['abc', '20:10', '@', '1:2:3'])
+def test_invalid_range(spec):
+    with pytest.raises(ValueError):
+        ThresholdRange(spec)
+
+
+def test_states():
+    thresholds = Thresholds(warn='80', crit='90')
+    assert thresholds.getState(50) == 0
+    assert thresholds.getState(85) == 1
+    assert thresholds.getState(95) == 2
+    assert list(thresholds.getStates([50, 85, 95])) == [0, 1, 2]
+    assert thresholds.getWorstState(value for value in [50, 85]) == 1
+    assert list(Thresholds(crit='~:0').getStates([1, -1])) == [2, 0]
+
+
+def test_check_updates_plugin():
+    plugin = MonitoringPlugin()
+    assert Thresholds(warn='80', crit='@90:100').check(plugin, 'disk', 85, '%', minimum=0, maximum=100,
+                                                       msg="Disk is 85% full\n") == 1
+    assert plugin.state == plugin.STATE_WARNING
+    assert plugin.message == "Warning: Disk is 85% full\n"
+    assert plugin.performance_data == "disk=85%;80;@90:100;0;100 "
+
+    Thresholds(warn='80', crit='90').checkAll(plugin, [10, 95])
+    assert plugin.state == plugin.STATE_CRITICAL
+
+
+def test_numpy_states():
+    numpy = pytest.importorskip('numpy')
+    values = numpy.array([50, 85, 95, 10])
+    states = Thresholds(warn='80', crit='90').getStates(values)
+    assert isinstance(states, numpy.ndarray)
+    assert states.tolist() == [0, 1, 2, 0]
+    assert ThresholdRange('@10:20').alerts(values).tolist() == [False, False, False, True]
+    # Generators work the same once numpy is imported
+    assert Thresholds(warn='80', crit='90').getStates(value for value in [50, 85, 95, 10]).tolist() == [0, 1, 2, 0]
+    assert ThresholdRange('10').alerts(iter([5, 15])).tolist() == [False, True]
+    assert Thresholds(warn='80').getWorstState(value for value in [50, 85]) == 1